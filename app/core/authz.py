@@ -0,0 +1,84 @@
+# app/core/authz.py
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.deps import get_db
+from app.core.principal import Principal
+from app.core.security import get_current_principal
+from app.models import Ativo
+
+
+class Autorizacao:
+    """
+    Autorização da requisição atual. O FastAPI resolve a dependência uma vez
+    por requisição, então a empresa de cada ativo consultado fica memorizada
+    e checagens repetidas não voltam ao banco.
+    """
+
+    def __init__(self, principal: Principal, db: Session):
+        self.principal = principal
+        self.db = db
+        self._empresa_do_ativo: Dict[int, Optional[int]] = {}
+
+    @property
+    def user_id(self) -> int:
+        return self.principal.id
+
+    @property
+    def empresa_ids(self):
+        return self.principal.empresa_ids
+
+    # ----------------------------------------
+    # Empresas
+    # ----------------------------------------
+    def pode_empresa(self, empresa_id: Optional[int]) -> bool:
+        return self.principal.pode_acessar(empresa_id)
+
+    def exigir_empresa(self, empresa_id: Optional[int], detalhe: str = "Acesso negado"):
+        if not self.pode_empresa(empresa_id):
+            raise HTTPException(403, detalhe)
+
+    # ----------------------------------------
+    # Ativos
+    # ----------------------------------------
+    def obter_ativo(self, ativo_id: int) -> Optional[Ativo]:
+        """Carrega o ativo uma vez e já memoriza a empresa dele para as checagens."""
+        ativo = self.db.get(Ativo, ativo_id)
+        self._empresa_do_ativo[ativo_id] = ativo.empresa_id if ativo else None
+        return ativo
+
+    def _carregar_empresas(self, ativos_ids: Iterable[int]):
+        faltando = {a for a in ativos_ids if a not in self._empresa_do_ativo}
+        if not faltando:
+            return
+        encontrados = dict(
+            self.db.execute(
+                select(Ativo.id, Ativo.empresa_id).where(Ativo.id.in_(faltando))
+            ).all()
+        )
+        for ativo_id in faltando:
+            self._empresa_do_ativo[ativo_id] = encontrados.get(ativo_id)
+
+    def pode_ativo(self, ativo_id: int) -> bool:
+        self._carregar_empresas((ativo_id,))
+        return self.pode_empresa(self._empresa_do_ativo[ativo_id])
+
+    def exigir_ativo(self, ativo_id: int, detalhe: str = "Acesso negado ao ativo"):
+        if not self.pode_ativo(ativo_id):
+            raise HTTPException(403, detalhe)
+
+    def ativos_visiveis(self, ativos_ids: Iterable[int]) -> Set[int]:
+        """Quais destes ativos o usuário pode ver — uma consulta para o lote todo."""
+        ativos_ids = set(ativos_ids)
+        self._carregar_empresas(ativos_ids)
+        return {a for a in ativos_ids if self.pode_empresa(self._empresa_do_ativo[a])}
+
+
+def get_autorizacao(
+    principal: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+) -> Autorizacao:
+    return Autorizacao(principal, db)
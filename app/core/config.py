@@ -1,4 +1,6 @@
 # app/core/config.py
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,9 +9,102 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Pools de conexões da API, por processo. O engine sync (rotas síncronas)
+    # e o async (rotas async / proxies da Nibo) têm pools separados: o teto
+    # de conexões do processo é a soma dos dois (size + overflow de cada)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_ASYNC_POOL_SIZE: int = 3
+    DB_ASYNC_MAX_OVERFLOW: int = 2
+    DB_POOL_TIMEOUT: float = 30.0           # espera máxima por uma conexão livre
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800             # segundos; antes do timeout de ociosidade do servidor
+    DB_STATEMENT_TIMEOUT_MS: int = 30000    # 0 = sem limite
+
+    # Pools dos processos de background (worker / scheduler): o sync só
+    # atende a fila de jobs; o sync com a Nibo roda no async
+    DB_WORKER_POOL_SIZE: int = 2
+    DB_WORKER_MAX_OVERFLOW: int = 1
+    DB_WORKER_ASYNC_POOL_SIZE: int = 5
+    DB_WORKER_ASYNC_MAX_OVERFLOW: int = 5
+    DB_WORKER_STATEMENT_TIMEOUT_MS: int = 600000
+
+    # Cache do usuário autenticado (evita SELECT por requisição)
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 30.0
+    PRINCIPAL_CACHE_CHECK_SECONDS: float = 2.0   # checagem da versão global (outros processos)
+    PRINCIPAL_CACHE_MAX_ITENS: int = 10000
+
+    # Hash de senhas (bcrypt) em pool próprio
+    BCRYPT_ROUNDS: int = 12                 # hashes com outro custo são refeitos no login
+    SENHA_POOL_WORKERS: int = 2
+    SENHA_POOL_MAX_FILA: int = 64           # acima disso responde 503 em vez de enfileirar
+
+    # Limite de tentativas de login (janela deslizante por email e por IP)
+    RATE_LIMIT_BACKEND: str = "memoria"     # "memoria" | "redis" (usa REDIS_URL, vale entre workers)
+    RATE_LIMIT_MAX_CHAVES: int = 100000     # LRU do backend em memória
+    LOGIN_JANELA_SECONDS: int = 300
+    LOGIN_MAX_FALHAS_EMAIL: int = 5
+    LOGIN_MAX_FALHAS_IP: int = 20
+    # limite por IP é opt-in: atrás de proxy reverso só faz sentido com
+    # TRUSTED_PROXIES configurado (senão todo mundo tem o IP do proxy)
+    LOGIN_LIMITE_POR_IP: bool = False
+    TRUSTED_PROXIES: str = ""               # IPs/CIDRs separados por vírgula; só deles vale o X-Forwarded-For
+
     # Nibo base (token por empresa é armazenado no DB)
     NIBO_API_BASE: str = "https://api.nibo.com.br"
 
+    # Cliente HTTP compartilhado da Nibo (um por processo)
+    NIBO_HTTP_MAX_CONNECTIONS: int = 20
+    NIBO_HTTP_MAX_KEEPALIVE: int = 10
+    NIBO_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    NIBO_HTTP2: bool = False  # requer o pacote "h2" instalado
+    NIBO_HTTP_TIMEOUT: float = 30.0
+    NIBO_HTTP_CONNECT_TIMEOUT: float = 10.0
+
+    # Paginação concorrente (receipts/payments)
+    NIBO_PAGE_FANOUT: int = 4                 # janelas de $skip buscadas em paralelo
+    NIBO_MAX_CONCURRENCY_PER_TOKEN: int = 4   # requisições simultâneas por token
+    NIBO_IMPORT_QUEUE_PAGES: int = 4          # páginas normalizadas aguardando gravação (importação)
+
+    # Resiliência (retry + limite de taxa por token)
+    NIBO_RETRY_MAX_ATTEMPTS: int = 5          # tentativas por requisição (429, 5xx, erro de rede)
+    NIBO_RETRY_BACKOFF_BASE: float = 0.5      # segundos; dobra a cada tentativa (com jitter)
+    NIBO_RETRY_BACKOFF_MAX: float = 30.0      # teto da espera entre tentativas
+    NIBO_RATE_LIMIT_PER_SECOND: float = 5.0   # requisições/s por token (token bucket)
+    NIBO_RATE_LIMIT_BURST: int = 10           # rajada máxima por token
+
+    # Sync incremental (refresh)
+    NIBO_SYNC_LOOKBACK_DAYS: int = 30          # margem para lançamentos retroativos
+    NIBO_FULL_SYNC_INTERVAL_HOURS: int = 168   # reconciliação completa periódica (7 dias)
+
+    # Fila de jobs da Nibo (python -m app.worker)
+    JOB_POLL_SECONDS: float = 2.0             # espera do worker quando a fila está vazia
+    JOB_MAX_TENTATIVAS: int = 3               # falhas transitórias da Nibo são repetidas
+    JOB_RETRY_BACKOFF_SECONDS: float = 60.0   # espera base entre tentativas (dobra a cada uma)
+    JOB_STALE_SECONDS: int = 900              # job "executando" sem heartbeat é retomado
+    JOB_HEARTBEAT_SECONDS: float = 30.0       # heartbeat do job em execução (bem abaixo de JOB_STALE_SECONDS)
+    JOB_PROGRESSO_INTERVALO: float = 1.0      # intervalo mínimo entre gravações de progresso
+
+    # Refresh agendado de todas as empresas (python -m app.scheduler)
+    SCHEDULER_INTERVALO_MINUTOS: int = 60     # intervalo entre ciclos
+    SCHEDULER_IDADE_MINIMA_MINUTOS: int = 30  # empresas sincronizadas há menos que isso ficam de fora
+    SCHEDULER_MAX_CONCORRENCIA: int = 4       # refreshes simultâneos no ciclo
+    SCHEDULER_MAX_POR_TOKEN: int = 1          # refreshes simultâneos com o mesmo token Nibo
+    SCHEDULER_STAGGER_SECONDS: float = 5.0    # espaçamento entre os inícios (com jitter)
+
+    # Cache de respostas das rotas de dashboard
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = "memoria"   # "memoria" | "redis" (requer o pacote "redis")
+    RESPONSE_CACHE_TTL_SECONDS: int = 300
+    RESPONSE_CACHE_MAX_ITENS: int = 1000      # LRU do backend em memória
+    REDIS_URL: Optional[str] = None
+
+    # Série de CDI por ativo: "simples" (juros sobre valor_compra) ou "composto"
+    CDI_MODO_ACUMULACAO: str = "simples"
+
+    # Cache de CDI em memória: intervalo entre checagens de versão no banco
+    CDI_CACHE_CHECK_SECONDS: float = 5.0
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
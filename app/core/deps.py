@@ -1,4 +1,4 @@
-from app.database import SessionLocal
+from app.database import SessionLocal, AsyncSessionLocal
 from sqlalchemy.orm import Session
 
 def get_db():
@@ -7,3 +7,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Sessão async, para rotas `async def` (não bloqueia o event loop)."""
+    async with AsyncSessionLocal() as db:
+        yield db
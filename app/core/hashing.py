@@ -0,0 +1,109 @@
+# app/core/hashing.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.core.config import settings
+
+
+# min = max = default: hash com custo diferente do configurado "precisa de
+# update" e é refeito de forma transparente no próximo login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+class PoolSenhas:
+    """
+    Pool dedicado e limitado para o bcrypt (~250ms de CPU por chamada).
+
+    Fica fora do threadpool das rotas síncronas: um pico de logins disputa
+    só estes SENHA_POOL_WORKERS threads (o bcrypt libera o GIL). Com mais de
+    SENHA_POOL_MAX_FILA aguardando, responde 503 em vez de acumular fila.
+    """
+
+    def __init__(self, workers: int, max_fila: int):
+        self.workers = workers
+        self.max_fila = max_fila
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="senhas")
+        self._lock = threading.Lock()
+        self._pendentes = 0        # na fila + executando
+        self._executando = 0
+        self._concluidas = 0
+        self._rejeitadas = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._execucao_total = 0.0
+
+    def _executar(self, fn, args, enfileirado_em: float):
+        inicio = time.monotonic()
+        with self._lock:
+            self._executando += 1
+            espera = inicio - enfileirado_em
+            self._espera_total += espera
+            self._espera_max = max(self._espera_max, espera)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._executando -= 1
+                self._concluidas += 1
+                self._execucao_total += time.monotonic() - inicio
+
+    def _liberar(self, _future):
+        # também roda se a tarefa for cancelada antes de começar
+        with self._lock:
+            self._pendentes -= 1
+
+    async def rodar(self, fn, *args):
+        with self._lock:
+            if self._pendentes >= self.workers + self.max_fila:
+                self._rejeitadas += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Servidor ocupado. Tente novamente em instantes.",
+                    headers={"Retry-After": "1"},
+                )
+            self._pendentes += 1
+
+        future = self._executor.submit(self._executar, fn, args, time.monotonic())
+        future.add_done_callback(self._liberar)
+        return await asyncio.wrap_future(future)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_fila": self.max_fila,
+                "executando": self._executando,
+                "na_fila": self._pendentes - self._executando,
+                "concluidas": self._concluidas,
+                "rejeitadas": self._rejeitadas,
+                "espera_media_ms": round(self._espera_total / self._concluidas * 1000, 1) if self._concluidas else 0.0,
+                "espera_max_ms": round(self._espera_max * 1000, 1),
+                "execucao_media_ms": round(self._execucao_total / self._concluidas * 1000, 1) if self._concluidas else 0.0,
+            }
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool_senhas = PoolSenhas(settings.SENHA_POOL_WORKERS, settings.SENHA_POOL_MAX_FILA)
+
+
+async def hash_senha(senha: str) -> str:
+    return await pool_senhas.rodar(pwd_context.hash, senha)
+
+
+async def verificar_senha(senha: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """(senha confere, novo hash se o atual usa outro custo e deve ser regravado)."""
+    return await pool_senhas.rodar(pwd_context.verify_and_update, senha, hashed)
@@ -0,0 +1,112 @@
+# app/core/principal.py
+import threading
+import time
+from collections import OrderedDict
+from typing import FrozenSet, NamedTuple, Optional
+
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import User, UserEmpresa
+from app.services.cache_versao_service import ler_versao, incrementar_versao
+
+
+CHAVE_VERSAO = "principais"
+
+
+class Principal(NamedTuple):
+    """Identidade autenticada: o necessário para autorizar sem ir ao banco."""
+    id: int
+    is_active: bool
+    role: str
+    empresa_ids: FrozenSet[int]
+
+    def pode_acessar(self, empresa_id: Optional[int]) -> bool:
+        return empresa_id in self.empresa_ids
+
+
+class PrincipalCache:
+    """
+    Cache por processo dos principals (usuário + empresas vinculadas).
+
+    Cada entrada vale PRINCIPAL_CACHE_TTL_SECONDS. Além disso, no máximo a cada
+    PRINCIPAL_CACHE_CHECK_SECONDS compara a versão de cache_versoes["principais"]
+    (uma consulta por PK para o processo todo, não por requisição): se outro
+    processo alterou usuários ou vínculos, o cache local é descartado.
+    """
+
+    def __init__(self, ttl: float, intervalo_verificacao: float, max_itens: int):
+        self._ttl = ttl
+        self._intervalo = intervalo_verificacao
+        self._max_itens = max_itens
+        self._lock = threading.Lock()
+        self._itens: "OrderedDict[int, tuple[float, Principal]]" = OrderedDict()
+        self._versao: Optional[int] = None
+        self._verificado_em = 0.0
+
+    def _verificar_versao(self, db: Session):
+        if time.monotonic() - self._verificado_em < self._intervalo:
+            return
+        versao = ler_versao(db, CHAVE_VERSAO)
+        with self._lock:
+            if versao != self._versao:
+                self._itens.clear()
+                self._versao = versao
+            self._verificado_em = time.monotonic()
+
+    def _carregar(self, db: Session, user_id: int) -> Optional[Principal]:
+        user = db.execute(
+            select(User.id, User.is_active, User.role).where(User.id == user_id)
+        ).first()
+        if user is None:
+            return None
+        empresa_ids = db.scalars(
+            select(UserEmpresa.empresa_id).where(UserEmpresa.user_id == user_id)
+        ).all()
+        return Principal(user.id, bool(user.is_active), user.role or "user", frozenset(empresa_ids))
+
+    def obter(self, db: Session, user_id: int) -> Optional[Principal]:
+        self._verificar_versao(db)
+
+        agora = time.monotonic()
+        with self._lock:
+            item = self._itens.get(user_id)
+            if item is not None and item[0] > agora:
+                self._itens.move_to_end(user_id)
+                return item[1]
+
+        principal = self._carregar(db, user_id)
+        if principal is None:
+            return None
+
+        with self._lock:
+            self._itens[user_id] = (agora + self._ttl, principal)
+            self._itens.move_to_end(user_id)
+            while len(self._itens) > self._max_itens:
+                self._itens.popitem(last=False)
+        return principal
+
+    def invalidar(self, db: Session, *user_ids: int):
+        """
+        Usuário alterado/desativado ou vínculo user–empresa alterado.
+        Incrementa a versão (na transação do chamador) e descarta o local,
+        de novo após o commit.
+        """
+        incrementar_versao(db, CHAVE_VERSAO)
+        self.descartar(*user_ids)
+        event.listen(db, "after_commit", lambda session: self.descartar(*user_ids), once=True)
+
+    def descartar(self, *user_ids: int):
+        with self._lock:
+            if not user_ids:
+                self._itens.clear()
+            for user_id in user_ids:
+                self._itens.pop(user_id, None)
+
+
+principal_cache = PrincipalCache(
+    settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    settings.PRINCIPAL_CACHE_CHECK_SECONDS,
+    settings.PRINCIPAL_CACHE_MAX_ITENS,
+)
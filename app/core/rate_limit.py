@@ -0,0 +1,239 @@
+# app/core/rate_limit.py
+"""
+Limite de tentativas com janela deslizante aproximada: contador da janela
+atual + contador da anterior ponderado pelo quanto dela ainda cabe na
+janela. Duas contagens por chave, memória fixa por chave.
+
+O backend em memória é por processo e tem tamanho máximo (LRU + expiração);
+com RATE_LIMIT_BACKEND=redis os limites valem entre todos os workers.
+"""
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from fastapi import Request
+
+from app.core.config import settings
+
+
+def _janela_atual(janela: int, agora: float) -> Tuple[int, float]:
+    """(índice da janela fixa atual, fração da janela anterior ainda dentro da deslizante)"""
+    indice = int(agora // janela)
+    decorrido = (agora - indice * janela) / janela
+    return indice, 1.0 - decorrido
+
+
+# ----------------------------------------
+# Backends
+# ----------------------------------------
+class MemoriaBackend:
+    """
+    Contadores por processo. Chaves abaixo do limite ficam num LRU de no
+    máximo `max_chaves`; chaves que atingiram o limite saem do LRU e só
+    somem ao expirar (ou em `limpar`). Assim uma enxurrada de chaves novas
+    não despeja o contador de quem está bloqueado. As bloqueadas custam
+    `limite` falhas cada e expiram em duas janelas, então também são limitadas.
+    """
+
+    def __init__(self, max_chaves: int):
+        self.max_chaves = max_chaves
+        self._lock = threading.Lock()
+        # chave -> (janela em segundos, índice, contagem atual, contagem anterior)
+        self._itens: "OrderedDict[str, Tuple[int, int, int, int]]" = OrderedDict()
+        self._bloqueadas: "OrderedDict[str, Tuple[int, int, int, int]]" = OrderedDict()
+
+    @staticmethod
+    def _avancar(item: Tuple[int, int, int, int], indice: int) -> Tuple[int, int]:
+        _, idx, atual, anterior = item
+        if idx == indice:
+            return atual, anterior
+        if idx == indice - 1:
+            return 0, atual
+        return 0, 0
+
+    def _expirado(self, item: Tuple[int, int, int, int], agora: float) -> bool:
+        janela, idx = item[0], item[1]
+        return (idx + 2) * janela <= agora
+
+    def _remover_expiradas(self, itens: "OrderedDict[str, Tuple[int, int, int, int]]", agora: float):
+        # ordem de última atualização: as expiradas estão no começo
+        while itens:
+            mais_antiga = next(iter(itens.values()))
+            if not self._expirado(mais_antiga, agora):
+                break
+            itens.popitem(last=False)
+
+    def contar(self, chave: str, janela: int) -> float:
+        agora = time.time()
+        indice, peso = _janela_atual(janela, agora)
+        with self._lock:
+            itens = self._bloqueadas if chave in self._bloqueadas else self._itens
+            item = itens.get(chave)
+            if item is None:
+                return 0.0
+            if self._expirado(item, agora):
+                del itens[chave]
+                return 0.0
+            atual, anterior = self._avancar(item, indice)
+        return atual + anterior * peso
+
+    def incrementar(self, chave: str, janela: int, limite: int):
+        agora = time.time()
+        indice, peso = _janela_atual(janela, agora)
+        with self._lock:
+            item = self._itens.pop(chave, None) or self._bloqueadas.pop(chave, None)
+            atual, anterior = self._avancar(item, indice) if item else (0, 0)
+            atual += 1
+            destino = self._bloqueadas if atual + anterior * peso >= limite else self._itens
+            destino[chave] = (janela, indice, atual, anterior)
+
+            # expiradas saem primeiro; o LRU garante o teto das não bloqueadas
+            self._remover_expiradas(self._bloqueadas, agora)
+            self._remover_expiradas(self._itens, agora)
+            while len(self._itens) > self.max_chaves:
+                self._itens.popitem(last=False)
+
+    def limpar(self, chave: str, janela: int):
+        with self._lock:
+            self._itens.pop(chave, None)
+            self._bloqueadas.pop(chave, None)
+
+
+class RedisBackend:
+    """
+    Um contador por (chave, janela fixa), expirando sozinho após duas janelas.
+    Erros do Redis liberam a tentativa (nunca derrubam o login).
+    """
+
+    def __init__(self, cliente, prefixo: str = "rl:"):
+        self.cliente = cliente
+        self.prefixo = prefixo
+
+    def _chaves(self, chave: str, indice: int) -> Tuple[str, str]:
+        return f"{self.prefixo}{chave}:{indice}", f"{self.prefixo}{chave}:{indice - 1}"
+
+    def contar(self, chave: str, janela: int) -> float:
+        indice, peso = _janela_atual(janela, time.time())
+        try:
+            atual, anterior = self.cliente.mget(self._chaves(chave, indice))
+        except Exception as e:
+            print(f"⚠️ Redis indisponível (rate limit): {e}")
+            return 0.0
+        return int(atual or 0) + int(anterior or 0) * peso
+
+    def incrementar(self, chave: str, janela: int, limite: int):
+        indice, _ = _janela_atual(janela, time.time())
+        atual, _ = self._chaves(chave, indice)
+        try:
+            pipe = self.cliente.pipeline()
+            pipe.incr(atual)
+            pipe.expire(atual, janela * 2)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Redis indisponível (rate limit): {e}")
+
+    def limpar(self, chave: str, janela: int):
+        indice, _ = _janela_atual(janela, time.time())
+        try:
+            self.cliente.delete(*self._chaves(chave, indice))
+        except Exception as e:
+            print(f"⚠️ Redis indisponível (rate limit): {e}")
+
+
+def criar_backend():
+    memoria = MemoriaBackend(settings.RATE_LIMIT_MAX_CHAVES)
+    if settings.RATE_LIMIT_BACKEND != "redis":
+        return memoria
+
+    if not settings.REDIS_URL:
+        print("⚠️ RATE_LIMIT_BACKEND=redis sem REDIS_URL; usando limites em memória")
+        return memoria
+    try:
+        import redis  # opcional
+    except ImportError:
+        print("⚠️ Pacote 'redis' não instalado; usando limites em memória")
+        return memoria
+    return RedisBackend(redis.Redis.from_url(settings.REDIS_URL))
+
+
+# ----------------------------------------
+# Limites
+# ----------------------------------------
+class JanelaDeslizante:
+    """No máximo `limite` eventos por chave em qualquer intervalo de `janela` segundos."""
+
+    def __init__(self, backend, prefixo: str, limite: int, janela: int):
+        self.backend = backend
+        self.prefixo = prefixo
+        self.limite = limite
+        self.janela = janela
+
+    def excedido(self, chave: str) -> bool:
+        return self.backend.contar(self.prefixo + chave, self.janela) >= self.limite
+
+    def registrar(self, chave: str):
+        self.backend.incrementar(self.prefixo + chave, self.janela, self.limite)
+
+    def limpar(self, chave: str):
+        self.backend.limpar(self.prefixo + chave, self.janela)
+
+
+_backend = criar_backend()
+
+# falhas de login por email (alvo) e por IP (origem, pega stuffing com emails
+# aleatórios). O limite por IP só existe com LOGIN_LIMITE_POR_IP.
+login_por_email = JanelaDeslizante(
+    _backend, "login:email:", settings.LOGIN_MAX_FALHAS_EMAIL, settings.LOGIN_JANELA_SECONDS
+)
+login_por_ip: Optional[JanelaDeslizante] = (
+    JanelaDeslizante(_backend, "login:ip:", settings.LOGIN_MAX_FALHAS_IP, settings.LOGIN_JANELA_SECONDS)
+    if settings.LOGIN_LIMITE_POR_IP
+    else None
+)
+
+
+# ----------------------------------------
+# IP do cliente
+# ----------------------------------------
+Rede = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+def redes_confiaveis(valor: str) -> List[Rede]:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in valor.split(",") if item.strip()]
+
+
+def _confiavel(ip: str, redes: List[Rede]) -> bool:
+    try:
+        endereco = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(endereco in rede for rede in redes)
+
+
+def resolver_ip(peer: Optional[str], x_forwarded_for: Optional[str], redes: List[Rede]) -> str:
+    """
+    IP de origem da requisição. Se o peer não é um proxy confiável, é ele.
+    Se é, o X-Forwarded-For é lido da direita para a esquerda pulando os
+    proxies confiáveis: o primeiro que sobra é o cliente. Os endereços mais à
+    esquerda vêm do próprio cliente e podem ser forjados.
+    """
+    if not peer:
+        return "desconhecido"
+    if not _confiavel(peer, redes):
+        return peer
+
+    saltos = [s.strip() for s in (x_forwarded_for or "").split(",") if s.strip()]
+    for salto in reversed(saltos):
+        if not _confiavel(salto, redes):
+            return salto
+    return saltos[0] if saltos else peer
+
+
+_proxies = redes_confiaveis(settings.TRUSTED_PROXIES)
+
+
+def ip_do_cliente(request: Request) -> str:
+    peer = request.client.host if request.client else None
+    return resolver_ip(peer, request.headers.get("x-forwarded-for"), _proxies)
@@ -1,5 +1,4 @@
 # app/core/security.py
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
@@ -9,10 +8,13 @@ from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.core.deps import get_db
 from app import models
+from app.core.principal import Principal, principal_cache
+from app.core.hashing import pwd_context
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# Versões síncronas (seeds/scripts). Rotas usam hash_senha/verificar_senha
+# de app.core.hashing, que rodam no pool dedicado.
 def hash_password(password: str):
     return pwd_context.hash(password)
 
@@ -29,7 +31,11 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    Usuário autenticado (id, ativo, role, empresas) vindo do cache em memória.
+    Em cache hit não há consulta ao banco.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token inválido ou expirado",
@@ -43,12 +49,27 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.id == int(user_id)).first()
-    if not user:
+    principal = principal_cache.obter(db, int(user_id))
+    if not principal:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     # Verifica se a conta está ativa
-    if hasattr(user, "is_active") and not user.is_active:
+    if not principal.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Conta desativada")
 
+    return principal
+
+
+def get_current_user(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    """Objeto User completo, para rotas que leem/alteram o próprio usuário."""
+    user = db.get(models.User, principal.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
     return user
+
+
+def get_admin_principal(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Rotas operacionais (ex.: /metricas): só usuários com role "admin"."""
+    if principal.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso restrito a administradores")
+    return principal
@@ -1,10 +1,171 @@
 # app/database.py
+import threading
+import time
+from typing import Dict, Tuple
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from app.core.config import settings
 
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(DATABASE_URL, future=True)
+
+# ----------------------------------------
+# Telemetria do pool
+# ----------------------------------------
+class MetricasPool:
+    """Tempo de espera por conexão (checkout) e timeouts de um pool."""
+
+    def __init__(self, max_overflow: int):
+        self.max_overflow = max_overflow    # o configurado (o pool não o expõe)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def registrar(self, espera: float, timeout: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+            if timeout:
+                self.timeouts += 1
+
+    def resumo(self, pool) -> dict:
+        capacidade = pool.size() + self.max_overflow
+        em_uso = pool.checkedout()
+        with self._lock:
+            return {
+                "tamanho": pool.size(),
+                "max_overflow": self.max_overflow,
+                "em_uso": em_uso,
+                "livres": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "saturacao": round(em_uso / capacidade, 3) if capacidade > 0 else None,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "espera_media_ms": round(self.espera_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "espera_max_ms": round(self.espera_max * 1000, 2),
+            }
+
+
+class _PoolMedido:
+    """Mede a espera em `_do_get` (onde o pool bloqueia quando está esgotado)."""
+
+    metricas: MetricasPool
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        timeout = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timeout = True
+            raise
+        finally:
+            self.metricas.registrar(time.perf_counter() - inicio, timeout)
+
+    def recreate(self):
+        # dispose() recria o pool: as métricas continuam no novo
+        novo = super().recreate()
+        novo.metricas = self.metricas
+        return novo
+
+
+class QueuePoolMedido(_PoolMedido, QueuePool):
+    pass
+
+
+class AsyncQueuePoolMedido(_PoolMedido, AsyncAdaptedQueuePool):
+    pass
+
+
+_engines: Dict[str, object] = {}
+
+
+def _url_async(url: str):
+    u = make_url(url)
+    # "postgresql://" sem driver cairia no psycopg2, que não tem modo async
+    if u.drivername == "postgresql":
+        u = u.set(drivername="postgresql+psycopg")
+    return u
+
+
+def _opcoes_pool(pool_size: int, max_overflow: int, statement_timeout_ms: int) -> dict:
+    opcoes = dict(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    if statement_timeout_ms:
+        # aplicado pelo servidor em cada conexão do pool
+        opcoes["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return opcoes
+
+
+def _criar_engines(
+    nome: str,
+    pool_sync: Tuple[int, int],
+    pool_async: Tuple[int, int],
+    statement_timeout_ms: int,
+):
+    """Engine sync e async com pools próprios; `pool_*` = (pool_size, max_overflow)."""
+    sync_engine = create_engine(
+        DATABASE_URL, future=True, poolclass=QueuePoolMedido,
+        **_opcoes_pool(*pool_sync, statement_timeout_ms),
+    )
+    aio_engine = create_async_engine(
+        _url_async(DATABASE_URL), poolclass=AsyncQueuePoolMedido,
+        **_opcoes_pool(*pool_async, statement_timeout_ms),
+    )
+    sync_engine.pool.metricas = MetricasPool(pool_sync[1])
+    aio_engine.sync_engine.pool.metricas = MetricasPool(pool_async[1])
+    _engines[nome] = sync_engine
+    _engines[f"{nome}_async"] = aio_engine.sync_engine
+    return sync_engine, aio_engine
+
+
+# ----------------------------------------
+# Engines / sessões
+# ----------------------------------------
+engine, async_engine = _criar_engines(
+    "api",
+    (settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+    (settings.DB_ASYNC_POOL_SIZE, settings.DB_ASYNC_MAX_OVERFLOW),
+    settings.DB_STATEMENT_TIMEOUT_MS,
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
 Base = declarative_base()
+
+# Async (psycopg 3) — rotas e serviços que fazem I/O longo (sync com a Nibo)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+def usar_pool_worker():
+    """
+    Processos de background (worker / scheduler) passam a usar um pool
+    próprio, com tamanho e statement_timeout de DB_WORKER_*. Chamar no início
+    do processo, antes de abrir sessões.
+    """
+    global engine, async_engine
+    engine, async_engine = _criar_engines(
+        "worker",
+        (settings.DB_WORKER_POOL_SIZE, settings.DB_WORKER_MAX_OVERFLOW),
+        (settings.DB_WORKER_ASYNC_POOL_SIZE, settings.DB_WORKER_ASYNC_MAX_OVERFLOW),
+        settings.DB_WORKER_STATEMENT_TIMEOUT_MS,
+    )
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+
+
+def metricas_pools() -> dict:
+    return {nome: e.pool.metricas.resumo(e.pool) for nome, e in _engines.items()}
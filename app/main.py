@@ -2,9 +2,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.database import engine, Base
+from app.database import engine, async_engine
+from app.migrations import verificar as verificar_schema
 
-# MODELS (importados para garantir criação das tabelas)
+# MODELS (registram tabelas e relationships no metadata)
 from app.models.user import User
 from app.models.user_empresa import UserEmpresa
 from app.models.empresa import Empresa
@@ -13,6 +14,11 @@ from app.models.movimentacoes import Movimentacao
 from app.models.cdi import CDI
 from app.models.movimentacao_ativo import MovimentacaoAtivo
 from app.models.investimento_cdi import InvestimentoCDI
+from app.models.empresa_nibo_sync import EmpresaNiboSync
+from app.models.investimento_cdi_pendente import InvestimentoCDIPendente
+from app.models.cache_versao import CacheVersao
+from app.models.movimentacao_mensal import MovimentacaoMensal
+from app.models.nibo_job import NiboJob
 
 # ROUTERS
 from app.routers import (
@@ -23,10 +29,12 @@ from app.routers import (
     empresas_router,
     cdi_router,
     investimento_cdi_router,
+    metricas_router,
 )
 
-# SEED
-from app.seeds.cdi_seed import seed_cdi
+# SERVICES
+from app.services.nibo_service import nibo_service
+from app.core.hashing import pool_senhas
 
 
 app = FastAPI(title="ImobInvest API")
@@ -54,11 +62,9 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     try:
-        # Garante que as tabelas existam (DEV)
-        Base.metadata.create_all(bind=engine)
-
-        # Executa seed de CDI (idempotente)
-        seed_cdi()
+        # DDL e seed ficam com `python -m app.migrations` (uma vez por deploy);
+        # aqui só conferimos a versão do schema
+        verificar_schema(engine)
 
     except Exception as e:
         print(f"❌ Erro no startup da aplicação: {e}")
@@ -66,6 +72,27 @@ def on_startup():
         raise
 
 
+@app.on_event("startup")
+async def start_nibo_client():
+    # Um único cliente HTTP (pool + keep-alive) por processo
+    await nibo_service.start()
+
+
+@app.on_event("shutdown")
+async def close_nibo_client():
+    await nibo_service.close()
+
+
+@app.on_event("shutdown")
+def close_pool_senhas():
+    pool_senhas.encerrar()
+
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
+
+
 # ----------------------------------------------
 # Registrar rotas
 # ----------------------------------------------
@@ -76,3 +103,4 @@ app.include_router(ativos_router.router)
 app.include_router(movimentacoes_router.router)
 app.include_router(cdi_router.router)
 app.include_router(investimento_cdi_router.router)
+app.include_router(metricas_router.router)
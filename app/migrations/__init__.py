@@ -0,0 +1,170 @@
+# app/migrations/__init__.py
+"""
+Migrações versionadas do schema.
+
+Cada módulo em app/migrations/versoes/ chamado vNNNN_<nome>.py define:
+
+    DESCRICAO = "..."
+    TRANSACIONAL = True      # False para DDL que não roda em transação (CREATE INDEX CONCURRENTLY)
+    def upgrade(conn): ...
+
+As versões aplicadas ficam na tabela schema_migrations. Cada migração
+transacional roda na própria transação, junto com o registro da versão.
+DDL e dados de referência (seed) são responsabilidade só deste runner, rodado
+uma vez por deploy; a API e o worker apenas conferem a versão no startup.
+
+    python -m app.migrations           # aplica as pendentes
+    python -m app.migrations status    # aplicadas / pendentes
+"""
+import importlib
+import pkgutil
+from typing import List, NamedTuple, Tuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.migrations import versoes
+
+
+TABELA = "schema_migrations"
+
+# pg_advisory_lock: dois deploys simultâneos não aplicam migrações em paralelo
+CHAVE_LOCK = 72_025_001
+
+
+class Migracao(NamedTuple):
+    versao: int
+    nome: str
+    modulo: object
+
+    @property
+    def transacional(self) -> bool:
+        return getattr(self.modulo, "TRANSACIONAL", True)
+
+
+def versoes_conhecidas() -> List[Tuple[int, str]]:
+    """(versão, nome) das migrações do código, sem importar os módulos."""
+    return sorted(
+        (int(info.name[1:5]), info.name)
+        for info in pkgutil.iter_modules(versoes.__path__)
+        if info.name.startswith("v")
+    )
+
+
+def descobrir() -> List[Migracao]:
+    return [
+        Migracao(versao, nome, importlib.import_module(f"{versoes.__name__}.{nome}"))
+        for versao, nome in versoes_conhecidas()
+    ]
+
+
+def criar_engine() -> Engine:
+    # fora dos pools da aplicação: sem statement_timeout e sem conexões ociosas
+    return create_engine(settings.DATABASE_URL, future=True, poolclass=NullPool)
+
+
+def _garantir_tabela(conn: Connection):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA} (
+            versao INTEGER PRIMARY KEY,
+            nome VARCHAR NOT NULL,
+            aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def versoes_aplicadas(conn: Connection) -> set:
+    existe = conn.scalar(text("SELECT to_regclass(:t) IS NOT NULL"), {"t": TABELA})
+    if not existe:
+        return set()
+    return set(conn.scalars(text(f"SELECT versao FROM {TABELA}")))
+
+
+def _registrar(conn: Connection, migracao: Migracao):
+    conn.execute(
+        text(f"INSERT INTO {TABELA} (versao, nome) VALUES (:v, :n)"),
+        {"v": migracao.versao, "n": migracao.nome},
+    )
+
+
+def aplicar(engine: Engine) -> List[Migracao]:
+    """
+    Aplica as migrações pendentes, em ordem. Retorna as aplicadas.
+    Segura o advisory lock do começo ao fim: um segundo runner espera e,
+    ao entrar, já não encontra nada pendente.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as trava:
+        trava.execute(text("SELECT pg_advisory_lock(:k)"), {"k": CHAVE_LOCK})
+        try:
+            return _aplicar_pendentes(engine)
+        finally:
+            trava.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": CHAVE_LOCK})
+
+
+def _aplicar_pendentes(engine: Engine) -> List[Migracao]:
+    with engine.begin() as conn:
+        _garantir_tabela(conn)
+        aplicadas = versoes_aplicadas(conn)
+
+    executadas = []
+    for migracao in descobrir():
+        if migracao.versao in aplicadas:
+            continue
+        print(f"⬆️  {migracao.nome}: {getattr(migracao.modulo, 'DESCRICAO', '')}")
+
+        if migracao.transacional:
+            with engine.begin() as conn:
+                migracao.modulo.upgrade(conn)
+                _registrar(conn, migracao)
+        else:
+            # cada comando confirma sozinho; a migração precisa ser idempotente
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                migracao.modulo.upgrade(conn)
+                _registrar(conn, migracao)
+
+        executadas.append(migracao)
+    return executadas
+
+
+def pendentes(conn: Connection) -> List[Tuple[int, str]]:
+    aplicadas = versoes_aplicadas(conn)
+    return [(v, nome) for v, nome in versoes_conhecidas() if v not in aplicadas]
+
+
+def verificar(engine: Engine):
+    """
+    Startup da API / worker: só confere a versão em schema_migrations, sem DDL.
+    Falha se houver migração pendente.
+    """
+    with engine.connect() as conn:
+        faltando = pendentes(conn)
+    if faltando:
+        nomes = ", ".join(nome for _, nome in faltando)
+        raise RuntimeError(
+            f"Schema desatualizado (pendentes: {nomes}). Rode `python -m app.migrations` antes de subir."
+        )
+
+
+# ----------------------------------------
+# Helpers para as migrações
+# ----------------------------------------
+def criar_indice_concorrente(conn: Connection, nome: str, definicao: str):
+    """
+    CREATE INDEX CONCURRENTLY (sem bloquear escritas). Um build concorrente
+    interrompido deixa o índice INVALID: nesse caso ele é recriado.
+    Requer conexão em AUTOCOMMIT (migração com TRANSACIONAL = False).
+    """
+    invalido = conn.scalar(
+        text("""
+            SELECT NOT i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :nome
+        """),
+        {"nome": nome},
+    )
+    if invalido:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome} {definicao}"))
@@ -0,0 +1,43 @@
+import argparse
+
+from sqlalchemy import text
+
+from app.migrations import TABELA, aplicar, criar_engine, pendentes, versoes_aplicadas
+
+
+def upgrade(engine):
+    executadas = aplicar(engine)
+    if executadas:
+        print(f"✅ {len(executadas)} migração(ões) aplicada(s)")
+    else:
+        print("✅ Schema já está na última versão")
+
+
+def status(engine):
+    with engine.connect() as conn:
+        if versoes_aplicadas(conn):
+            for versao, nome, aplicada_em in conn.execute(
+                text(f"SELECT versao, nome, aplicada_em FROM {TABELA} ORDER BY versao")
+            ):
+                print(f"✅ {nome}  ({aplicada_em:%Y-%m-%d %H:%M})")
+        for _, nome in pendentes(conn):
+            print(f"⏳ {nome}  (pendente)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrações do schema (uma vez por deploy)")
+    parser.add_argument("comando", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    args = parser.parse_args()
+
+    engine = criar_engine()
+    try:
+        if args.comando == "status":
+            status(engine)
+        else:
+            upgrade(engine)
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
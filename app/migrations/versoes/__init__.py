@@ -0,0 +1 @@
+# Migrações: vNNNN_<nome>.py, aplicadas em ordem de NNNN (ver app/migrations).
@@ -0,0 +1,14 @@
+"""
+Baseline: cria as tabelas dos models que ainda não existem (banco novo ou
+tabelas novas do backlog). Em bancos criados pelo antigo create_all do
+startup não faz nada. Mudanças em tabelas existentes (colunas, constraints,
+índices) precisam de migração própria.
+"""
+from app.database import Base
+import app.models  # noqa: F401  registra todas as tabelas no metadata
+
+DESCRICAO = "tabelas iniciais (create_all com checkfirst)"
+
+
+def upgrade(conn):
+    Base.metadata.create_all(bind=conn, checkfirst=True)
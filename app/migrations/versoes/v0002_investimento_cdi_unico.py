@@ -0,0 +1,29 @@
+"""
+Unique (ativo_id, data) em investimento_cdi, alvo do upsert da série de CDI.
+Foi adicionada ao model com a tabela já existente, então o create_all não a
+criou. Linhas duplicadas (mesmo ativo/mês) são removidas antes, mantendo a
+mais recente; a série é recalculável a partir das movimentações.
+"""
+from sqlalchemy import text
+
+DESCRICAO = "unique (ativo_id, data) em investimento_cdi"
+
+
+def upgrade(conn):
+    existe = conn.scalar(text(
+        "SELECT 1 FROM pg_constraint WHERE conname = 'uix_investimento_cdi_ativo_data'"
+    ))
+    if existe:
+        return
+
+    conn.execute(text("""
+        DELETE FROM investimento_cdi a
+        USING investimento_cdi b
+        WHERE a.ativo_id = b.ativo_id
+          AND a.data = b.data
+          AND a.id < b.id
+    """))
+    conn.execute(text("""
+        ALTER TABLE investimento_cdi
+        ADD CONSTRAINT uix_investimento_cdi_ativo_data UNIQUE (ativo_id, data)
+    """))
@@ -0,0 +1,31 @@
+"""
+Índices compostos para os caminhos quentes (mesmos nomes dos models).
+CONCURRENTLY: não bloqueia escritas em movimentacoes durante o deploy.
+Conferir os planos com `python -m app.verificar_indices`.
+"""
+from app.migrations import criar_indice_concorrente
+
+DESCRICAO = "índices de movimentacoes, movimentacao_ativo, ativos e usuarios_empresas"
+TRANSACIONAL = False
+
+INDICES = [
+    # comparativo / real / série de CDI: movimentações de um ativo por data
+    ("ix_movimentacoes_ativo_data", "ON movimentacoes (ativo_id, data_movimentacao)"),
+    # dedupe do import/refresh (MovimentacaoBulkWriter)
+    (
+        "ix_movimentacoes_usuario_nibo",
+        "ON movimentacoes (usuario_id, nibo_transaction_id) WHERE nibo_transaction_id IS NOT NULL",
+    ),
+    # GET /movimentacoes/ (keyset em data_movimentacao, id)
+    ("ix_movimentacoes_data_id", "ON movimentacoes (data_movimentacao, id)"),
+    ("ix_movimentacao_ativo_mov_ativo", "ON movimentacao_ativo (movimentacao_id, ativo_id)"),
+    ("ix_movimentacao_ativo_ativo", "ON movimentacao_ativo (ativo_id)"),
+    ("ix_ativos_empresa", "ON ativos (empresa_id)"),
+    # user_id já é coberto por uix_user_empresa (user_id, empresa_id)
+    ("ix_usuarios_empresas_empresa", "ON usuarios_empresas (empresa_id)"),
+]
+
+
+def upgrade(conn):
+    for nome, definicao in INDICES:
+        criar_indice_concorrente(conn, nome, definicao)
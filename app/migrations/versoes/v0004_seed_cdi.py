@@ -0,0 +1,16 @@
+"""
+Meses de CDI de referência (app.seeds.cdi_seed). Antes rodava a cada boot
+de cada worker; agora uma vez por deploy. Novos meses = nova migração.
+"""
+from sqlalchemy.orm import Session
+
+from app.seeds.cdi_seed import semear
+
+DESCRICAO = "seed da tabela de CDI"
+
+
+def upgrade(conn):
+    # a Session entra na transação da migração: o commit é do runner
+    with Session(bind=conn) as db:
+        criados = semear(db)
+    print(f"   CDI: {criados} mês(es) criado(s)")
@@ -0,0 +1,16 @@
+"""
+Preenche o rollup movimentacao_mensal a partir de movimentacoes em bancos
+que já tinham movimentações quando a tabela foi criada. A partir daí ele é
+mantido incrementalmente (import, refresh e CRUD).
+"""
+from sqlalchemy.orm import Session
+
+from app.services import movimentacao_mensal_service
+
+DESCRICAO = "backfill do rollup movimentacao_mensal"
+
+
+def upgrade(conn):
+    with Session(bind=conn) as db:
+        movimentacao_mensal_service.reconstruir(db)
+        db.flush()
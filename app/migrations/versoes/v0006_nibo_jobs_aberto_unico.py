@@ -0,0 +1,33 @@
+"""
+No máximo um job em aberto (pendente / executando) por empresa: índice
+único parcial, alvo do `job_service.criar`. Jobs em aberto duplicados de
+antes do índice são encerrados como erro, mantendo o que está executando
+(ou o mais antigo). A tabela da fila é pequena: índice criado na transação.
+"""
+from sqlalchemy import text
+
+DESCRICAO = "unique parcial de job em aberto por empresa em nibo_jobs"
+
+
+def upgrade(conn):
+    conn.execute(text("""
+        UPDATE nibo_jobs j
+        SET status = 'erro',
+            erro = 'Job duplicado: a empresa já tinha outro sync em aberto',
+            concluido_em = now(),
+            atualizado_em = now()
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY empresa_id
+                       ORDER BY (status = 'executando') DESC, id
+                   ) AS ordem
+            FROM nibo_jobs
+            WHERE status IN ('pendente', 'executando')
+        ) d
+        WHERE j.id = d.id AND d.ordem > 1
+    """))
+    conn.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uix_nibo_jobs_empresa_aberto
+        ON nibo_jobs (empresa_id) WHERE status IN ('pendente', 'executando')
+    """))
@@ -6,3 +6,8 @@ from .movimentacoes import Movimentacao
 from .cdi import CDI
 from .movimentacao_ativo import MovimentacaoAtivo
 from .investimento_cdi import InvestimentoCDI
+from .empresa_nibo_sync import EmpresaNiboSync
+from .investimento_cdi_pendente import InvestimentoCDIPendente
+from .cache_versao import CacheVersao
+from .movimentacao_mensal import MovimentacaoMensal
+from .nibo_job import NiboJob
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Numeric, Enum
+from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Numeric, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.schema import Computed
 from app.database import Base
@@ -59,6 +59,8 @@ class Ativo(Base):
 
     def __repr__(self):
         return f"<Ativo {self.id} - {self.nome}>"
+
+    __table_args__ = (Index("ix_ativos_empresa", "empresa_id"),)
     
     __mapper_args__ = {
     "eager_defaults": True
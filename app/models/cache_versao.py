@@ -0,0 +1,19 @@
+# app/models/cache_versao.py
+from sqlalchemy import Column, String, BigInteger, DateTime, func
+from app.database import Base
+
+
+class CacheVersao(Base):
+    """
+    Carimbo de versão de dados cacheados em memória (ex: "cdi").
+    Cada escrita incrementa a versão; os workers comparam com a versão
+    local para saber se o cache está velho.
+    """
+    __tablename__ = "cache_versoes"
+
+    chave = Column(String, primary_key=True)
+    versao = Column(BigInteger, nullable=False, default=0)
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<CacheVersao {self.chave}={self.versao}>"
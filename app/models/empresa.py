@@ -21,6 +21,7 @@ class Empresa(Base):
     # relationships
     usuarios = relationship("UserEmpresa", back_populates="empresa", cascade="all, delete-orphan")
     ativos = relationship("Ativo", back_populates="empresa", cascade="all, delete-orphan")    
+    nibo_sync = relationship("EmpresaNiboSync", back_populates="empresa", uselist=False, cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Empresa {self.id} - {self.nome}>"
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from app.database import Base
+
+class EmpresaNiboSync(Base):
+    """Cursor de sincronização incremental com a Nibo (1 linha por empresa)."""
+    __tablename__ = "empresa_nibo_sync"
+
+    empresa_id = Column(Integer, ForeignKey("empresas.id", ondelete="CASCADE"), primary_key=True)
+
+    # maior `date` / entryId já visto na Nibo (high-water mark)
+    cursor_data = Column(Date, nullable=True)
+    cursor_entry_id = Column(String, nullable=True)
+
+    ultimo_sync_em = Column(DateTime(timezone=True), nullable=True)
+    ultimo_sync_completo_em = Column(DateTime(timezone=True), nullable=True)
+
+    empresa = relationship("Empresa", back_populates="nibo_sync")
+
+    def __repr__(self):
+        return f"<EmpresaNiboSync empresa={self.empresa_id} cursor={self.cursor_data}>"
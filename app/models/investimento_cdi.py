@@ -8,6 +8,7 @@ from sqlalchemy import (
     SmallInteger,
     DateTime,
     func,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -51,3 +52,6 @@ class InvestimentoCDI(Base):
     )
 
     ativo = relationship("Ativo", back_populates="investimentos_cdi")
+
+    # uma linha por ativo/mês — alvo do upsert da série de CDI
+    __table_args__ = (UniqueConstraint("ativo_id", "data", name="uix_investimento_cdi_ativo_data"),)
@@ -0,0 +1,18 @@
+# app/models/investimento_cdi_pendente.py
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, func
+from app.database import Base
+
+
+class InvestimentoCDIPendente(Base):
+    """
+    Marca de recálculo da série de CDI de um ativo.
+    `desde` = mês mais antigo afetado; NULL = recalcular a série inteira.
+    """
+    __tablename__ = "investimento_cdi_pendente"
+
+    ativo_id = Column(Integer, ForeignKey("ativos.id", ondelete="CASCADE"), primary_key=True)
+    desde = Column(Date, nullable=True)
+    marcado_em = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<InvestimentoCDIPendente ativo={self.ativo_id} desde={self.desde}>"
@@ -1,5 +1,5 @@
 # app/models/movimentacao_ativo.py
-from sqlalchemy import Column, Integer, Numeric, String, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, Numeric, String, ForeignKey, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from app.database import Base
 from app.models.ativos import Ativo
@@ -18,3 +18,8 @@ class MovimentacaoAtivo(Base):
     # Relações
     movimentacao = relationship("Movimentacao", back_populates="movimentacao_ativos")
     ativo = relationship("Ativo", back_populates="movimentacao_ativos")
+
+    __table_args__ = (
+        Index("ix_movimentacao_ativo_mov_ativo", "movimentacao_id", "ativo_id"),
+        Index("ix_movimentacao_ativo_ativo", "ativo_id"),
+    )
@@ -0,0 +1,29 @@
+# app/models/movimentacao_mensal.py
+from sqlalchemy import Column, Integer, Date, Numeric, ForeignKey, UniqueConstraint
+from app.database import Base
+
+
+class MovimentacaoMensal(Base):
+    """
+    Rollup mensal das movimentações por ativo, mantido incrementalmente
+    (import, refresh e CRUD manual). Reconstruível via
+    `python -m app.services.movimentacao_mensal_service`.
+    """
+    __tablename__ = "movimentacao_mensal"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ativo_id = Column(Integer, ForeignKey("ativos.id", ondelete="CASCADE"), nullable=False)
+
+    # sempre 1º dia do mês
+    mes = Column(Date, nullable=False)
+
+    recebimentos = Column(Numeric(14, 2), nullable=False, default=0)
+    pagamentos = Column(Numeric(14, 2), nullable=False, default=0)   # soma dos valores negativos
+    liquido = Column(Numeric(14, 2), nullable=False, default=0)
+    acumulado = Column(Numeric(14, 2), nullable=False, default=0)    # soma corrida de `liquido`
+    quantidade = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint("ativo_id", "mes", name="uix_movimentacao_mensal_ativo_mes"),)
+
+    def __repr__(self):
+        return f"<MovimentacaoMensal ativo={self.ativo_id} mes={self.mes} liquido={self.liquido}>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Date, Numeric, String
+from sqlalchemy import Column, Integer, ForeignKey, Date, Numeric, String, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -31,5 +31,19 @@ class Movimentacao(Base):
 )
 
 
+    __table_args__ = (
+        # movimentações de um ativo em ordem de data (comparativo, real, série de CDI)
+        Index("ix_movimentacoes_ativo_data", "ativo_id", "data_movimentacao"),
+        # dedupe do import/refresh: ids da Nibo já gravados do usuário
+        Index(
+            "ix_movimentacoes_usuario_nibo",
+            "usuario_id",
+            "nibo_transaction_id",
+            postgresql_where=nibo_transaction_id.isnot(None),
+        ),
+        # listagem keyset (data_movimentacao, id) DESC
+        Index("ix_movimentacoes_data_id", "data_movimentacao", "id"),
+    )
+
     def __repr__(self):
         return f"<Movimentacao {self.id} - ativo={self.ativo_id} valor={self.valor}>"
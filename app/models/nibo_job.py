@@ -0,0 +1,52 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index, func, text
+from app.database import Base
+
+class NiboJob(Base):
+    """
+    Fila de jobs de sincronização com a Nibo (importar / refresh).
+    Processada por `python -m app.worker` (claim com FOR UPDATE SKIP LOCKED).
+    """
+    __tablename__ = "nibo_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String, nullable=False)                    # "importar" | "refresh"
+    status = Column(String, nullable=False, default="pendente", server_default="pendente")
+    # pendente → executando → concluido | erro (volta a pendente se houver nova tentativa)
+    fase = Column(String, nullable=True)
+
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), nullable=False)
+    empresa_id = Column(Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False)
+    parametros = Column(JSON, nullable=True)                 # ex: {"completo": true, "agendado": true}
+
+    tentativas = Column(Integer, nullable=False, default=0, server_default="0")
+    max_tentativas = Column(Integer, nullable=False, default=3, server_default="3")
+    disponivel_em = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    # progresso
+    paginas = Column(Integer, nullable=False, default=0, server_default="0")
+    linhas_inseridas = Column(Integer, nullable=False, default=0, server_default="0")
+    meses_cdi = Column(Integer, nullable=False, default=0, server_default="0")
+
+    resultado = Column(JSON, nullable=True)
+    erro = Column(Text, nullable=True)
+
+    criado_em = Column(DateTime(timezone=True), server_default=func.now())
+    iniciado_em = Column(DateTime(timezone=True), nullable=True)
+    concluido_em = Column(DateTime(timezone=True), nullable=True)
+    duracao_ms = Column(Integer, nullable=True)              # da última tentativa
+    # heartbeat: job "executando" parado há muito tempo é retomado por outro worker
+    atualizado_em = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_nibo_jobs_status_disponivel", "status", "disponivel_em"),
+        # no máximo um job em aberto por empresa (enfileirar concorrente)
+        Index(
+            "uix_nibo_jobs_empresa_aberto",
+            "empresa_id",
+            unique=True,
+            postgresql_where=text("status IN ('pendente', 'executando')"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<NiboJob {self.id} {self.tipo} empresa={self.empresa_id} {self.status}>"
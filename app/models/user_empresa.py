@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -12,7 +12,11 @@ class UserEmpresa(Base):
     user = relationship("User", back_populates="empresas")
     empresa = relationship("Empresa", back_populates="usuarios")
 
-    __table_args__ = (UniqueConstraint("user_id", "empresa_id", name="uix_user_empresa"),)
+    # (user_id, ...) já é atendido pela unique; empresa → usuários precisa do próprio índice
+    __table_args__ = (
+        UniqueConstraint("user_id", "empresa_id", name="uix_user_empresa"),
+        Index("ix_usuarios_empresas_empresa", "empresa_id"),
+    )
 
     def __repr__(self):
         return f"<UserEmpresa user={self.user_id} empresa={self.empresa_id}>"
@@ -1,34 +1,36 @@
 from datetime import datetime
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.core.deps import get_db
-from app.core.security import get_current_user
-from app.models import User, Ativo, UserEmpresa
+from app.core.authz import Autorizacao, get_autorizacao
+from app.models import Ativo
+from app.services.investimento_cdi_service import marcar_cdi_pendente, recalcular_ou_manter_pendente
+from app.services.response_cache import response_cache, invalidar_empresas, chave_empresa
 router = APIRouter(prefix="/ativos", tags=["Ativos"])
 
 
-def user_has_access(db: Session, user_id: int, empresa_id: int) -> bool:
-    return (
-        db.query(UserEmpresa)
-        .filter_by(user_id=user_id, empresa_id=empresa_id)
-        .first()
-        is not None
-    )
-
-
 @router.get("/", response_model=list[schemas.AtivoOut])
 def list_ativos(
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
-    return (
-        db.query(Ativo)
-        .join(UserEmpresa, UserEmpresa.empresa_id == Ativo.empresa_id)
-        .filter(UserEmpresa.user_id == current_user.id)
-        .all()
+    empresas_ids = sorted(authz.empresa_ids)
+
+    def gerar():
+        return db.query(Ativo).filter(Ativo.empresa_id.in_(empresas_ids)).all()
+
+    # o conjunto de empresas do usuário entra na chave pelas versões
+    return response_cache.responder(
+        request,
+        db,
+        gerar,
+        [chave_empresa(e) for e in empresas_ids],
+        escopo=f"user:{authz.user_id}",
+        modelo=list[schemas.AtivoOut],
     )
 
 
@@ -36,14 +38,13 @@ def list_ativos(
 def get_ativo(
     ativo_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
+    ativo = authz.obter_ativo(ativo_id)
     if not ativo:
         raise HTTPException(404, "Ativo não encontrado")
 
-    if not user_has_access(db, current_user.id, ativo.empresa_id):
-        raise HTTPException(403, "Acesso negado ao ativo")
+    authz.exigir_empresa(ativo.empresa_id, "Acesso negado ao ativo")
 
     return ativo
 
@@ -52,13 +53,13 @@ def get_ativo(
 def create_ativo(
     ativo: schemas.AtivoCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
-    if not user_has_access(db, current_user.id, ativo.empresa_id):
-        raise HTTPException(403, "Acesso negado à empresa")
+    authz.exigir_empresa(ativo.empresa_id, "Acesso negado à empresa")
 
     new_ativo = Ativo(**ativo.model_dump())
     db.add(new_ativo)
+    invalidar_empresas(db, new_ativo.empresa_id)
     db.commit()
     db.refresh(new_ativo)
 
@@ -70,24 +71,33 @@ def update_ativo(
     ativo_id: int,
     ativo_data: schemas.AtivoUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
+    ativo = authz.obter_ativo(ativo_id)
     if not ativo:
         raise HTTPException(404, "Ativo não encontrado")
 
-    if not user_has_access(db, current_user.id, ativo.empresa_id):
-        raise HTTPException(403, "Acesso negado ao ativo")
+    authz.exigir_empresa(ativo.empresa_id, "Acesso negado ao ativo")
 
     dados = ativo_data.model_dump(exclude_unset=True)
+    empresa_anterior = ativo.empresa_id
 
     for key, value in dados.items():
         if key == "total":
             continue  # total é calculado no banco
         setattr(ativo, key, value)
 
+    if "valor_compra" in dados:
+        # valor base muda a série de CDI inteira
+        marcar_cdi_pendente(db, ativo.id, None)
+
+    invalidar_empresas(db, empresa_anterior, ativo.empresa_id)
     db.commit()
     db.refresh(ativo)
+
+    if "valor_compra" in dados:
+        recalcular_ou_manter_pendente(db, [ativo.id])
+
     return ativo
 
 
@@ -96,16 +106,16 @@ def update_ativo(
 def delete_ativo(
     ativo_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
+    ativo = authz.obter_ativo(ativo_id)
     if not ativo:
         raise HTTPException(404, "Ativo não encontrado")
 
-    if not user_has_access(db, current_user.id, ativo.empresa_id):
-        raise HTTPException(403, "Acesso negado ao ativo")
+    authz.exigir_empresa(ativo.empresa_id, "Acesso negado ao ativo")
 
     db.delete(ativo)
+    invalidar_empresas(db, ativo.empresa_id)
     db.commit()
 
     return ativo
@@ -114,16 +124,15 @@ def delete_ativo(
 def comparativo_ativo(
     ativo_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
-    from app.models import Ativo, UserEmpresa, InvestimentoCDI
+    from app.models import Ativo, InvestimentoCDI
 
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
+    ativo = authz.obter_ativo(ativo_id)
     if not ativo:
         raise HTTPException(404, "Ativo não encontrado")
 
-    if not db.query(UserEmpresa).filter_by(user_id=current_user.id, empresa_id=ativo.empresa_id).first():
-        raise HTTPException(403, "Acesso negado ao ativo")
+    authz.exigir_empresa(ativo.empresa_id, "Acesso negado ao ativo")
 
     # pegar dados básicos
     valor_inicial = ativo.valor_inicial
@@ -1,79 +1,80 @@
 # app/routers/auth.py
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
 from datetime import timedelta, datetime
 from typing import Optional
 
 from app import models, schemas
+from app.core.config import settings
 from app.core.deps import get_db
-from app.core.security import verify_password, create_access_token, hash_password, get_current_user
+from app.core.principal import Principal
+from app.core.rate_limit import login_por_email, login_por_ip, ip_do_cliente
+from app.core.hashing import hash_senha, verificar_senha
+from app.core.security import create_access_token, get_current_user, get_current_principal
 from app.models import User
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-# Simple in-memory brute-force mitigation
-_login_attempts: dict[str, dict] = {}
-MAX_ATTEMPTS = 5
-LOCK_SECONDS = 300  # 5 minutos de bloqueio após exceder tentativas
-
-def _register_failed_attempt(username: str):
-    entry = _login_attempts.get(username) or {"count": 0, "first_at": datetime.utcnow(), "locked_until": None}
-    entry["count"] += 1
-    if entry["count"] >= MAX_ATTEMPTS:
-        entry["locked_until"] = datetime.utcnow() + timedelta(seconds=LOCK_SECONDS)
-    _login_attempts[username] = entry
-
-def _is_locked(username: str) -> bool:
-    entry = _login_attempts.get(username)
-    if not entry:
-        return False
-    locked_until = entry.get("locked_until")
-    if locked_until:
-        if datetime.utcnow() < locked_until:
-            return True
-        entry["count"] = 0
-        entry["locked_until"] = None
-        _login_attempts[username] = entry
-    return False
-
-def _clear_attempts(username: str):
-    if username in _login_attempts:
-        del _login_attempts[username]
-
 # ---------------------------
 # LOGIN (resolvendo o erro)
 # ---------------------------
 # ---------------------------
 # LOGIN (corrigido)
 # ---------------------------
+def _carregar_usuario_login(db: Session, email: str) -> Optional[User]:
+    # ✅ Carrega o usuário junto com as empresas associadas
+    return db.query(models.User).options(
+        joinedload(models.User.empresas).joinedload(models.UserEmpresa.empresa)
+    ).filter(models.User.email == email).first()
+
+
+def _regravar_senha(db: Session, user: User, novo_hash: str):
+    user.senha = novo_hash
+    db.commit()
+
+
+# Rotas async: o bcrypt roda no pool de senhas e o acesso ao banco no
+# threadpool, então um pico de logins não ocupa as threads das outras rotas.
 @router.post("/login", response_model=schemas.TokenWithEmpresas)
-def login(
+async def login(
     body: schemas.LoginSchema,
+    request: Request,
     db: Session = Depends(get_db),
 ):
     email = body.email.lower()
     password = body.password
+    ip = ip_do_cliente(request)
 
-    if _is_locked(email):
+    # falhas recentes por email e por IP (janela deslizante, ver app.core.rate_limit)
+    if login_por_email.excedido(email) or (login_por_ip is not None and login_por_ip.excedido(ip)):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Muitas tentativas. Tente novamente mais tarde."
+            detail="Muitas tentativas. Tente novamente mais tarde.",
+            headers={"Retry-After": str(settings.LOGIN_JANELA_SECONDS)},
         )
 
-    # ✅ Carrega o usuário junto com as empresas associadas
-    user = db.query(models.User).options(
-        joinedload(models.User.empresas).joinedload(models.UserEmpresa.empresa)
-    ).filter(models.User.email == email).first()
+    user = await run_in_threadpool(_carregar_usuario_login, db, email)
+
+    senha_ok, novo_hash = (False, None)
+    if user:
+        senha_ok, novo_hash = await verificar_senha(password, user.senha)
 
-    if not user or not verify_password(password, user.senha):
-        _register_failed_attempt(email)
+    if not senha_ok:
+        login_por_email.registrar(email)
+        if login_por_ip is not None:
+            login_por_ip.registrar(ip)
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
 
     if not user.is_active:
         raise HTTPException(status_code=403, detail="Conta desativada")
 
-    _clear_attempts(email)
+    login_por_email.limpar(email)
+
+    if novo_hash:
+        # hash gerado com outro BCRYPT_ROUNDS: regrava com o custo atual
+        await run_in_threadpool(_regravar_senha, db, user, novo_hash)
 
     token_payload = {"sub": str(user.id), "role": user.role}
     access_token = create_access_token(
@@ -101,19 +102,26 @@ def login(
 # ---------------------------
 # REGISTER
 # ---------------------------
-@router.post("/register", response_model=schemas.UserOut)
-def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == user_in.email).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Email já cadastrado")
+def _email_cadastrado(db: Session, email: str) -> bool:
+    return db.query(User.id).filter(User.email == email).first() is not None
+
 
-    hashed = hash_password(user_in.password)
-    new_user = User(nome=user_in.nome, email=user_in.email, senha=hashed)
+def _criar_usuario(db: Session, nome: str, email: str, senha_hash: str) -> User:
+    new_user = User(nome=nome, email=email, senha=senha_hash)
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
     return new_user
 
+
+@router.post("/register", response_model=schemas.UserOut)
+async def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
+    if await run_in_threadpool(_email_cadastrado, db, user_in.email):
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
+
+    hashed = await hash_senha(user_in.password)
+    return await run_in_threadpool(_criar_usuario, db, user_in.nome, user_in.email, hashed)
+
 # ---------------------------
 # GET ME
 # ---------------------------
@@ -125,9 +133,9 @@ def get_me(current_user: User = Depends(get_current_user)):
 # REFRESH TOKEN
 # ---------------------------
 @router.post("/refresh", response_model=schemas.Token)
-def refresh_token(current_user: User = Depends(get_current_user)):
+def refresh_token(current_user: Principal = Depends(get_current_principal)):
     access_token = create_access_token(
-        data={"sub": str(current_user.id), "role": getattr(current_user, "role", "user")},
+        data={"sub": str(current_user.id), "role": current_user.role},
         expires_delta=timedelta(hours=3)
     )
     return {"access_token": access_token, "token_type": "bearer"}
@@ -2,16 +2,21 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.core.deps import get_db
-from app.core.security import get_current_user
-from app.models import User, CDI
+from app.core.principal import Principal
+from app.core.security import get_current_principal
+from app.models import CDI
+from app.services.investimento_cdi_service import marcar_cdi_pendente_todos
+from app.services.cdi_cache import cdi_cache
 from app import schemas
 
 router = APIRouter(prefix="/cdi", tags=["CDI"])
 
 @router.post("/", response_model=schemas.CDIOut)
-def create_cdi(cdi: schemas.CDICreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def create_cdi(cdi: schemas.CDICreate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     new_cdi = CDI(**cdi.model_dump())
     db.add(new_cdi)
+    marcar_cdi_pendente_todos(db, new_cdi.data)
+    cdi_cache.invalidar(db)
     db.commit()
     db.refresh(new_cdi)
     return new_cdi
@@ -20,7 +25,7 @@ def create_cdi(cdi: schemas.CDICreate, db: Session = Depends(get_db), current_us
 def create_cdi_bulk(
     cdis: list[schemas.CDICreate],
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     if not cdis:
         raise HTTPException(status_code=400, detail="A lista está vazia")
@@ -33,6 +38,8 @@ def create_cdi_bulk(
         created.append(obj)
 
     try:
+        marcar_cdi_pendente_todos(db, min(obj.data for obj in created))
+        cdi_cache.invalidar(db)
         db.commit()
     except Exception as e:
         db.rollback()
@@ -44,18 +51,18 @@ def create_cdi_bulk(
     return created
 
 @router.get("/", response_model=list[schemas.CDIOut])
-def list_cdi(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return db.query(CDI).order_by(CDI.data.desc()).all()
+def list_cdi(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
+    return list(reversed(cdi_cache.registros(db)))
 
 @router.get("/{cdi_id}", response_model=schemas.CDIOut)
-def get_cdi(cdi_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_cdi(cdi_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     cdi = db.query(CDI).filter(CDI.id == cdi_id).first()
     if not cdi:
         raise HTTPException(status_code=404, detail="CDI não encontrado")
     return cdi
 
 @router.put("/{cdi_id}", response_model=schemas.CDIOut)
-def update_cdi(cdi_id: int, cdi_data: schemas.CDIUpdate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def update_cdi(cdi_id: int, cdi_data: schemas.CDIUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     cdi = db.query(CDI).filter(CDI.id == cdi_id).first()
     if not cdi:
         raise HTTPException(status_code=404, detail="CDI não encontrado")
@@ -63,16 +70,20 @@ def update_cdi(cdi_id: int, cdi_data: schemas.CDIUpdate, db: Session = Depends(g
     for key, value in cdi_data.dict(exclude_unset=True).items():
         setattr(cdi, key, value)
 
+    marcar_cdi_pendente_todos(db, cdi.data)
+    cdi_cache.invalidar(db)
     db.commit()
     db.refresh(cdi)
     return cdi
 
 @router.delete("/{cdi_id}")
-def delete_cdi(cdi_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def delete_cdi(cdi_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     cdi = db.query(CDI).filter(CDI.id == cdi_id).first()
     if not cdi:
         raise HTTPException(status_code=404, detail="CDI não encontrado")
 
     db.delete(cdi)
+    marcar_cdi_pendente_todos(db, cdi.data)
+    cdi_cache.invalidar(db)
     db.commit()
     return {"detail": "CDI deletado com sucesso"}
@@ -1,28 +1,21 @@
 # app/routers/empresas.py
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.core.deps import get_db
-from app.core.security import get_current_user
-from app.models import User, Empresa, UserEmpresa
+from app.core.deps import get_db, get_async_db
+from app.core.authz import Autorizacao, get_autorizacao
+from app.core.principal import principal_cache
+from app.models import Empresa, UserEmpresa, NiboJob
 from app.services.nibo_service import nibo_service
-from app.services.nibo_import_service import nibo_import_service
-from app.services.nibo_refresh_service import refresh_ativos
+from app.services import job_service
+from app.services.response_cache import invalidar_empresas
 from app import schemas
-from app.database import SessionLocal
 
 router = APIRouter(prefix="/empresas", tags=["Empresas"])
 
 
-def user_has_access(db: Session, user_id: int, empresa_id: int) -> bool:
-    return (
-        db.query(UserEmpresa)
-        .filter_by(user_id=user_id, empresa_id=empresa_id)
-        .first()
-        is not None
-    )
-
-
 # ---------------------------------------------------------------------------
 # CRIAR EMPRESA MANUAL
 # ---------------------------------------------------------------------------
@@ -30,56 +23,37 @@ def user_has_access(db: Session, user_id: int, empresa_id: int) -> bool:
 def create_empresa(
     empresa: schemas.EmpresaCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     new_empresa = Empresa(
     nome=empresa.nome,
     cnpj=empresa.cnpj,
     nibo_company_id=empresa.nibo_company_id,
-    usuario_id=current_user.id   # <<<<<<<<<<<<<< ESSENCIAL
+    usuario_id=authz.user_id   # <<<<<<<<<<<<<< ESSENCIAL
 )
 
     db.add(new_empresa)
     db.commit()
     db.refresh(new_empresa)
 
-    db.add(UserEmpresa(user_id=current_user.id, empresa_id=new_empresa.id))
+    db.add(UserEmpresa(user_id=authz.user_id, empresa_id=new_empresa.id))
+    principal_cache.invalidar(db, authz.user_id)
     db.commit()
 
     return new_empresa
 
 
-# ---------------------------------------------------------------------------
-#  IMPORTAÇÃO DO NIBO (o endpoint principal)
-# ---------------------------------------------------------------------------
 # ---------------------------------------------------------------------------
 #  IMPORTAÇÃO DO NIBO (o endpoint principal)
 # ---------------------------------------------------------------------------
-# -------------------------------------------------
-# Wrapper seguro para background task
-# -------------------------------------------------
-async def importar_empresa_background(token: str, usuario_id: int, empresa_data: dict):
-    db = SessionLocal()
-    try:
-        await nibo_import_service.importar(
-            db=db,
-            token=token,
-            usuario_id=usuario_id,
-            empresa_data=empresa_data
-        )
-    finally:
-        db.close()
-
-
 # -------------------------------------------------
 # ROTA IMPORTAR (NÃO BLOQUEANTE)
 # -------------------------------------------------
 @router.post("/importar")
 async def importar_empresa(
     body: schemas.EmpresaImportToken,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    authz: Autorizacao = Depends(get_autorizacao)
 ):
     token = body.token
 
@@ -100,10 +74,12 @@ async def importar_empresa(
         )
 
     # 3. Verifica se a empresa já existe
-    empresa = db.query(Empresa).filter(
-        Empresa.cnpj == profile["cnpj"],
-        Empresa.usuario_id == current_user.id
-    ).first()
+    empresa = await db.scalar(
+        select(Empresa).where(
+            Empresa.cnpj == profile["cnpj"],
+            Empresa.usuario_id == authz.user_id
+        ).limit(1)
+    )
 
     if not empresa:
         empresa = Empresa(
@@ -111,15 +87,15 @@ async def importar_empresa(
             cnpj=profile["cnpj"],
             nibo_company_id=profile["companyId"],
             nibo_api_token=token,
-            usuario_id=current_user.id
+            usuario_id=authz.user_id
         )
         db.add(empresa)
-        db.commit()
-        db.refresh(empresa)
+        await db.commit()
+        await db.refresh(empresa)
     else:
         empresa.nibo_api_token = token
-        db.commit()
-        db.refresh(empresa)
+        await db.commit()
+        await db.refresh(empresa)
 
     empresa_data = {
         "nome": empresa.nome,
@@ -127,26 +103,62 @@ async def importar_empresa(
         "companyId": empresa.nibo_company_id
     }
 
-    # 4. 🔥 DISPARA IMPORTAÇÃO EM BACKGROUND
-    background_tasks.add_task(
-        importar_empresa_background,
-        token,
-        current_user.id,
-        empresa_data
-    )
+    # 4. 🔥 ENFILEIRA A IMPORTAÇÃO (processada por python -m app.worker)
+    job = await db.run_sync(job_service.enfileirar, job_service.TIPO_IMPORTAR, authz.user_id, empresa.id)
+    await db.commit()
 
     # 5. RESPONDE IMEDIATAMENTE
     return {
         "status": "processando",
         "empresa_id": empresa.id,
         "empresa_nome": empresa.nome,
-        "message": "Importação iniciada em background"
+        "job_id": job.id,
+        "message": "Importação enfileirada"
     }
 
-@router.post("/{empresa_id}/refresh")
-async def refresh_empresa_ativos(empresa_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    result = await refresh_ativos(db, current_user.id, empresa_id)
-    return result
+@router.post("/{empresa_id}/refresh", status_code=202)
+def refresh_empresa_ativos(
+    empresa_id: int,
+    completo: bool = False,
+    db: Session = Depends(get_db),
+    authz: Autorizacao = Depends(get_autorizacao),
+):
+    authz.exigir_empresa(empresa_id, "Sem acesso à empresa")
+
+    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+    if not empresa:
+        raise HTTPException(404, "Empresa não encontrada")
+    if not empresa.nibo_api_token:
+        raise HTTPException(400, "Empresa não possui token Nibo salvo")
+
+    # completo=true força a reconciliação de todo o histórico
+    job = job_service.enfileirar(
+        db, job_service.TIPO_REFRESH, authz.user_id, empresa_id, {"completo": completo}
+    )
+    db.commit()
+
+    return {
+        "status": "processando",
+        "empresa_id": empresa_id,
+        "job_id": job.id,
+    }
+
+
+# ---------------------------------------------------------------------------
+# JOBS (acompanhamento de importação / refresh)
+# ---------------------------------------------------------------------------
+@router.get("/jobs/{job_id}", response_model=schemas.NiboJobOut)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    authz: Autorizacao = Depends(get_autorizacao),
+):
+    job = db.get(NiboJob, job_id)
+    # quem enfileirou sempre vê (o vínculo user–empresa da importação só nasce no worker)
+    if not job or (job.usuario_id != authz.user_id and not authz.pode_empresa(job.empresa_id)):
+        raise HTTPException(404, "Job não encontrado")
+    return job
+
 
 # ---------------------------------------------------------------------------
 # LISTAGENS / CRUD mantidos
@@ -156,14 +168,13 @@ def update_empresa(
     empresa_id: int,
     empresa_data: schemas.EmpresaUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
     if not empresa:
         raise HTTPException(404, "Empresa não encontrada")
 
-    if not user_has_access(db, current_user.id, empresa_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_empresa(empresa_id, "Acesso negado")
 
     for key, value in empresa_data.model_dump(exclude_unset=True).items():
         setattr(empresa, key, value)
@@ -177,16 +188,18 @@ def update_empresa(
 def delete_empresa(
     empresa_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
     if not empresa:
         raise HTTPException(404, "Empresa não encontrada")
 
-    if not user_has_access(db, current_user.id, empresa_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_empresa(empresa_id, "Acesso negado")
 
     db.delete(empresa)
+    invalidar_empresas(db, empresa_id)
+    # vínculos user–empresa somem em cascata
+    principal_cache.invalidar(db)
     db.commit()
 
     return empresa
@@ -197,32 +210,29 @@ def delete_empresa(
 @router.get("/me", response_model=list[schemas.EmpresaOut])
 def list_minhas_empresas(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     # Retorna todas as empresas vinculadas ao usuário
-    return [ue.empresa for ue in current_user.empresas]
+    return db.query(Empresa).filter(Empresa.id.in_(authz.empresa_ids)).all()
 
 
 @router.get("/", response_model=list[schemas.EmpresaOut])
 def list_empresas(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
-    # Pega IDs de empresas vinculadas ao usuário
-    empresa_ids = [ue.empresa_id for ue in current_user.empresas]
     # Retorna apenas empresas vinculadas
-    return db.query(Empresa).filter(Empresa.id.in_(empresa_ids)).all()
+    return db.query(Empresa).filter(Empresa.id.in_(authz.empresa_ids)).all()
 
 
 @router.get("/{empresa_id}", response_model=schemas.EmpresaPrivateOut)
 def get_empresa(
     empresa_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     # Checa se o usuário tem acesso
-    if not user_has_access(db, current_user.id, empresa_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_empresa(empresa_id, "Acesso negado")
 
     empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
     if not empresa:
@@ -240,10 +250,9 @@ def update_nibo_token(
     empresa_id: int,
     token: schemas.NiboTokenUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
-    if not user_has_access(db, current_user.id, empresa_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_empresa(empresa_id, "Acesso negado")
 
     empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
     if not empresa:
@@ -263,10 +272,11 @@ def update_nibo_token(
 @router.get("/{empresa_id}/nibo/schedules")
 async def nibo_schedules(
     empresa_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
-    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+    authz.exigir_empresa(empresa_id)
+    empresa = await db.get(Empresa, empresa_id)
     if not empresa or not empresa.nibo_company_id:
         raise HTTPException(400, "Token Nibo não configurado")
 
@@ -274,8 +284,9 @@ async def nibo_schedules(
 
 
 @router.get("/{empresa_id}/nibo/receipts")
-async def nibo_receipts(empresa_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+async def nibo_receipts(empresa_id: int, db: AsyncSession = Depends(get_async_db), authz: Autorizacao = Depends(get_autorizacao)):
+    authz.exigir_empresa(empresa_id)
+    empresa = await db.get(Empresa, empresa_id)
     if not empresa or not empresa.nibo_company_id:
         raise HTTPException(400, "Token Nibo não configurado")
 
@@ -283,8 +294,9 @@ async def nibo_receipts(empresa_id: int, db: Session = Depends(get_db), current_
 
 
 @router.get("/{empresa_id}/nibo/payments")
-async def nibo_payments(empresa_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+async def nibo_payments(empresa_id: int, db: AsyncSession = Depends(get_async_db), authz: Autorizacao = Depends(get_autorizacao)):
+    authz.exigir_empresa(empresa_id)
+    empresa = await db.get(Empresa, empresa_id)
     if not empresa or not empresa.nibo_company_id:
         raise HTTPException(400, "Token Nibo não configurado")
 
@@ -292,8 +304,9 @@ async def nibo_payments(empresa_id: int, db: Session = Depends(get_db), current_
 
 
 @router.get("/{empresa_id}/nibo/costcenters")
-async def nibo_costcenters(empresa_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+async def nibo_costcenters(empresa_id: int, db: AsyncSession = Depends(get_async_db), authz: Autorizacao = Depends(get_autorizacao)):
+    authz.exigir_empresa(empresa_id)
+    empresa = await db.get(Empresa, empresa_id)
     if not empresa or not empresa.nibo_company_id:
         raise HTTPException(400, "Token Nibo não configurado")
 
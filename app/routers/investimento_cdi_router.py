@@ -1,11 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, select
+from datetime import date
 
 from app.core.deps import get_db
-from app.models import InvestimentoCDI, Movimentacao, Ativo, CDI
+from app.models import InvestimentoCDI, Ativo, Movimentacao, MovimentacaoMensal
 from app.schemas import investimento_cdi as schemas
 from app.schemas.ativos import AtivoOut
+from app.services.cdi_cache import cdi_cache
+from app.services.response_cache import (
+    response_cache,
+    invalidar_ativo,
+    chave_empresa,
+    CHAVE_TODAS_EMPRESAS,
+    CHAVE_CDI,
+)
 
 router = APIRouter(prefix="/investimentos", tags=["Investimentos"])
 
@@ -47,6 +56,7 @@ def create_investimento_cdi(
     )
 
     db.add(obj)
+    invalidar_ativo(db, obj.ativo_id)
     db.commit()
     db.refresh(obj)
     return obj
@@ -69,9 +79,13 @@ def update_investimento_cdi(
         update_data["ano"] = update_data["data"].year
         update_data["mes"] = update_data["data"].month
 
+    ativo_anterior = obj.ativo_id
     for key, value in update_data.items():
         setattr(obj, key, value)
 
+    invalidar_ativo(db, ativo_anterior)
+    if obj.ativo_id != ativo_anterior:
+        invalidar_ativo(db, obj.ativo_id)
     db.commit()
     db.refresh(obj)
     return obj
@@ -84,6 +98,7 @@ def delete_investimento_cdi(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Investimento CDI não encontrado")
 
     db.delete(obj)
+    invalidar_ativo(db, obj.ativo_id)
     db.commit()
     return obj
 
@@ -95,78 +110,134 @@ def delete_investimento_cdi(id: int, db: Session = Depends(get_db)):
 # ---------------------------
 # 1. REAL do ativo
 # ---------------------------
-@router.get("/real/{ativo_id}")
-def get_real_do_ativo(ativo_id: int, db: Session = Depends(get_db)):
-    movs = (
-        db.query(Movimentacao)
-          .filter(Movimentacao.ativo_id == ativo_id)
-          .order_by(Movimentacao.data_movimentacao)
-          .all()
-    )
-
-    resultado = []
-    acumulado = 0
+def _chaves_do_ativo(db: Session, ativo_id: int, *extras: str) -> list:
+    empresa_id = db.scalar(select(Ativo.empresa_id).where(Ativo.id == ativo_id))
+    return [chave_empresa(empresa_id), *extras]
 
-    for m in movs:
-        valor = float(m.valor or 0)
-        acumulado += valor
-
-        resultado.append({
-            "data": m.data_movimentacao.replace(day=1),
-            "valor": valor,
-            "acumulado": acumulado
-        })
 
-    return resultado
+@router.get("/real/{ativo_id}")
+def get_real_do_ativo(ativo_id: int, request: Request, db: Session = Depends(get_db)):
+    def gerar():
+        # uma linha por movimentação; o acumulado sai da window function
+        valor = func.coalesce(Movimentacao.valor, 0)
+        movs = db.execute(
+            select(
+                Movimentacao.data_movimentacao,
+                valor,
+                func.sum(valor).over(order_by=(Movimentacao.data_movimentacao, Movimentacao.id)),
+            )
+            .where(Movimentacao.ativo_id == ativo_id)
+            .order_by(Movimentacao.data_movimentacao, Movimentacao.id)
+        )
+
+        return [
+            {
+                "data": data.replace(day=1),
+                "valor": float(valor),
+                "acumulado": float(acumulado)
+            }
+            for data, valor, acumulado in movs
+        ]
+
+    return response_cache.responder(request, db, gerar, _chaves_do_ativo(db, ativo_id))
+
+
+@router.get("/real/{ativo_id}/mensal")
+def get_real_mensal_do_ativo(ativo_id: int, request: Request, db: Session = Depends(get_db)):
+    def gerar():
+        # lido do rollup mensal: O(meses), não O(movimentações)
+        meses = db.execute(
+            select(MovimentacaoMensal.mes, MovimentacaoMensal.liquido, MovimentacaoMensal.acumulado)
+            .where(MovimentacaoMensal.ativo_id == ativo_id)
+            .order_by(MovimentacaoMensal.mes)
+        )
+
+        return [
+            {
+                "data": mes,
+                "valor": float(liquido or 0),
+                "acumulado": float(acumulado or 0)
+            }
+            for mes, liquido, acumulado in meses
+        ]
+
+    return response_cache.responder(request, db, gerar, _chaves_do_ativo(db, ativo_id))
 
 
 # ---------------------------
 # 2. Comparativo CDI x REAL
 # ---------------------------
 @router.get("/comparativo/{ativo_id}")
-def comparativo_cdi_real(ativo_id: int, db: Session = Depends(get_db)):
-    # puxar o ativo para pegar o total
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
-    total_ativo = float(ativo.total or 0)
-
-    cdi_rows = (
-        db.query(InvestimentoCDI)
-        .filter(InvestimentoCDI.ativo_id == ativo_id)
-        .order_by(InvestimentoCDI.data)
-        .all()
+def comparativo_cdi_real(
+    ativo_id: int,
+    request: Request,
+    inicio: date | None = None,
+    fim: date | None = None,
+    db: Session = Depends(get_db),
+):
+    return response_cache.responder(
+        request,
+        db,
+        lambda: _calcular_comparativo(db, ativo_id, inicio, fim),
+        _chaves_do_ativo(db, ativo_id, CHAVE_CDI),
     )
 
-    movs = (
-        db.query(Movimentacao)
-        .filter(Movimentacao.ativo_id == ativo_id)
-        .all()
+
+def _calcular_comparativo(db: Session, ativo_id: int, inicio: date | None, fim: date | None):
+    """
+    Série mensal CDI x REAL, calculada no banco: o real mensal vem do rollup
+    movimentacao_mensal e é acumulado com window function sobre os meses de
+    investimento_cdi. `inicio`/`fim` recortam o período sem alterar o acumulado.
+    """
+    # total do ativo, sem carregar o objeto inteiro
+    total_ativo = float(db.scalar(select(Ativo.total).where(Ativo.id == ativo_id)) or 0)
+
+    real = (
+        select(MovimentacaoMensal.mes, MovimentacaoMensal.liquido.label("valor"))
+        .where(MovimentacaoMensal.ativo_id == ativo_id)
+        .subquery()
+    )
+    real_mes = func.coalesce(real.c.valor, 0)
+
+    serie = (
+        select(
+            InvestimentoCDI.data,
+            InvestimentoCDI.valor_compra_ativo,
+            InvestimentoCDI.cdi_mes,
+            InvestimentoCDI.rendimento_cdi_mes,
+            InvestimentoCDI.rendimento_cdi_acumulado,
+            real_mes.label("rent_real"),
+            func.sum(real_mes).over(order_by=InvestimentoCDI.data).label("rent_real_acum"),
+        )
+        .select_from(InvestimentoCDI)
+        .outerjoin(real, real.c.mes == InvestimentoCDI.data)
+        .where(InvestimentoCDI.ativo_id == ativo_id)
     )
+    # meses posteriores a `fim` não influenciam o acumulado: corta já aqui
+    if fim:
+        serie = serie.where(InvestimentoCDI.data <= fim)
+    serie = serie.subquery()
 
-    real_map = {}
-    for m in movs:
-        mes = m.data_movimentacao.replace(day=1)
-        real_map.setdefault(mes, 0)
-        real_map[mes] += float(m.valor or 0)
+    query = select(serie).order_by(serie.c.data)
+    if inicio:
+        query = query.where(serie.c.data >= inicio.replace(day=1))
 
     comparativo = []
-    real_acum = 0
-
-    for linha in cdi_rows:
-        mes = linha.data
-        real_mes = real_map.get(mes, 0)
-        real_acum += real_mes
+    for linha in db.execute(query):
+        rent_cdi = float(linha.rendimento_cdi_mes or 0)
+        rent_real = float(linha.rent_real or 0)
 
         comparativo.append({
-            "data": mes,
+            "data": linha.data,
             "valor_compra_ativo": float(linha.valor_compra_ativo),
             "cdi_mes": float(linha.cdi_mes or 0),
-            "rent_cdi": float(linha.rendimento_cdi_mes or 0),
+            "rent_cdi": rent_cdi,
             "rent_cdi_acum": float(linha.rendimento_cdi_acumulado or 0),
 
-            "rent_real": real_mes,
-            "rent_real_acum": real_acum,
+            "rent_real": rent_real,
+            "rent_real_acum": float(linha.rent_real_acum or 0),
 
-            "diferenca": real_mes - float(linha.rendimento_cdi_mes or 0),
+            "diferenca": rent_real - rent_cdi,
 
             # 🔥 campo novo — agora o front consegue pegar!
             "total_ativo": total_ativo
@@ -206,6 +277,7 @@ def get_enums():
 # ----------------------------------------------------
 @router.get("/overview")
 def investimentos_overview(
+    request: Request,
     status: str | None = None,
     tipo: str | None = None,
     finalidade: str | None = None,
@@ -213,7 +285,17 @@ def investimentos_overview(
     potencial: str | None = None,
     db: Session = Depends(get_db)
 ):
+    # filtros entram na chave pela query string; a lista cobre os ativos de
+    # todas as empresas, então vale a versão somada delas
+    return response_cache.responder(
+        request,
+        db,
+        lambda: _calcular_overview(db, status, tipo, finalidade, grau_desmobilizacao, potencial),
+        [CHAVE_TODAS_EMPRESAS],
+    )
+
 
+def _calcular_overview(db: Session, status, tipo, finalidade, grau_desmobilizacao, potencial):
     query = db.query(Ativo)
 
     if status:
@@ -255,13 +337,14 @@ def investimentos_overview(
 # 6. EVOLUÇÃO DO CDI — gráfico puro
 # ----------------------------------------------------
 @router.get("/evolucao-cdi")
-def evolucao_cdi(db: Session = Depends(get_db)):
-    cdis = db.query(CDI).order_by(CDI.data).all()
-
-    return [
-        {
-            "data": c.data,
-            "cdi": float(c.cdi_am or 0)
-        }
-        for c in cdis
-    ]
+def evolucao_cdi(request: Request, db: Session = Depends(get_db)):
+    def gerar():
+        return [
+            {
+                "data": c.data,
+                "cdi": float(c.cdi_am or 0)
+            }
+            for c in cdi_cache.registros(db)
+        ]
+
+    return response_cache.responder(request, db, gerar, [CHAVE_CDI])
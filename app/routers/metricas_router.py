@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+
+from app.core.hashing import pool_senhas
+from app.database import metricas_pools
+from app.core.principal import Principal
+from app.core.security import get_admin_principal
+
+router = APIRouter(prefix="/metricas", tags=["Métricas"])
+
+
+@router.get("/senhas")
+def metricas_senhas(admin: Principal = Depends(get_admin_principal)):
+    """Fila e tempos do pool de hash de senhas (bcrypt)."""
+    return pool_senhas.metricas()
+
+
+@router.get("/db")
+def metricas_db(admin: Principal = Depends(get_admin_principal)):
+    """Uso e espera por conexão de cada pool (api / worker, sync e async)."""
+    return metricas_pools()
@@ -1,53 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import base64
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, load_only, selectinload
 
 from app.core.deps import get_db
-from app.core.security import get_current_user
-from app.models import User, Movimentacao, Ativo, UserEmpresa, MovimentacaoAtivo
+from app.core.authz import Autorizacao, get_autorizacao
+from app.models import Movimentacao, Ativo, MovimentacaoAtivo
+from app.services.investimento_cdi_service import marcar_cdi_pendente, recalcular_ou_manter_pendente
+from app.services import movimentacao_mensal_service
+from app.services.response_cache import invalidar_ativo
 from app import schemas
 
 router = APIRouter(prefix="/movimentacoes", tags=["Movimentações"])
 
 
-def user_has_access_to_ativo(db: Session, user_id: int, ativo_id: int) -> bool:
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
-    if not ativo:
-        return False
+def _marcar_alteracao(db: Session, ativo_id: int, desde):
+    # vai no commit da movimentação: a série de CDI fica pendente a partir
+    # do mês alterado mesmo que o recálculo logo depois falhe
+    marcar_cdi_pendente(db, ativo_id, desde)
+    invalidar_ativo(db, ativo_id)
 
-    return (
-        db.query(UserEmpresa)
-        .filter_by(user_id=user_id, empresa_id=ativo.empresa_id)
-        .first()
-        is not None
-    )
+
+# ---------------------------------------------------------------------------
+# LISTAGEM (keyset em (data_movimentacao, id), mais recentes primeiro)
+# ---------------------------------------------------------------------------
+CAMPOS_MOVIMENTACAO = set(schemas.MovimentacaoOut.model_fields)
+
+
+def _encode_cursor(mov: Movimentacao) -> str:
+    raw = f"{mov.data_movimentacao.isoformat()}|{mov.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        data_str, id_str = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(data_str), int(id_str)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(400, "Cursor inválido")
+
+
+def _serializar(mov: Movimentacao, campos: Optional[set[str]]) -> dict:
+    if campos is None:
+        return schemas.MovimentacaoOut.model_validate(mov, from_attributes=True).model_dump()
+
+    item = {}
+    for campo in campos:
+        if campo == "movimentacao_ativos":
+            item[campo] = [
+                schemas.MovimentacaoAtivoRead.model_validate(ma, from_attributes=True).model_dump()
+                for ma in mov.movimentacao_ativos
+            ]
+        else:
+            item[campo] = getattr(mov, campo)
+    return item
 
 
-@router.get("/", response_model=list[schemas.MovimentacaoOut])
+@router.get("/", response_model=schemas.MovimentacaoPage)
 def list_movimentacoes(
+    empresa_id: Optional[int] = None,
+    ativo_id: Optional[int] = None,
+    data_inicio: Optional[date] = None,
+    data_fim: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    fields: Optional[str] = Query(None, description="Campos separados por vírgula (ex: id,valor,data_movimentacao)"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
-    return (
+    campos = None
+    if fields:
+        campos = {f.strip() for f in fields.split(",") if f.strip()}
+        invalidos = campos - CAMPOS_MOVIMENTACAO
+        if invalidos:
+            raise HTTPException(400, f"Campos inválidos: {', '.join(sorted(invalidos))}")
+        campos.add("id")
+
+    query = (
         db.query(Movimentacao)
         .join(Ativo)
-        .join(UserEmpresa, UserEmpresa.empresa_id == Ativo.empresa_id)
-        .filter(UserEmpresa.user_id == current_user.id)
+        .filter(Ativo.empresa_id.in_(authz.empresa_ids))
+    )
+
+    if empresa_id is not None:
+        query = query.filter(Ativo.empresa_id == empresa_id)
+    if ativo_id is not None:
+        query = query.filter(Movimentacao.ativo_id == ativo_id)
+    if data_inicio is not None:
+        query = query.filter(Movimentacao.data_movimentacao >= data_inicio)
+    if data_fim is not None:
+        query = query.filter(Movimentacao.data_movimentacao <= data_fim)
+
+    if cursor:
+        cursor_data, cursor_id = _decode_cursor(cursor)
+        query = query.filter(
+            tuple_(Movimentacao.data_movimentacao, Movimentacao.id) < tuple_(cursor_data, cursor_id)
+        )
+
+    if campos is not None:
+        # só as colunas pedidas (+ as do cursor)
+        colunas = [
+            getattr(Movimentacao, c)
+            for c in campos | {"data_movimentacao"}
+            if c != "movimentacao_ativos"
+        ]
+        query = query.options(load_only(*colunas))
+
+    if campos is None or "movimentacao_ativos" in campos:
+        query = query.options(selectinload(Movimentacao.movimentacao_ativos))
+
+    movs = (
+        query.order_by(Movimentacao.data_movimentacao.desc(), Movimentacao.id.desc())
+        .limit(limit + 1)
         .all()
     )
 
+    next_cursor = None
+    if len(movs) > limit:
+        movs = movs[:limit]
+        next_cursor = _encode_cursor(movs[-1])
+
+    return {
+        "items": [_serializar(m, campos) for m in movs],
+        "next_cursor": next_cursor,
+    }
+
 
 @router.get("/{mov_id}", response_model=schemas.MovimentacaoOut)
 def get_movimentacao(
     mov_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     mov = db.query(Movimentacao).filter(Movimentacao.id == mov_id).first()
     if not mov:
         raise HTTPException(404, "Movimentação não encontrada")
 
-    if not user_has_access_to_ativo(db, current_user.id, mov.ativo_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_ativo(mov.ativo_id, "Acesso negado")
 
     return mov
 
@@ -56,14 +148,13 @@ def get_movimentacao(
 def create_movimentacao(
     data: schemas.MovimentacaoCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
-    ativo = db.query(Ativo).filter(Ativo.id == data.ativo_id).first()
+    ativo = authz.obter_ativo(data.ativo_id)
     if not ativo:
         raise HTTPException(400, "ativo_id inexistente")
 
-    if not user_has_access_to_ativo(db, current_user.id, data.ativo_id):
-        raise HTTPException(403, "Acesso negado ao ativo")
+    authz.exigir_empresa(ativo.empresa_id, "Acesso negado ao ativo")
 
     mov = Movimentacao(**data.model_dump())
     db.add(mov)
@@ -77,8 +168,12 @@ def create_movimentacao(
     tipo="Recebimento" if mov.valor >= 0 else "Pagamento"
 )
     db.add(mov_ativo)
+    movimentacao_mensal_service.registrar_movimentacao(db, mov.ativo_id, mov.data_movimentacao, mov.valor)
+    _marcar_alteracao(db, mov.ativo_id, mov.data_movimentacao)
     db.commit()
 
+    recalcular_ou_manter_pendente(db, [mov.ativo_id])
+
     return mov
 
 
@@ -87,20 +182,32 @@ def update_movimentacao(
     mov_id: int,
     data: schemas.MovimentacaoBase,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     mov = db.query(Movimentacao).filter(Movimentacao.id == mov_id).first()
     if not mov:
         raise HTTPException(404, "Movimentação não encontrada")
 
-    if not user_has_access_to_ativo(db, current_user.id, mov.ativo_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_ativo(mov.ativo_id, "Acesso negado")
+
+    data_anterior = mov.data_movimentacao
+    valor_anterior = mov.valor
 
     for k, v in data.model_dump(exclude_unset=True).items():
         setattr(mov, k, v)
 
+    # rollup: sai a versão antiga, entra a nova
+    deltas: movimentacao_mensal_service.Deltas = {}
+    movimentacao_mensal_service.acumular(deltas, mov.ativo_id, data_anterior, valor_anterior, sinal=-1)
+    movimentacao_mensal_service.acumular(deltas, mov.ativo_id, mov.data_movimentacao, mov.valor)
+    movimentacao_mensal_service.aplicar_deltas(db, deltas)
+    _marcar_alteracao(db, mov.ativo_id, min(data_anterior, mov.data_movimentacao))
+
     db.commit()
     db.refresh(mov)
+
+    recalcular_ou_manter_pendente(db, [mov.ativo_id])
+
     return mov
 
 
@@ -108,16 +215,19 @@ def update_movimentacao(
 def delete_movimentacao(
     mov_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    authz: Autorizacao = Depends(get_autorizacao),
 ):
     mov = db.query(Movimentacao).filter(Movimentacao.id == mov_id).first()
     if not mov:
         raise HTTPException(404, "Movimentação não encontrada")
 
-    if not user_has_access_to_ativo(db, current_user.id, mov.ativo_id):
-        raise HTTPException(403, "Acesso negado")
+    authz.exigir_ativo(mov.ativo_id, "Acesso negado")
 
     db.delete(mov)
+    movimentacao_mensal_service.registrar_movimentacao(db, mov.ativo_id, mov.data_movimentacao, mov.valor, sinal=-1)
+    _marcar_alteracao(db, mov.ativo_id, mov.data_movimentacao)
     db.commit()
 
+    recalcular_ou_manter_pendente(db, [mov.ativo_id])
+
     return mov
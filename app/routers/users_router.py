@@ -1,25 +1,25 @@
 # app/api/users.py
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.core.deps import get_db
-from app.core.security import get_current_user, hash_password
+from app.core.principal import Principal, principal_cache
+from app.core.hashing import hash_senha
+from app.core.security import get_current_user, get_current_principal
 from app import models, schemas
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-@router.get("/me/profile", response_model=schemas.UserOut)
-def get_my_profile(current_user: models.User = Depends(get_current_user)):
-    return current_user
-
 
-@router.put("/me/profile", response_model=schemas.UserOut)
-def update_my_profile(
-    user_data: schemas.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
-):
-    data = user_data.dict(exclude_unset=True)
+# Rotas que gravam senha são async: o bcrypt roda no pool de senhas
+# (app.core.hashing) e o acesso ao banco no threadpool.
+def _atualizar_usuario(db: Session, user_id: int, data: dict, senha_hash: Optional[str]):
+    user = db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     # email lower e sem duplicidade
     if "email" in data:
@@ -27,38 +27,46 @@ def update_my_profile(
 
         ja_existe = db.query(models.User).filter(
             models.User.email == data["email"],
-            models.User.id != current_user.id
+            models.User.id != user_id
         ).first()
 
         if ja_existe:
             raise HTTPException(400, "Email já cadastrado por outro usuário")
 
-    # atualizar senha
-    if "password" in data:
-        current_user.senha = hash_password(data.pop("password"))
+    # senha
+    if senha_hash:
+        user.senha = senha_hash
 
-    # atualizar demais campos
+    # demais campos
     for key, value in data.items():
-        setattr(current_user, key, value)
+        setattr(user, key, value)
 
+    principal_cache.invalidar(db, user_id)
     db.commit()
-    db.refresh(current_user)
+    db.refresh(user)
+    return user
+
+@router.get("/me/profile", response_model=schemas.UserOut)
+def get_my_profile(current_user: models.User = Depends(get_current_user)):
     return current_user
 
-@router.post("/", response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    email = user.email.lower()
 
-    db_user = db.query(models.User).filter(models.User.email == email).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Email já cadastrado")
+@router.put("/me/profile", response_model=schemas.UserOut)
+async def update_my_profile(
+    user_data: schemas.UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    data = user_data.dict(exclude_unset=True)
+    senha_hash = await hash_senha(data.pop("password")) if "password" in data else None
+    return await run_in_threadpool(_atualizar_usuario, db, current_user.id, data, senha_hash)
 
-    hashed = hash_password(user.password)
 
+def _criar_usuario(db: Session, nome: str, email: str, senha_hash: str):
     new_user = models.User(
-        nome=user.nome,
+        nome=nome,
         email=email,
-        senha=hashed
+        senha=senha_hash
     )
 
     db.add(new_user)
@@ -67,13 +75,28 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return new_user
 
 
+def _email_cadastrado(db: Session, email: str) -> bool:
+    return db.query(models.User.id).filter(models.User.email == email).first() is not None
+
+
+@router.post("/", response_model=schemas.UserOut)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    email = user.email.lower()
+
+    if await run_in_threadpool(_email_cadastrado, db, email):
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
+
+    hashed = await hash_senha(user.password)
+    return await run_in_threadpool(_criar_usuario, db, user.nome, email, hashed)
+
+
 @router.get("/", response_model=list[schemas.UserOut])
-def get_users(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_users(db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     return db.query(models.User).all()
 
 
 @router.get("/{user_id}", response_model=schemas.UserOut)
-def get_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_user(user_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -81,44 +104,19 @@ def get_user(user_id: int, db: Session = Depends(get_db), current_user: models.U
 
 
 @router.delete("/{user_id}", response_model=schemas.UserOut)
-def delete_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_user(user_id: int, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
     db.delete(user)
+    principal_cache.invalidar(db, user_id)
     db.commit()
     return user
 
 
 @router.put("/{user_id}", response_model=schemas.UserOut)
-def update_user(user_id: int, user_data: schemas.UserUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuário não encontrado")
-
+async def update_user(user_id: int, user_data: schemas.UserUpdate, db: Session = Depends(get_db), current_user: Principal = Depends(get_current_principal)):
     data = user_data.dict(exclude_unset=True)
-
-    # email lower e sem duplicidade
-    if "email" in data:
-        data["email"] = data["email"].lower()
-
-        ja_existe = db.query(models.User).filter(
-            models.User.email == data["email"],
-            models.User.id != user_id
-        ).first()
-
-        if ja_existe:
-            raise HTTPException(400, "Email já cadastrado por outro usuário")
-
-    # senha
-    if "password" in data:
-        user.senha = hash_password(data.pop("password"))
-
-    # demais campos
-    for key, value in data.items():
-        setattr(user, key, value)
-
-    db.commit()
-    db.refresh(user)
-    return user
+    senha_hash = await hash_senha(data.pop("password")) if "password" in data else None
+    return await run_in_threadpool(_atualizar_usuario, db, user_id, data, senha_hash)
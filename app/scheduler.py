@@ -0,0 +1,190 @@
+# app/scheduler.py
+"""
+Refresh agendado de todas as empresas com token Nibo.
+
+    python -m app.scheduler            # roda em loop, um ciclo a cada SCHEDULER_INTERVALO_MINUTOS
+    python -m app.scheduler --uma-vez  # um ciclo só (cron)
+
+Cada ciclo ordena as empresas pela mais desatualizada (último sync mais
+antigo primeiro), espaça os inícios e limita a concorrência global e por
+token. Cada refresh vira um NiboJob (mesma tabela do worker), que guarda
+duração, progresso e erro por empresa; falhas transitórias voltam para a
+fila e são retomadas pelos workers.
+"""
+import argparse
+import asyncio
+import random
+import signal
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select, exists, or_
+
+from app.core.config import settings
+from app import database
+from app.migrations import verificar as verificar_schema
+from app.database import SessionLocal
+from app.models import Empresa, EmpresaNiboSync, NiboJob
+from app.services import job_service
+from app.services.nibo_service import nibo_service
+from app.worker import rodar_job
+
+
+class EmpresaAgendada(NamedTuple):
+    id: int
+    usuario_id: int
+    token: str
+
+
+def empresas_para_refresh(db) -> List[EmpresaAgendada]:
+    """
+    Empresas com token, sem job em aberto e não sincronizadas recentemente,
+    da mais desatualizada para a mais recente (nunca sincronizadas primeiro).
+    """
+    limite = datetime.now(timezone.utc) - timedelta(minutes=settings.SCHEDULER_IDADE_MINIMA_MINUTOS)
+    job_aberto = exists().where(
+        NiboJob.empresa_id == Empresa.id,
+        NiboJob.status.in_((job_service.PENDENTE, job_service.EXECUTANDO)),
+    )
+
+    rows = db.execute(
+        select(Empresa.id, Empresa.usuario_id, Empresa.nibo_api_token)
+        .outerjoin(EmpresaNiboSync, EmpresaNiboSync.empresa_id == Empresa.id)
+        .where(
+            Empresa.nibo_api_token.isnot(None),
+            Empresa.nibo_api_token != "",
+            ~job_aberto,
+            or_(EmpresaNiboSync.ultimo_sync_em.is_(None), EmpresaNiboSync.ultimo_sync_em < limite),
+        )
+        .order_by(EmpresaNiboSync.ultimo_sync_em.asc().nulls_first(), Empresa.id)
+    )
+    return [EmpresaAgendada(*row) for row in rows]
+
+
+def _criar_job_agendado(empresa: EmpresaAgendada) -> Optional[NiboJob]:
+    db = SessionLocal()
+    try:
+        job = job_service.criar(
+            db,
+            job_service.TIPO_REFRESH,
+            empresa.usuario_id,
+            empresa.id,
+            {"agendado": True},
+            iniciar=True,
+        )
+        db.commit()
+        return job
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _listar_empresas() -> List[EmpresaAgendada]:
+    db = SessionLocal()
+    try:
+        return empresas_para_refresh(db)
+    finally:
+        db.close()
+
+
+async def _esperar(parar: asyncio.Event, segundos: float) -> bool:
+    """Espera `segundos` ou até o sinal de parada. True se deve parar."""
+    try:
+        await asyncio.wait_for(parar.wait(), timeout=segundos)
+    except asyncio.TimeoutError:
+        pass
+    return parar.is_set()
+
+
+async def refresh_empresa(
+    empresa: EmpresaAgendada,
+    atraso: float,
+    global_sem: asyncio.Semaphore,
+    token_sems: Dict[str, asyncio.Semaphore],
+    parar: asyncio.Event,
+):
+    # com SIGTERM, empresas que ainda não começaram ficam para o próximo ciclo
+    if await _esperar(parar, atraso):
+        return
+
+    token_sem = token_sems.setdefault(empresa.token, asyncio.Semaphore(settings.SCHEDULER_MAX_POR_TOKEN))
+    async with global_sem, token_sem:
+        if parar.is_set():
+            return
+        try:
+            # já nasce executando: nenhum worker pega este job. None se alguém
+            # enfileirou um sync da empresa entre a seleção e agora
+            job = await asyncio.to_thread(_criar_job_agendado, empresa)
+            if job is None:
+                return
+            await rodar_job(job)
+        except Exception as e:
+            print(f"❌ Refresh agendado da empresa {empresa.id} falhou: {e}")
+
+
+async def ciclo(parar: asyncio.Event):
+    """Um ciclo de refresh. Retorna quando todos os jobs iniciados terminam."""
+    empresas = await asyncio.to_thread(_listar_empresas)
+
+    if not empresas:
+        print("🕒 Nenhuma empresa para atualizar")
+        return
+
+    print(f"🕒 Refresh agendado de {len(empresas)} empresa(s)")
+    inicio = time.monotonic()
+
+    global_sem = asyncio.Semaphore(settings.SCHEDULER_MAX_CONCORRENCIA)
+    token_sems: Dict[str, asyncio.Semaphore] = {}
+    # o último início cabe no intervalo do ciclo, com qualquer número de empresas
+    stagger = min(settings.SCHEDULER_STAGGER_SECONDS, settings.SCHEDULER_INTERVALO_MINUTOS * 60 / len(empresas))
+
+    await asyncio.gather(*(
+        refresh_empresa(
+            empresa,
+            # espaça os inícios na ordem de prioridade, com jitter para não alinhar rajadas
+            i * stagger + random.uniform(0, stagger),
+            global_sem,
+            token_sems,
+            parar,
+        )
+        for i, empresa in enumerate(empresas)
+    ))
+
+    if parar.is_set():
+        print(f"🕒 Ciclo interrompido após {time.monotonic() - inicio:.1f}s (jobs em andamento concluídos)")
+    else:
+        print(f"🕒 Ciclo concluído em {time.monotonic() - inicio:.1f}s")
+
+
+async def main(uma_vez: bool = False):
+    database.usar_pool_worker()
+    verificar_schema(database.engine)
+
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            # não inicia novos refreshes e termina os que estão rodando antes de sair
+            loop.add_signal_handler(sig, parar.set)
+        except NotImplementedError:
+            pass
+
+    await nibo_service.start()
+    try:
+        while not parar.is_set():
+            await ciclo(parar)
+            if uma_vez or await _esperar(parar, settings.SCHEDULER_INTERVALO_MINUTOS * 60):
+                break
+    finally:
+        await nibo_service.close()
+        await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh agendado das empresas na Nibo")
+    parser.add_argument("--uma-vez", action="store_true", help="executa um único ciclo e sai")
+    args = parser.parse_args()
+    asyncio.run(main(uma_vez=args.uma_vez))
@@ -2,8 +2,9 @@ from .token import Token, TokenWithEmpresas
 from .user import UserBase, UserCreate, UserUpdate, UserOut, LoginSchema
 from .empresa import EmpresaCreate, EmpresaOut,EmpresaResumoOut, NiboTokenUpdate, EmpresaPrivateOut, EmpresaUpdate, EmpresaImportacaoOut, EmpresaImportacaoIn, EmpresaImportToken
 from .ativos import AtivoBase, AtivoCreate, AtivoUpdate, AtivoOut   
-from .movimentacoes import MovimentacaoBase, MovimentacaoCreate, MovimentacaoOut
+from .movimentacoes import MovimentacaoBase, MovimentacaoCreate, MovimentacaoOut, MovimentacaoPage
 from .cdi import CDICreate, CDIOut, CDIUpdate
 from .user_empresa import UserEmpresaCreate, UserEmpresaOut
 from .movimentacao_ativo import MovimentacaoAtivoCreate, MovimentacaoAtivoRead
-from .investimento_cdi import InvestimentoCDIBase, InvestimentoCDICreate, InvestimentoCDIOut # type: ignore
\ No newline at end of file
+from .investimento_cdi import InvestimentoCDIBase, InvestimentoCDICreate, InvestimentoCDIOut # type: ignore
+from .nibo_job import NiboJobOut
@@ -15,5 +15,4 @@ class MovimentacaoAtivoRead(MovimentacaoAtivoBase):
     id: int
     criado_em: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = {"from_attributes": True}
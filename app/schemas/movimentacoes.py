@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field, field_validator
 from decimal import Decimal
 from datetime import date
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from app.schemas.movimentacao_ativo import MovimentacaoAtivoRead
 
 class MovimentacaoBase(BaseModel):
@@ -46,6 +46,12 @@ class MovimentacaoOut(MovimentacaoBase):
     model_config = {"from_attributes": True}
 
 
+class MovimentacaoPage(BaseModel):
+    """Página da listagem (keyset). `next_cursor` é None na última página."""
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
 class MovimentacaoUpdate(BaseModel):
     data_movimentacao: Optional[date] = None
 
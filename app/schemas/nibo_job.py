@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Optional, Any, Dict
+from pydantic import BaseModel
+
+
+class NiboJobOut(BaseModel):
+    id: int
+    tipo: str
+    status: str
+    fase: Optional[str] = None
+    empresa_id: int
+    tentativas: int
+    paginas: int
+    linhas_inseridas: int
+    meses_cdi: int
+    resultado: Optional[Dict[str, Any]] = None
+    erro: Optional[str] = None
+    criado_em: Optional[datetime] = None
+    iniciado_em: Optional[datetime] = None
+    concluido_em: Optional[datetime] = None
+    duracao_ms: Optional[int] = None
+
+    model_config = {"from_attributes": True}
@@ -1,6 +1,10 @@
 from datetime import date
+from sqlalchemy.orm import Session
+
 from app.database import SessionLocal
 from app.models import CDI
+from app.services.cdi_cache import cdi_cache
+from app.services.investimento_cdi_service import marcar_cdi_pendente_todos
 
 
 # ==============================
@@ -14,29 +18,50 @@ DEFAULT_CDI_AM = 0.0083
 DEFAULT_CDI_PERCENTUAL_AM = 0.0083
 
 
-def seed_cdi():
-    db = SessionLocal()
-    try:
-        total_created = 0
+def semear(db: Session) -> int:
+    """
+    Cria os meses de CDI que faltam e marca a série de CDI de todos os ativos
+    como pendente a partir do mais antigo deles (as taxas mudaram). Não faz
+    commit. Retorna quantos criou.
+    """
+    total_created = 0
+    primeiro_mes = None
+
+    # datas já cadastradas em uma única leitura (via cache)
+    existentes = set(cdi_cache.taxas(db))
+
+    for year in range(START_YEAR, END_YEAR + 1):
+        for month in range(1, 13):
+            data = date(year, month, 1)
 
-        for year in range(START_YEAR, END_YEAR + 1):
-            for month in range(1, 13):
-                data = date(year, month, 1)
+            if data in existentes:
+                continue
 
-                exists = db.query(CDI).filter(CDI.data == data).first()
-                if exists:
-                    continue
+            cdi = CDI(
+                data=data,
+                porcentagem=DEFAULT_PORCENTAGEM,
+                cdi_am=DEFAULT_CDI_AM,
+                cdi_percentual_am=DEFAULT_CDI_PERCENTUAL_AM
+            )
 
-                cdi = CDI(
-                    data=data,
-                    porcentagem=DEFAULT_PORCENTAGEM,
-                    cdi_am=DEFAULT_CDI_AM,
-                    cdi_percentual_am=DEFAULT_CDI_PERCENTUAL_AM
-                )
+            db.add(cdi)
+            total_created += 1
+            primeiro_mes = primeiro_mes or data
 
-                db.add(cdi)
-                total_created += 1
+    if total_created:
+        db.flush()
+        marcar_cdi_pendente_todos(db, primeiro_mes)
+        cdi_cache.invalidar(db)
 
+    db.flush()
+    return total_created
+
+
+def seed_cdi():
+    """Roda o seed avulso. No deploy ele é a migração v0004 (python -m app.migrations)."""
+    db = SessionLocal()
+    try:
+        total_created = semear(db)
         db.commit()
         print(f"✅ Seed CDI concluído. Registros criados: {total_created}")
 
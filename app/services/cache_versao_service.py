@@ -0,0 +1,46 @@
+from typing import Dict, Iterable
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import CacheVersao
+
+
+def ler_versao(db: Session, chave: str) -> int:
+    """Versão atual da chave (0 se nunca foi escrita). Uma consulta por PK."""
+    return db.scalar(select(CacheVersao.versao).where(CacheVersao.chave == chave)) or 0
+
+
+def ler_versoes(db: Session, chaves: Iterable[str]) -> Dict[str, int]:
+    chaves = list(chaves)
+    if not chaves:
+        return {}
+    encontradas = dict(
+        db.execute(
+            select(CacheVersao.chave, CacheVersao.versao).where(CacheVersao.chave.in_(chaves))
+        ).all()
+    )
+    return {chave: encontradas.get(chave, 0) for chave in chaves}
+
+
+def ler_versao_prefixo(db: Session, prefixo: str) -> int:
+    """
+    Soma das versões das chaves que começam com `prefixo`. Versões só
+    crescem: qualquer incremento (ou chave nova) muda a soma.
+    """
+    return db.scalar(
+        select(func.coalesce(func.sum(CacheVersao.versao), 0)).where(CacheVersao.chave.startswith(prefixo))
+    )
+
+
+def incrementar_versao(db: Session, *chaves: str):
+    """Incrementa a versão das chaves. Vale quando a transação do chamador fizer commit."""
+    if not chaves:
+        return
+    stmt = pg_insert(CacheVersao).values([{"chave": chave, "versao": 1} for chave in chaves])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["chave"],
+        set_={"versao": CacheVersao.versao + 1, "atualizado_em": func.now()},
+    )
+    db.execute(stmt)
@@ -0,0 +1,98 @@
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, event
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import CDI
+from app.services.cache_versao_service import ler_versao, incrementar_versao
+
+
+CHAVE_VERSAO = "cdi"
+
+
+class CDIRegistro(NamedTuple):
+    id: int
+    data: date
+    porcentagem: Optional[Decimal]
+    cdi_am: Optional[Decimal]
+    cdi_percentual_am: Optional[Decimal]
+
+
+class _Snapshot(NamedTuple):
+    versao: int
+    registros: Tuple[CDIRegistro, ...]   # ordenados por data (asc)
+    taxas: Dict[date, float]             # {1º dia do mês: cdi_am}
+
+
+class CDICache:
+    """
+    Cache read-through da tabela de CDI, por processo.
+
+    A cada CDI_CACHE_CHECK_SECONDS compara a versão local com a de
+    cache_versoes["cdi"] (uma consulta por PK); se outro worker escreveu,
+    recarrega a tabela. Escritas devem chamar `invalidar(db)` antes do commit.
+    """
+
+    def __init__(self, intervalo_verificacao: float):
+        self._intervalo = intervalo_verificacao
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._verificado_em = 0.0
+
+    def _carregar(self, db: Session, versao: int) -> _Snapshot:
+        registros = tuple(
+            CDIRegistro(*row)
+            for row in db.execute(
+                select(CDI.id, CDI.data, CDI.porcentagem, CDI.cdi_am, CDI.cdi_percentual_am)
+                .order_by(CDI.data)
+            )
+        )
+        taxas = {r.data: float(r.cdi_am or 0) for r in registros}
+        return _Snapshot(versao, registros, taxas)
+
+    def _obter(self, db: Session) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._verificado_em < self._intervalo:
+            return snapshot
+
+        with self._lock:
+            versao = ler_versao(db, CHAVE_VERSAO)
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.versao != versao:
+                snapshot = self._carregar(db, versao)
+                self._snapshot = snapshot
+            self._verificado_em = time.monotonic()
+            return snapshot
+
+    # ----------------------------------------
+    # Leitura
+    # ----------------------------------------
+    def registros(self, db: Session) -> Tuple[CDIRegistro, ...]:
+        return self._obter(db).registros
+
+    def taxas(self, db: Session) -> Dict[date, float]:
+        return self._obter(db).taxas
+
+    # ----------------------------------------
+    # Invalidação
+    # ----------------------------------------
+    def invalidar(self, db: Session):
+        """Incrementa a versão no banco (na transação do chamador) e descarta o local."""
+        incrementar_versao(db, CHAVE_VERSAO)
+        self.limpar()
+        # descarta de novo após o commit: uma leitura concorrente pode ter
+        # recarregado os dados antigos enquanto a transação estava aberta
+        event.listen(db, "after_commit", lambda session: self.limpar(), once=True)
+
+    def limpar(self):
+        with self._lock:
+            self._snapshot = None
+            self._verificado_em = 0.0
+
+
+cdi_cache = CDICache(settings.CDI_CACHE_CHECK_SECONDS)
@@ -1,109 +1,368 @@
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case, or_, null, literal, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import date
 from dateutil.relativedelta import relativedelta
+from itertools import accumulate
+from operator import mul
+from typing import Dict, List, Optional, Tuple
 
-from app.models import Ativo, Movimentacao, InvestimentoCDI, CDI
+from app.core.config import settings
+from app.models import Ativo, Movimentacao, InvestimentoCDI, InvestimentoCDIPendente
+from app.services.cdi_cache import cdi_cache
+from app.services.response_cache import invalidar_empresas
 
 
-def gerar_investimento_cdi_para_ativo(db: Session, ativo_id: int):
+MODOS_ACUMULACAO = ("simples", "composto")
+
+
+# ----------------------------------------
+# Helpers
+# ----------------------------------------
+def _meses(inicio: date, fim: date) -> List[date]:
+    """Lista de 1º dias de mês de `inicio` até `fim` (inclusive)."""
+    meses = []
+    current = inicio.replace(day=1)
+    while current <= fim:
+        meses.append(current)
+        current += relativedelta(months=1)
+    return meses
+
+
+def carregar_taxas_cdi(db: Session) -> Dict[date, float]:
+    """Tabela de CDI inteira (via cache do processo): {1º dia do mês: cdi_am}."""
+    return cdi_cache.taxas(db)
+
+
+# ----------------------------------------
+# Motor da série
+# ----------------------------------------
+def calcular_serie_cdi(
+    valor_base: float,
+    taxas: List[float],
+    modo: str = "simples",
+    acumulado_inicial: float = 0.0,
+) -> Tuple[List[float], List[float]]:
     """
-    Gera a série de investimento_cdi para UM ativo, do primeiro mês de movimentação
-    até o mês atual, sem pular nenhum mês.
-    NÃO apaga nada antes — isso é responsabilidade da função de nível empresa.
+    Calcula, em uma passada, os rendimentos mensais e acumulados da série.
+
+    - simples:  rendimento_mes = valor_base * cdi; acumulado = soma corrida
+    - composto: saldo = (valor_base + acumulado_inicial) * prod(1 + cdi);
+                acumulado = saldo - valor_base
+
+    `acumulado_inicial` permite continuar uma série já gravada.
     """
-    ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
-    if not ativo:
-        return
+    if modo not in MODOS_ACUMULACAO:
+        raise ValueError(f"Modo de acumulação inválido: {modo}")
 
-    # valor base vem do ativo
-    valor_base = ativo.valor_compra or 0
+    if not taxas:
+        return [], []
 
-    # pegar movimentação mais antiga
-    mov = (
-        db.query(Movimentacao)
-        .filter(Movimentacao.ativo_id == ativo_id)
-        .order_by(Movimentacao.data_movimentacao.asc())
-        .first()
-    )
+    if modo == "composto":
+        saldo_inicial = valor_base + acumulado_inicial
+        fatores = accumulate((1.0 + t for t in taxas), mul)
+        acumulados = [saldo_inicial * f - valor_base for f in fatores]
+        anteriores = [acumulado_inicial] + acumulados[:-1]
+        rendimentos = [a - b for a, b in zip(acumulados, anteriores)]
+    else:
+        rendimentos = [valor_base * t for t in taxas]
+        acumulados = list(accumulate(rendimentos, initial=acumulado_inicial))[1:]
 
-    if not mov:
-        # sem movimentação, sem CDI
-        return
+    return rendimentos, acumulados
 
-    # mês inicial (1º dia do mês da primeira movimentação)
-    current = mov.data_movimentacao.replace(day=1)
 
-    # mês atual (1º dia do mês corrente)
-    limite = date.today().replace(day=1)
+def _gravar_serie(
+    db: Session,
+    ativo_id: int,
+    valor_base: float,
+    meses: List[date],
+    taxas: List[float],
+    rendimentos: List[float],
+    acumulados: List[float],
+):
+    """Upsert da série inteira em (ativo_id, data) — um único INSERT."""
+    if not meses:
+        return
 
-    acumulado = 0.0
+    stmt = pg_insert(InvestimentoCDI).values([
+        {
+            "ativo_id": ativo_id,
+            "data": mes,
+            "ano": mes.year,
+            "mes": mes.month,
+            "valor_compra_ativo": valor_base,
+            "cdi_mes": taxa,
+            "rendimento_cdi_mes": rendimento,
+            "rendimento_cdi_acumulado": acumulado,
+            "diferenca_rendimento": 0 - rendimento,
+        }
+        for mes, taxa, rendimento, acumulado in zip(meses, taxas, rendimentos, acumulados)
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["ativo_id", "data"],
+        set_={
+            "ano": stmt.excluded.ano,
+            "mes": stmt.excluded.mes,
+            "valor_compra_ativo": stmt.excluded.valor_compra_ativo,
+            "cdi_mes": stmt.excluded.cdi_mes,
+            "rendimento_cdi_mes": stmt.excluded.rendimento_cdi_mes,
+            "rendimento_cdi_acumulado": stmt.excluded.rendimento_cdi_acumulado,
+            "diferenca_rendimento": stmt.excluded.diferenca_rendimento,
+            "atualizado_em": func.now(),
+        },
+    )
+    db.execute(stmt)
 
-    while current <= limite:
-        cdi = db.query(CDI).filter(CDI.data == current).first()
 
-        if cdi:
-            # cdi.cdi_am já é o fator decimal (ex: 0.0076 = 0,76% ao mês)
-            rendimento_mes = float(valor_base) * float(cdi.cdi_am)
-            cdi_mes = float(cdi.cdi_am)
-        else:
-            rendimento_mes = 0.0
-            cdi_mes = 0.0
+def gerar_investimento_cdi_para_ativo(
+    db: Session,
+    ativo_id: int,
+    taxas_cdi: Optional[Dict[date, float]] = None,
+    modo: Optional[str] = None,
+    valor_base: Optional[float] = None,
+    primeira_data: Optional[date] = None,
+    desde: Optional[date] = None,
+    acumulado_inicial: float = 0.0,
+) -> int:
+    """
+    Gera a série de investimento_cdi para UM ativo, do primeiro mês de movimentação
+    (ou de `desde`, continuando de `acumulado_inicial`) até o mês atual, sem pular
+    nenhum mês.
+    NÃO apaga nada antes — isso é responsabilidade de quem chama.
 
-        acumulado += rendimento_mes
+    `taxas_cdi`, `valor_base` e `primeira_data` podem vir pré-carregados pelo
+    chamador para evitar consultas repetidas. Retorna o número de meses gravados.
+    """
+    if valor_base is None:
+        ativo = db.query(Ativo).filter(Ativo.id == ativo_id).first()
+        if not ativo:
+            return 0
+        # valor base vem do ativo
+        valor_base = float(ativo.valor_compra or 0)
 
-        # verifica se já existe registro para esse mês
-        registro = (
-            db.query(InvestimentoCDI)
-            .filter(
-                InvestimentoCDI.ativo_id == ativo_id,
-                InvestimentoCDI.data == current,
-            )
-            .first()
+    if primeira_data is None:
+        # pegar movimentação mais antiga
+        primeira_data = db.scalar(
+            select(func.min(Movimentacao.data_movimentacao))
+            .where(Movimentacao.ativo_id == ativo_id)
         )
 
-        if not registro:
-            registro = InvestimentoCDI(
-                ativo_id=ativo_id,
-                data=current,
-            )
-            db.add(registro)
+    if primeira_data is None:
+        # sem movimentação, sem CDI
+        return 0
 
-        registro.ano = current.year
-        registro.mes = current.month
-        registro.valor_compra_ativo = valor_base
-        registro.cdi_mes = cdi_mes
-        registro.rendimento_cdi_mes = rendimento_mes
-        registro.rendimento_cdi_acumulado = acumulado
-        registro.diferenca_rendimento = 0 - rendimento_mes
+    if taxas_cdi is None:
+        taxas_cdi = carregar_taxas_cdi(db)
 
-        current += relativedelta(months=1)
+    # do 1º mês da primeira movimentação (ou de `desde`) até o mês corrente
+    inicio = primeira_data.replace(day=1)
+    if desde is not None and desde > inicio:
+        inicio = desde.replace(day=1)
 
+    meses = _meses(inicio, date.today())
+    # cdi.cdi_am já é o fator decimal (ex: 0.0076 = 0,76% ao mês)
+    taxas = [taxas_cdi.get(mes, 0.0) for mes in meses]
+
+    rendimentos, acumulados = calcular_serie_cdi(
+        valor_base, taxas, modo or settings.CDI_MODO_ACUMULACAO, acumulado_inicial
+    )
+    _gravar_serie(db, ativo_id, valor_base, meses, taxas, rendimentos, acumulados)
 
-def recalcular_investimentos_cdi_empresa(db: Session, empresa_id: int):
+    return len(meses)
+
+
+# ----------------------------------------
+# Meses pendentes de recálculo (dirty range)
+# ----------------------------------------
+def _on_conflict_mes_mais_antigo(stmt):
+    # NULL (série inteira) prevalece; senão fica o mês mais antigo
+    return stmt.on_conflict_do_update(
+        index_elements=["ativo_id"],
+        set_={
+            "desde": case(
+                (
+                    or_(InvestimentoCDIPendente.desde.is_(None), stmt.excluded.desde.is_(None)),
+                    null(),
+                ),
+                else_=func.least(InvestimentoCDIPendente.desde, stmt.excluded.desde),
+            ),
+            "marcado_em": func.now(),
+        },
+    )
+
+
+def marcar_cdi_pendentes(db: Session, pendentes: Dict[int, Optional[date]]):
     """
-    Estratégia A:
-      - Apaga TODOS os registros de investimento_cdi dos ativos dessa empresa
-      - Recalcula do zero para cada ativo da empresa
+    Marca ativos para recálculo a partir do mês informado ({ativo_id: data}).
+    `None` marca a série inteira (ex: valor_compra alterado).
     """
-    # pega todos os ativos da empresa
-    ativos_ids = (
-        db.query(Ativo.id)
-        .filter(Ativo.empresa_id == empresa_id)
-        .all()
+    if not pendentes:
+        return
+    stmt = pg_insert(InvestimentoCDIPendente).values([
+        {"ativo_id": ativo_id, "desde": desde.replace(day=1) if desde else None}
+        for ativo_id, desde in pendentes.items()
+    ])
+    db.execute(_on_conflict_mes_mais_antigo(stmt))
+
+
+def marcar_cdi_pendente(db: Session, ativo_id: int, desde: Optional[date] = None):
+    marcar_cdi_pendentes(db, {ativo_id: desde})
+
+
+def marcar_cdi_pendente_todos(db: Session, desde: Optional[date] = None):
+    """Alteração na tabela de CDI afeta todos os ativos a partir daquele mês."""
+    desde = desde.replace(day=1) if desde else None
+    stmt = pg_insert(InvestimentoCDIPendente).from_select(
+        ["ativo_id", "desde"],
+        select(Ativo.id, literal(desde, Date)),
     )
-    ativos_ids = [row[0] for row in ativos_ids]
+    db.execute(_on_conflict_mes_mais_antigo(stmt))
+
 
+# ----------------------------------------
+# Recálculo incremental
+# ----------------------------------------
+def recalcular_investimentos_cdi_ativos(db: Session, ativos_ids: List[int], completo: bool = False) -> int:
+    """
+    Recalcula a série de CDI dos ativos informados apenas onde necessário:
+      - ativos marcados como pendentes: a partir do mês marcado, partindo do
+        acumulado já gravado no mês anterior
+      - séries que ainda não chegaram ao mês corrente: só os meses que faltam
+      - séries inexistentes, ou cujo início mudou: do zero
+    `completo=True` refaz tudo. Não faz commit. Retorna o número de meses gravados.
+    """
     if not ativos_ids:
-        return
+        return 0
+
+    ativos = db.execute(
+        select(Ativo.id, Ativo.valor_compra).where(Ativo.id.in_(ativos_ids))
+    ).all()
+    if not ativos:
+        return 0
+    ativos_ids = [ativo_id for ativo_id, _ in ativos]
+
+    primeiras_datas = dict(
+        db.execute(
+            select(Movimentacao.ativo_id, func.min(Movimentacao.data_movimentacao))
+            .where(Movimentacao.ativo_id.in_(ativos_ids))
+            .group_by(Movimentacao.ativo_id)
+        ).all()
+    )
+    series = {
+        ativo_id: (primeiro, ultimo)
+        for ativo_id, primeiro, ultimo in db.execute(
+            select(InvestimentoCDI.ativo_id, func.min(InvestimentoCDI.data), func.max(InvestimentoCDI.data))
+            .where(InvestimentoCDI.ativo_id.in_(ativos_ids))
+            .group_by(InvestimentoCDI.ativo_id)
+        )
+    }
+    pendentes = dict(
+        db.execute(
+            select(InvestimentoCDIPendente.ativo_id, InvestimentoCDIPendente.desde)
+            .where(InvestimentoCDIPendente.ativo_id.in_(ativos_ids))
+        ).all()
+    )
+
+    taxas_cdi = None
+    mes_atual = date.today().replace(day=1)
+    meses_gravados = 0
+
+    for ativo_id, valor_compra in ativos:
+        primeira_data = primeiras_datas.get(ativo_id)
+        serie = series.get(ativo_id)
+
+        if primeira_data is None:
+            # sem movimentação, sem CDI
+            if serie is not None:
+                db.query(InvestimentoCDI).filter(
+                    InvestimentoCDI.ativo_id == ativo_id
+                ).delete(synchronize_session=False)
+            continue
+
+        inicio = primeira_data.replace(day=1)
+
+        if completo or serie is None:
+            desde = inicio
+        elif ativo_id in pendentes:
+            desde = pendentes[ativo_id] or inicio
+        elif serie[1] < mes_atual:
+            desde = serie[1] + relativedelta(months=1)
+        else:
+            continue
 
-    # apaga todos os registros de investimento_cdi desses ativos
-    db.query(InvestimentoCDI).filter(
-        InvestimentoCDI.ativo_id.in_(ativos_ids)
+        # continua do acumulado gravado no mês anterior, se a série for válida até lá
+        acumulado_inicial = 0.0
+        if desde > inicio and serie is not None and serie[0] == inicio:
+            anterior = db.scalar(
+                select(InvestimentoCDI.rendimento_cdi_acumulado).where(
+                    InvestimentoCDI.ativo_id == ativo_id,
+                    InvestimentoCDI.data == desde - relativedelta(months=1),
+                )
+            )
+            if anterior is None:
+                desde = inicio
+            else:
+                acumulado_inicial = float(anterior)
+        else:
+            desde = inicio
+
+        if desde == inicio and serie is not None:
+            # reconstrução total: remove também meses anteriores a um novo início
+            db.query(InvestimentoCDI).filter(
+                InvestimentoCDI.ativo_id == ativo_id
+            ).delete(synchronize_session=False)
+
+        if taxas_cdi is None:
+            taxas_cdi = carregar_taxas_cdi(db)
+
+        meses_gravados += gerar_investimento_cdi_para_ativo(
+            db,
+            ativo_id,
+            taxas_cdi=taxas_cdi,
+            valor_base=float(valor_compra or 0),
+            primeira_data=primeira_data,
+            desde=desde,
+            acumulado_inicial=acumulado_inicial,
+        )
+
+    db.query(InvestimentoCDIPendente).filter(
+        InvestimentoCDIPendente.ativo_id.in_(ativos_ids)
     ).delete(synchronize_session=False)
-    db.flush()
 
-    # recalcula para cada ativo
-    for ativo_id in ativos_ids:
-        gerar_investimento_cdi_para_ativo(db, ativo_id)
+    return meses_gravados
+
 
+def recalcular_investimentos_cdi_empresa(db: Session, empresa_id: int, completo: bool = False) -> int:
+    """
+    Recalcula a série de CDI dos ativos da empresa (incremental, ver
+    `recalcular_investimentos_cdi_ativos`). `completo=True` refaz do zero.
+    """
+    ativos_ids = db.scalars(
+        select(Ativo.id).where(Ativo.empresa_id == empresa_id)
+    ).all()
+
+    meses_gravados = recalcular_investimentos_cdi_ativos(db, list(ativos_ids), completo=completo)
+    invalidar_empresas(db, empresa_id)
     db.commit()
+
+    return meses_gravados
+
+
+def recalcular_ou_manter_pendente(db: Session, ativos_ids: List[int]) -> bool:
+    """
+    Recálculo depois de uma escrita já confirmada (a marcação de pendente vai
+    no mesmo commit da escrita). Em erro desfaz só o recálculo: a marcação
+    continua e o próximo recálculo do ativo (ou refresh da empresa) retoma.
+    Faz commit. Retorna se recalculou.
+    """
+    try:
+        recalcular_investimentos_cdi_ativos(db, ativos_ids)
+        empresas = db.scalars(select(Ativo.empresa_id).where(Ativo.id.in_(ativos_ids))).all()
+        invalidar_empresas(db, *empresas)
+        db.commit()
+        return True
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"⚠️ Recálculo do CDI falhou (ativos {ativos_ids}); continua pendente: {e}")
+        return False
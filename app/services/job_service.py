@@ -0,0 +1,322 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, update, and_, or_, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import AsyncSessionLocal
+from app.models import NiboJob
+from app.services.nibo_service import (
+    NiboRateLimitError,
+    NiboServerError,
+    NiboConnectionError,
+)
+
+
+TIPO_IMPORTAR = "importar"
+TIPO_REFRESH = "refresh"
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDO = "concluido"
+ERRO = "erro"
+
+# falhas que valem nova tentativa (o resto é definitivo: token inválido, 4xx...)
+ERROS_TRANSITORIOS = (NiboRateLimitError, NiboServerError, NiboConnectionError)
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ----------------------------------------
+# Progresso
+# ----------------------------------------
+class Progresso:
+    """Relatório de progresso de um sync. Esta base não faz nada (chamadas fora do worker)."""
+
+    def fase(self, nome: str):
+        pass
+
+    def pagina(self, n: int = 1):
+        pass
+
+    def linhas(self, n: int):
+        pass
+
+    def meses_cdi(self, n: int):
+        pass
+
+
+def _do_dono(job_id: int, tentativas: int):
+    # só a tentativa que reivindicou o job grava nele: se ficou parada e
+    # outro worker a retomou, as gravações da antiga não batem em nada
+    return and_(NiboJob.id == job_id, NiboJob.tentativas == tentativas, NiboJob.status == EXECUTANDO)
+
+
+class ProgressoJob(Progresso):
+    """
+    Progresso e heartbeat de um job em execução. Os contadores ficam em
+    memória; `manter_vivo` roda ao lado do sync e os grava com uma sessão
+    async própria (visível enquanto a transação do sync ainda está aberta),
+    a cada JOB_HEARTBEAT_SECONDS ou logo após uma mudança, no máximo uma vez
+    a cada JOB_PROGRESSO_INTERVALO. Nada aqui bloqueia o loop.
+    """
+
+    def __init__(self, job: NiboJob):
+        self.job_id = job.id
+        self.tentativas = job.tentativas
+        self.perdido = False          # outro worker retomou o job
+        self._fase: Optional[str] = None
+        self._paginas = 0
+        self._linhas = 0
+        self._meses_cdi = 0
+        self._mudou = asyncio.Event()
+
+    def fase(self, nome: str):
+        self._fase = nome
+        self._mudou.set()
+
+    def pagina(self, n: int = 1):
+        self._paginas += n
+        self._mudou.set()
+
+    def linhas(self, n: int):
+        self._linhas += n
+        self._mudou.set()
+
+    def meses_cdi(self, n: int):
+        self._meses_cdi += n
+        self._mudou.set()
+
+    async def gravar(self) -> bool:
+        """Grava os contadores e renova atualizado_em. False se o job não é mais desta tentativa."""
+        self._mudou.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                resultado = await db.execute(
+                    update(NiboJob)
+                    .where(_do_dono(self.job_id, self.tentativas))
+                    .values(
+                        fase=self._fase,
+                        paginas=self._paginas,
+                        linhas_inseridas=self._linhas,
+                        meses_cdi=self._meses_cdi,
+                        atualizado_em=func.now(),
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            # progresso é informativo: nunca derruba o sync
+            print(f"⚠️ Falha ao gravar progresso do job {self.job_id}: {e}")
+            return True
+        return resultado.rowcount > 0
+
+    async def manter_vivo(self, execucao: asyncio.Task):
+        """Heartbeat enquanto `execucao` roda; cancela-a se outro worker retomou o job."""
+        while not execucao.done():
+            try:
+                await asyncio.wait_for(self._mudou.wait(), timeout=settings.JOB_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if not await self.gravar():
+                self.perdido = True
+                execucao.cancel()
+                return
+            await asyncio.sleep(settings.JOB_PROGRESSO_INTERVALO)
+
+
+# ----------------------------------------
+# Enfileirar
+# ----------------------------------------
+def job_em_aberto(db: Session, empresa_id: int, tipo: Optional[str] = None) -> Optional[NiboJob]:
+    """Job pendente ou executando da empresa (evita enfileirar o mesmo sync duas vezes)."""
+    query = select(NiboJob).where(
+        NiboJob.empresa_id == empresa_id,
+        NiboJob.status.in_((PENDENTE, EXECUTANDO)),
+    )
+    if tipo is not None:
+        query = query.where(NiboJob.tipo == tipo)
+    return db.scalars(query.order_by(NiboJob.id).limit(1)).first()
+
+
+def criar(
+    db: Session,
+    tipo: str,
+    usuario_id: int,
+    empresa_id: int,
+    parametros: Optional[dict] = None,
+    iniciar: bool = False,
+) -> Optional[NiboJob]:
+    """
+    Cria o job, ou devolve None se a empresa já tem um em aberto. Não faz commit.
+    A consulta prévia é só o caminho rápido: entre processos quem garante é o
+    índice único parcial uix_nibo_jobs_empresa_aberto.
+    `iniciar=True` já cria como executando, para quem vai rodá-lo na hora
+    (scheduler) sem que um worker o pegue.
+    """
+    if job_em_aberto(db, empresa_id) is not None:
+        return None
+
+    job = NiboJob(
+        tipo=tipo,
+        status=PENDENTE,
+        usuario_id=usuario_id,
+        empresa_id=empresa_id,
+        parametros=parametros or {},
+        max_tentativas=settings.JOB_MAX_TENTATIVAS,
+    )
+    if iniciar:
+        agora = _agora()
+        job.status = EXECUTANDO
+        job.tentativas = 1
+        job.iniciado_em = agora
+        job.atualizado_em = agora
+    try:
+        with db.begin_nested():
+            db.add(job)
+    except IntegrityError:
+        # outro processo enfileirou entre a consulta e o insert
+        return None
+    return job
+
+
+def enfileirar(
+    db: Session,
+    tipo: str,
+    usuario_id: int,
+    empresa_id: int,
+    parametros: Optional[dict] = None,
+    iniciar: bool = False,
+) -> NiboJob:
+    """
+    Cria o job ou devolve o que já está em aberto para a empresa (importação
+    e refresh não rodam juntos na mesma empresa). Não faz commit.
+    """
+    while True:
+        job = criar(db, tipo, usuario_id, empresa_id, parametros, iniciar)
+        if job is None:
+            # se o job em aberto terminou nesse meio tempo, tenta criar de novo
+            job = job_em_aberto(db, empresa_id)
+        if job is not None:
+            return job
+
+
+# ----------------------------------------
+# Worker
+# ----------------------------------------
+def reivindicar(db: Session) -> Optional[NiboJob]:
+    """
+    Pega o próximo job disponível com FOR UPDATE SKIP LOCKED (vários workers
+    podem disputar a fila) e o marca como executando. Faz commit.
+
+    Job "executando" sem heartbeat há JOB_STALE_SECONDS perdeu o worker
+    (OOM, SIGKILL): é retomado enquanto houver tentativas. Sem tentativas
+    sobrando vira erro na mesma transação — `falhar` nunca roda quando o
+    processo morre, e o job em aberto travaria novos syncs da empresa.
+    """
+    agora = _agora()
+    abandonado = agora - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    sem_heartbeat = and_(NiboJob.status == EXECUTANDO, NiboJob.atualizado_em < abandonado)
+
+    db.execute(
+        update(NiboJob)
+        .where(sem_heartbeat, NiboJob.tentativas >= NiboJob.max_tentativas)
+        .values(
+            status=ERRO,
+            erro="Worker perdido: job sem heartbeat e sem tentativas restantes",
+            concluido_em=agora,
+            atualizado_em=agora,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    job = db.scalars(
+        select(NiboJob)
+        .where(
+            or_(
+                and_(NiboJob.status == PENDENTE, NiboJob.disponivel_em <= agora),
+                and_(sem_heartbeat, NiboJob.tentativas < NiboJob.max_tentativas),
+            )
+        )
+        .order_by(NiboJob.disponivel_em, NiboJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+
+    if job is None:
+        db.commit()
+        return None
+
+    job.status = EXECUTANDO
+    job.tentativas += 1
+    job.iniciado_em = agora
+    job.atualizado_em = agora
+    job.erro = None
+    db.commit()
+    return job
+
+
+def _duracao_ms(job: NiboJob, fim: datetime) -> Optional[int]:
+    if job.iniciado_em is None:
+        return None
+    return int((fim - job.iniciado_em).total_seconds() * 1000)
+
+
+def _atualizar_se_dono(db: Session, job: NiboJob, **valores) -> bool:
+    resultado = db.execute(
+        update(NiboJob)
+        .where(_do_dono(job.id, job.tentativas))
+        .values(**valores)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if resultado.rowcount == 0:
+        return False
+    for campo, valor in valores.items():
+        setattr(job, campo, valor)
+    return True
+
+
+def concluir(db: Session, job: NiboJob, resultado: dict) -> bool:
+    """
+    Registra o sucesso, se o job ainda é desta tentativa. Faz commit.
+    False se outro worker o retomou (o desfecho fica com ele).
+    """
+    fim = _agora()
+    return _atualizar_se_dono(
+        db,
+        job,
+        status=CONCLUIDO,
+        fase=CONCLUIDO,
+        resultado=resultado,
+        concluido_em=fim,
+        atualizado_em=fim,
+        duracao_ms=_duracao_ms(job, fim),
+    )
+
+
+def falhar(db: Session, job: NiboJob, erro: Exception) -> bool:
+    """
+    Falha transitória com tentativas sobrando volta para a fila com backoff.
+    Mesma condição de `concluir`: só grava se o job ainda é desta tentativa.
+    """
+    agora = _agora()
+    valores = dict(
+        erro=f"{type(erro).__name__}: {erro}"[:2000],
+        atualizado_em=agora,
+        duracao_ms=_duracao_ms(job, agora),
+    )
+
+    if isinstance(erro, ERROS_TRANSITORIOS) and job.tentativas < job.max_tentativas:
+        espera = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job.tentativas - 1))
+        retry_after = getattr(erro, "retry_after", None)
+        if retry_after:
+            espera = max(espera, retry_after)
+        valores.update(status=PENDENTE, disponivel_em=agora + timedelta(seconds=espera))
+    else:
+        valores.update(status=ERRO, concluido_em=agora)
+    return _atualizar_se_dono(db, job, **valores)
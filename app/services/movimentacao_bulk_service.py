@@ -0,0 +1,181 @@
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import select, insert, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models import Ativo, Movimentacao, MovimentacaoAtivo
+from app.services.investimento_cdi_service import marcar_cdi_pendentes
+from app.services import movimentacao_mensal_service
+
+
+# Cada linha vira ~10 parâmetros; 1000 linhas ficam bem abaixo do limite do Postgres
+CHUNK_SIZE = 1000
+
+
+def _chunks(rows: List[dict], size: int = CHUNK_SIZE):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+class MovimentacaoBulkWriter:
+    """
+    Grava movimentações vindas da Nibo em lote, para um usuário.
+
+    - carrega uma única vez os nibo_transaction_id já existentes (e seus vínculos)
+    - insere as novas com INSERT ... ON CONFLICT (nibo_transaction_id) DO NOTHING RETURNING id
+    - insere os vínculos movimentacao_ativo em um único executemany
+    - acumula os deltas de receita/gastos e aplica um UPDATE por ativo em `finalizar()`,
+      marcando também o mês mais antigo afetado de cada ativo para o recálculo do CDI
+      e somando as novas linhas no rollup movimentacao_mensal
+
+    Cada linha é um dict com: nibo_transaction_id, ativo_id, data_movimentacao,
+    descricao, valor (Decimal, negativo para pagamentos) e tipo.
+    """
+
+    def __init__(self, db: Session, usuario_id: int):
+        self.db = db
+        self.usuario_id = usuario_id
+
+        self._existentes: Dict[str, int] = {}
+        self._vinculos: Set[Tuple[int, int]] = set()
+        self._deltas: Dict[int, List[Decimal]] = {}
+        self._pendentes_cdi: Dict[int, date] = {}
+        self._mensal: movimentacao_mensal_service.Deltas = {}
+
+        self.inseridas = 0
+        self.vinculos_criados = 0
+
+        self._carregar_existentes()
+
+    # ----------------------------------------
+    # Pré-carga
+    # ----------------------------------------
+    def _carregar_existentes(self):
+        rows = self.db.execute(
+            select(Movimentacao.nibo_transaction_id, Movimentacao.id).where(
+                Movimentacao.usuario_id == self.usuario_id,
+                Movimentacao.nibo_transaction_id.isnot(None),
+            )
+        )
+        self._existentes = {tx_id: mov_id for tx_id, mov_id in rows}
+
+        vinculos = self.db.execute(
+            select(MovimentacaoAtivo.movimentacao_id, MovimentacaoAtivo.ativo_id)
+            .join(Movimentacao, Movimentacao.id == MovimentacaoAtivo.movimentacao_id)
+            .where(Movimentacao.usuario_id == self.usuario_id)
+        )
+        self._vinculos = {(mov_id, ativo_id) for mov_id, ativo_id in vinculos}
+
+    def existe(self, nibo_transaction_id: str) -> bool:
+        return nibo_transaction_id in self._existentes
+
+    # ----------------------------------------
+    # Escrita
+    # ----------------------------------------
+    def adicionar(self, linhas: Iterable[dict]) -> int:
+        """Grava um lote de linhas. Retorna quantas movimentações foram inseridas."""
+        novas: Dict[str, dict] = {}
+        vinculos: List[dict] = []
+
+        for linha in linhas:
+            tx_id = linha["nibo_transaction_id"]
+
+            mov_id = self._existentes.get(tx_id)
+            if mov_id is not None:
+                self._vincular(vinculos, mov_id, linha)
+                continue
+
+            # duplicatas dentro do próprio lote da Nibo
+            if tx_id not in novas:
+                novas[tx_id] = linha
+
+        inseridas = 0
+        for chunk in _chunks(list(novas.values())):
+            stmt = (
+                pg_insert(Movimentacao)
+                .values([
+                    {
+                        "usuario_id": self.usuario_id,
+                        "ativo_id": l["ativo_id"],
+                        "data_movimentacao": l["data_movimentacao"],
+                        "descricao": l["descricao"],
+                        "valor": l["valor"],
+                        "investimento": 0,
+                        "rendimento_cdi": 0,
+                        "saldo_cdi": 0,
+                        "diferenca": 0,
+                        "nibo_transaction_id": l["nibo_transaction_id"],
+                    }
+                    for l in chunk
+                ])
+                .on_conflict_do_nothing(index_elements=["nibo_transaction_id"])
+                .returning(Movimentacao.id, Movimentacao.nibo_transaction_id)
+            )
+
+            for mov_id, tx_id in self.db.execute(stmt):
+                linha = novas[tx_id]
+                self._existentes[tx_id] = mov_id
+                self._vincular(vinculos, mov_id, linha)
+                self._acumular_delta(linha["ativo_id"], linha["valor"])
+                self._marcar_mes(linha["ativo_id"], linha["data_movimentacao"])
+                movimentacao_mensal_service.acumular(
+                    self._mensal, linha["ativo_id"], linha["data_movimentacao"], linha["valor"]
+                )
+                inseridas += 1
+
+        if vinculos:
+            self.db.execute(insert(MovimentacaoAtivo), vinculos)
+            self.vinculos_criados += len(vinculos)
+
+        self.inseridas += inseridas
+        return inseridas
+
+    def _vincular(self, vinculos: List[dict], mov_id: int, linha: dict):
+        chave = (mov_id, linha["ativo_id"])
+        if chave in self._vinculos:
+            return
+        self._vinculos.add(chave)
+        vinculos.append({
+            "movimentacao_id": mov_id,
+            "ativo_id": linha["ativo_id"],
+            "valor": linha["valor"],
+            "tipo": linha["tipo"],
+        })
+
+    def _acumular_delta(self, ativo_id: int, valor: Decimal):
+        delta = self._deltas.setdefault(ativo_id, [Decimal("0"), Decimal("0")])
+        if valor >= 0:
+            delta[0] += valor
+        else:
+            delta[1] += valor
+
+    def _marcar_mes(self, ativo_id: int, data_mov: date):
+        atual = self._pendentes_cdi.get(ativo_id)
+        if atual is None or data_mov < atual:
+            self._pendentes_cdi[ativo_id] = data_mov
+
+    # ----------------------------------------
+    # Receita / gastos
+    # ----------------------------------------
+    def finalizar(self):
+        """Aplica os deltas acumulados: um UPDATE agregado por ativo."""
+        marcar_cdi_pendentes(self.db, self._pendentes_cdi)
+        self._pendentes_cdi.clear()
+
+        movimentacao_mensal_service.aplicar_deltas(self.db, self._mensal)
+        self._mensal.clear()
+
+        for ativo_id, (receita, gastos) in self._deltas.items():
+            self.db.execute(
+                update(Ativo)
+                .where(Ativo.id == ativo_id)
+                .values(
+                    receita=func.coalesce(Ativo.receita, 0) + receita,
+                    gastos=func.coalesce(Ativo.gastos, 0) + gastos,
+                )
+                .execution_options(synchronize_session=False)
+            )
+        self._deltas.clear()
@@ -0,0 +1,176 @@
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update, delete, func, cast, case, literal_column, Date
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Movimentacao, MovimentacaoMensal
+
+
+# {(ativo_id, 1º dia do mês): [recebimentos, pagamentos, quantidade]}
+Deltas = Dict[Tuple[int, date], list]
+
+
+# ----------------------------------------
+# Acúmulo de deltas (em memória)
+# ----------------------------------------
+def acumular(deltas: Deltas, ativo_id: int, data_mov: date, valor, sinal: int = 1):
+    """
+    Soma uma movimentação (sinal=1) ou a remove (sinal=-1) do delta do mês.
+    """
+    valor = Decimal(valor or 0)
+    delta = deltas.setdefault((ativo_id, data_mov.replace(day=1)), [Decimal("0"), Decimal("0"), 0])
+    if valor >= 0:
+        delta[0] += sinal * valor
+    else:
+        delta[1] += sinal * valor
+    delta[2] += sinal
+
+
+# ----------------------------------------
+# Escrita
+# ----------------------------------------
+def _atualizar_acumulado(db: Session, ativos_ids: Iterable[int]):
+    """Refaz a soma corrida (window function) só dos ativos tocados — O(meses)."""
+    ativos_ids = list(set(ativos_ids))
+    if not ativos_ids:
+        return
+
+    corrida = (
+        select(
+            MovimentacaoMensal.id,
+            func.sum(MovimentacaoMensal.liquido)
+            .over(partition_by=MovimentacaoMensal.ativo_id, order_by=MovimentacaoMensal.mes)
+            .label("acumulado"),
+        )
+        .where(MovimentacaoMensal.ativo_id.in_(ativos_ids))
+        .subquery()
+    )
+    db.execute(
+        update(MovimentacaoMensal)
+        .where(
+            MovimentacaoMensal.id == corrida.c.id,
+            MovimentacaoMensal.acumulado.is_distinct_from(corrida.c.acumulado),
+        )
+        .values(acumulado=corrida.c.acumulado)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def aplicar_deltas(db: Session, deltas: Deltas):
+    """
+    Aplica os deltas no rollup (upsert somando) e atualiza o acumulado
+    dos ativos afetados. Não faz commit.
+    """
+    if not deltas:
+        return
+
+    stmt = pg_insert(MovimentacaoMensal).values([
+        {
+            "ativo_id": ativo_id,
+            "mes": mes,
+            "recebimentos": receb,
+            "pagamentos": pag,
+            "liquido": receb + pag,
+            "acumulado": 0,
+            "quantidade": qtd,
+        }
+        for (ativo_id, mes), (receb, pag, qtd) in deltas.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["ativo_id", "mes"],
+        set_={
+            "recebimentos": MovimentacaoMensal.recebimentos + stmt.excluded.recebimentos,
+            "pagamentos": MovimentacaoMensal.pagamentos + stmt.excluded.pagamentos,
+            "liquido": MovimentacaoMensal.liquido + stmt.excluded.liquido,
+            "quantidade": MovimentacaoMensal.quantidade + stmt.excluded.quantidade,
+        },
+    )
+    db.execute(stmt)
+
+    ativos_ids = {ativo_id for ativo_id, _ in deltas}
+
+    # meses que ficaram sem movimentação
+    db.execute(
+        delete(MovimentacaoMensal)
+        .where(
+            MovimentacaoMensal.ativo_id.in_(ativos_ids),
+            MovimentacaoMensal.quantidade <= 0,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    _atualizar_acumulado(db, ativos_ids)
+
+
+def registrar_movimentacao(db: Session, ativo_id: int, data_mov: date, valor, sinal: int = 1):
+    """Atalho para o CRUD manual: uma movimentação entrando (1) ou saindo (-1)."""
+    deltas: Deltas = {}
+    acumular(deltas, ativo_id, data_mov, valor, sinal)
+    aplicar_deltas(db, deltas)
+
+
+# ----------------------------------------
+# Reconstrução (reparo)
+# ----------------------------------------
+def reconstruir(db: Session, ativos_ids: Optional[List[int]] = None):
+    """
+    Recalcula o rollup a partir de `movimentacoes` (todos os ativos, ou só os
+    informados). Não faz commit.
+    """
+    apagar = delete(MovimentacaoMensal).execution_options(synchronize_session=False)
+    if ativos_ids is not None:
+        apagar = apagar.where(MovimentacaoMensal.ativo_id.in_(ativos_ids))
+    db.execute(apagar)
+
+    mes = cast(func.date_trunc(literal_column("'month'"), Movimentacao.data_movimentacao), Date)
+    recebimentos = func.coalesce(func.sum(case((Movimentacao.valor >= 0, Movimentacao.valor))), 0)
+    pagamentos = func.coalesce(func.sum(case((Movimentacao.valor < 0, Movimentacao.valor))), 0)
+
+    origem = (
+        select(
+            Movimentacao.ativo_id,
+            mes,
+            recebimentos,
+            pagamentos,
+            func.sum(Movimentacao.valor),
+            literal_column("0"),
+            func.count(),
+        )
+        .group_by(Movimentacao.ativo_id, mes)
+    )
+    if ativos_ids is not None:
+        origem = origem.where(Movimentacao.ativo_id.in_(ativos_ids))
+
+    db.execute(
+        pg_insert(MovimentacaoMensal).from_select(
+            ["ativo_id", "mes", "recebimentos", "pagamentos", "liquido", "acumulado", "quantidade"],
+            origem,
+        )
+    )
+
+    if ativos_ids is None:
+        ativos_ids = db.scalars(select(MovimentacaoMensal.ativo_id).distinct()).all()
+    _atualizar_acumulado(db, ativos_ids)
+
+
+def rebuild_movimentacao_mensal():
+    db = SessionLocal()
+    try:
+        reconstruir(db)
+        db.commit()
+        print("✅ Rollup movimentacao_mensal reconstruído.")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Erro ao reconstruir movimentacao_mensal: {e}")
+        raise
+    finally:
+        db.close()
+
+
+# Permite rodar direto via python
+if __name__ == "__main__":
+    rebuild_movimentacao_mensal()
@@ -0,0 +1,132 @@
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional
+
+
+RECEBIMENTO = "Recebimento"
+PAGAMENTO = "Pagamento"
+
+
+# ----------------------------------------
+# Registro normalizado
+# ----------------------------------------
+class NiboEntry:
+    """
+    Lançamento da Nibo já normalizado. Cada página é convertida assim que
+    chega e o dict bruto é descartado; com __slots__ cada registro ocupa uma
+    fração do JSON original.
+    """
+
+    __slots__ = ("id", "cc_key", "data", "centavos", "tipo", "descricao")
+
+    def __init__(self, id: str, cc_key: str, data: date, centavos: int, tipo: str, descricao: str):
+        self.id = id
+        self.cc_key = cc_key
+        self.data = data
+        self.centavos = centavos      # com sinal: negativo para pagamentos
+        self.tipo = tipo
+        self.descricao = descricao
+
+    @property
+    def valor(self) -> Decimal:
+        return Decimal(self.centavos).scaleb(-2)
+
+    def __repr__(self):
+        return f"NiboEntry({self.id!r}, {self.tipo}, {self.data}, {self.valor}, cc={self.cc_key!r})"
+
+
+# ----------------------------------------
+# Parsing
+# ----------------------------------------
+def normalize_nibo_key(val) -> str:
+    """
+    Normaliza o costCenterId para chave de mapa:
+    None → "None", dict → extrai id, inteiro/string → str
+    """
+    if val is None:
+        return "None"
+    if isinstance(val, dict):
+        return normalize_nibo_key(val.get("costCenterId") or val.get("id"))
+    return str(val).strip()
+
+
+def extract_cc_key(item: Dict[str, Any]) -> str:
+    """Chave do primeiro centro de custo do lançamento ("None" se não tiver)."""
+    cc_field = item.get("costCenters") or item.get("costCenter") or item.get("cost_centers")
+    if not cc_field:
+        return "None"
+    if isinstance(cc_field, list):
+        cc_field = cc_field[0]
+    if isinstance(cc_field, dict):
+        return normalize_nibo_key(
+            cc_field.get("costCenterId") or cc_field.get("id") or cc_field.get("centerId")
+        )
+    return normalize_nibo_key(cc_field)
+
+
+def parse_item_date(item: Dict[str, Any]) -> Optional[date]:
+    v = item.get("date") or item.get("dueDate") or item.get("accrualDate")
+    if not v:
+        return None
+    try:
+        return datetime.fromisoformat(str(v).replace("Z", "")).date()
+    except ValueError:
+        return None
+
+
+def parse_centavos(v) -> int:
+    if v is None:
+        return 0
+    try:
+        if isinstance(v, str):
+            v = v.replace(",", ".")
+        return int((Decimal(str(v)) * 100).to_integral_value(ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return 0
+
+
+def is_transfer(item: Dict[str, Any]) -> bool:
+    # somente movimentações com isTransfer == False entram
+    return (
+        item.get("isTransfer") is not False
+        or item.get("isTransfered") is True
+        or item.get("is_transfer") is True
+    )
+
+
+def parse_entry(item: Any, tipo: str) -> Optional[NiboEntry]:
+    """Converte um item de receipts/payments. Transferências, itens sem id ou sem data → None."""
+    if not isinstance(item, dict) or is_transfer(item):
+        return None
+
+    nibo_id = item.get("entryId") or item.get("id")
+    data_mov = parse_item_date(item)
+    if not nibo_id or data_mov is None:
+        return None
+
+    centavos = parse_centavos(item.get("value") or item.get("amount") or 0)
+    if tipo == PAGAMENTO:
+        centavos = -centavos
+
+    return NiboEntry(
+        id=str(nibo_id),
+        cc_key=extract_cc_key(item),
+        data=data_mov,
+        centavos=centavos,
+        tipo=tipo,
+        descricao=item.get("identifier") or item.get("description") or tipo,
+    )
+
+
+def parse_page(items: Iterable[Any], tipo: str) -> List[NiboEntry]:
+    entries = []
+    for item in items:
+        entry = parse_entry(item, tipo)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def parser_de(tipo: str):
+    """Transformação de página para `fetch_all_pages(..., transformar=...)`."""
+    return lambda items: parse_page(items, tipo)
@@ -1,11 +1,20 @@
-from sqlalchemy.orm import Session
+import asyncio
+from typing import Optional
+
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from datetime import datetime
-from decimal import Decimal
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services.nibo_service import nibo_service, fetch_all_pages, fetch_all
+from app.core.config import settings
+from app.core.principal import principal_cache
+from app.services.nibo_service import nibo_service, iter_pages, fetch_all
 from app.services import investimento_cdi_service
-from app.models import Empresa, Ativo, Movimentacao, UserEmpresa, MovimentacaoAtivo
+from app.services.movimentacao_bulk_service import MovimentacaoBulkWriter
+from app.services import nibo_sync_service
+from app.services.job_service import Progresso
+from app.services.response_cache import invalidar_empresas
+from app.services.nibo_entries import RECEBIMENTO, PAGAMENTO, normalize_nibo_key, parser_de
+from app.models import Empresa, Ativo, UserEmpresa
 from app.schemas.ativos_enums import (
     StatusAtivo,
     TipoAtivo,
@@ -15,60 +24,99 @@ from app.schemas.ativos_enums import (
 )
 
 
-# ----------------------------------------
-# Helpers
-# ----------------------------------------
-def parse_date(v):
-    if not v:
-        return datetime.today().date()
-    try:
-        cleaned = v.replace("Z", "")
-        return datetime.fromisoformat(cleaned).date()
-    except:
-        return datetime.today().date()
-
-
-def parse_decimal(v):
-    try:
-        if isinstance(v, str):
-            v = v.replace(",", ".")
-        return Decimal(str(v))
-    except:
-        return Decimal("0")
-
-
-def _normalize_nibo_key(val):
-    """
-    Normaliza o valor do costCenterId para map:
-    None → "None"
-    dict → extrai id
-    inteiro/string → str
-    """
-    if val is None:
-        return "None"
-    if isinstance(val, dict):
-        v = val.get("costCenterId") or val.get("id")
-        return _normalize_nibo_key(v)
-    try:
-        return str(val).strip()
-    except:
-        return "None"
-
-
 # ----------------------------------------
 # Serviço principal
 # ----------------------------------------
 class NiboImportService:
 
-    async def importar(self, db: Session, token: str, usuario_id: int, empresa_data: dict):
+    async def _importar_movimentos(
+        self,
+        db: AsyncSession,
+        writer: MovimentacaoBulkWriter,
+        token: str,
+        map_ativos: dict,
+        ativo_sem_cc_id: int,
+        progresso: Progresso,
+    ):
+        """
+        Busca receipts e payments página a página e grava conforme chegam:
+        enquanto a página k é gravada (I/O async), as seguintes já estão sendo
+        baixadas e normalizadas. A fila limita quantas páginas ficam em memória.
+        Um erro em qualquer busca é relançado aqui (o chamador faz rollback).
+        """
+        fila: asyncio.Queue = asyncio.Queue(maxsize=settings.NIBO_IMPORT_QUEUE_PAGES)
+
+        async def produzir(fetch_fn, tipo):
+            try:
+                async for page in iter_pages(fetch_fn, token, transformar=parser_de(tipo)):
+                    if page:
+                        await fila.put(page)
+            except Exception as e:
+                # repassa ao consumidor, que aborta a importação inteira
+                await fila.put(e)
+            else:
+                await fila.put(None)
+
+        def gravar(_sessao, page):
+            return writer.adicionar(
+                {
+                    "nibo_transaction_id": entry.id,
+                    "ativo_id": map_ativos.get(entry.cc_key, ativo_sem_cc_id),
+                    "data_movimentacao": entry.data,
+                    "descricao": entry.descricao,
+                    "valor": entry.valor,
+                    "tipo": entry.tipo,
+                }
+                for entry in page
+            )
+
+        produtores = [
+            asyncio.create_task(produzir(nibo_service.get_receipts, RECEBIMENTO)),
+            asyncio.create_task(produzir(nibo_service.get_payments, PAGAMENTO)),
+        ]
+
+        lancamentos = 0
+        ultimos = []   # lançamento mais recente de cada página (cursor de sync)
+        try:
+            abertos = len(produtores)
+            while abertos:
+                page = await fila.get()
+                if page is None:
+                    abertos -= 1
+                    continue
+                if isinstance(page, Exception):
+                    raise page
+                # writer síncrono sobre a conexão async (run_sync): não bloqueia o loop
+                inseridas = await db.run_sync(gravar, page)
+                lancamentos += len(page)
+                progresso.pagina()
+                progresso.linhas(inseridas)
+                ultimos.append(max(page, key=lambda e: e.data))
+        finally:
+            for t in produtores:
+                t.cancel()
+
+        return {"lancamentos": lancamentos, "ultimos": ultimos}
+
+    async def importar(
+        self,
+        db: AsyncSession,
+        token: str,
+        usuario_id: int,
+        empresa_data: dict,
+        progresso: Optional[Progresso] = None,
+    ):
+        progresso = progresso or Progresso()
 
         # -----------------------------
         # EMPRESA
         # -----------------------------
-        empresa = db.query(Empresa).filter(
-            Empresa.cnpj == empresa_data["cnpj"],
-            Empresa.usuario_id == usuario_id
-        ).first()
+        empresa = await db.scalar(
+            select(Empresa).where(
+                Empresa.cnpj == empresa_data["cnpj"],
+                Empresa.usuario_id == usuario_id
+            ).limit(1)
+        )
 
         if not empresa:
             empresa = Empresa(
@@ -79,35 +127,43 @@ class NiboImportService:
                 nibo_api_token=token
             )
             db.add(empresa)
-            db.commit()
-            db.refresh(empresa)
+            await db.commit()
+            await db.refresh(empresa)
         else:
             empresa.nibo_api_token = token
-            db.commit()
-            db.refresh(empresa)
+            await db.commit()
+            await db.refresh(empresa)
+
+        # rollbacks abaixo expiram a instância; em AsyncSession não há lazy load
+        empresa_id, empresa_nome = empresa.id, empresa.nome
 
         # vínculo user–empresa
-        if not db.query(UserEmpresa).filter_by(user_id=usuario_id, empresa_id=empresa.id).first():
-            db.add(UserEmpresa(user_id=usuario_id, empresa_id=empresa.id))
-            db.commit()
+        vinculo = await db.scalar(
+            select(UserEmpresa).filter_by(user_id=usuario_id, empresa_id=empresa_id).limit(1)
+        )
+        if not vinculo:
+            db.add(UserEmpresa(user_id=usuario_id, empresa_id=empresa_id))
+            await db.run_sync(principal_cache.invalidar, usuario_id)
+            await db.commit()
 
         # -----------------------------
         # COST CENTERS → ATIVOS
         # -----------------------------
-        try:
-            costcenters = await fetch_all(token, nibo_service.get_costcenters)
-        except Exception:
-            costcenters = []
+        # NiboError sobe: sem centros de custo tudo cairia em "SEM CENTRO DE CUSTO"
+        progresso.fase("centros_de_custo")
+        costcenters = await fetch_all(token, nibo_service.get_costcenters)
 
         map_ativos = {}
 
-        existentes_query = db.query(Ativo).filter(
-            Ativo.empresa_id == empresa.id,
-            Ativo.usuario_id == usuario_id
-        ).all()
+        existentes_query = (await db.scalars(
+            select(Ativo).where(
+                Ativo.empresa_id == empresa_id,
+                Ativo.usuario_id == usuario_id
+            )
+        )).all()
 
         existentes_map = {
-            _normalize_nibo_key(a.nibo_cost_center_id): a.id
+            normalize_nibo_key(a.nibo_cost_center_id): a.id
             for a in existentes_query
         }
 
@@ -136,17 +192,19 @@ class NiboImportService:
             else:
                 nibo_id = cc
 
-            key = _normalize_nibo_key(nibo_id)
+            key = normalize_nibo_key(nibo_id)
             unique_nibo_keys.add(key)
 
             if not nome:
                 nome = "Centro sem nome"
 
-            ativo_existente = db.query(Ativo).filter(
-                Ativo.nibo_cost_center_id == nibo_id,
-                Ativo.empresa_id == empresa.id,
-                Ativo.usuario_id == usuario_id
-            ).first()
+            ativo_existente = await db.scalar(
+                select(Ativo).where(
+                    Ativo.nibo_cost_center_id == nibo_id,
+                    Ativo.empresa_id == empresa_id,
+                    Ativo.usuario_id == usuario_id
+                ).limit(1)
+            )
 
             if ativo_existente:
                 if not ativo_existente.ativo:
@@ -157,7 +215,7 @@ class NiboImportService:
             try:
                 ativo = Ativo(
                     usuario_id=usuario_id,
-                    empresa_id=empresa.id,
+                    empresa_id=empresa_id,
                     nome=nome,
                     status=StatusAtivo.vazio,
                     tipo=TipoAtivo.residencial,
@@ -174,34 +232,36 @@ class NiboImportService:
                     nibo_cost_center_id=nibo_id
                 )
                 db.add(ativo)
-                db.flush()
+                await db.flush()
                 map_ativos[key] = ativo.id
                 existentes_map[key] = ativo.id
 
             except IntegrityError:
-                db.rollback()
-                existing = db.query(Ativo).filter(
-                    Ativo.nibo_cost_center_id == nibo_id
-                ).first()
+                await db.rollback()
+                existing = await db.scalar(
+                    select(Ativo).where(Ativo.nibo_cost_center_id == nibo_id).limit(1)
+                )
                 if existing:
                     map_ativos[key] = existing.id
                     existentes_map[key] = existing.id
                 else:
                     continue
             except Exception:
-                db.rollback()
+                await db.rollback()
                 continue
 
-        ativo_sem_cc = db.query(Ativo).filter_by(
-            usuario_id=usuario_id,
-            empresa_id=empresa.id,
-            nibo_cost_center_id=None
-        ).first()
+        ativo_sem_cc = await db.scalar(
+            select(Ativo).filter_by(
+                usuario_id=usuario_id,
+                empresa_id=empresa_id,
+                nibo_cost_center_id=None
+            ).limit(1)
+        )
 
         if not ativo_sem_cc:
             ativo_sem_cc = Ativo(
                 usuario_id=usuario_id,
-                empresa_id=empresa.id,
+                empresa_id=empresa_id,
                 nome="SEM CENTRO DE CUSTO",
                 status=StatusAtivo.vazio,
                 tipo=TipoAtivo.residencial,
@@ -218,143 +278,46 @@ class NiboImportService:
                 nibo_cost_center_id=None
             )
             db.add(ativo_sem_cc)
-            db.flush()
+            await db.flush()
 
         map_ativos["None"] = ativo_sem_cc.id
 
         # ----------------------------------------
-        # Funções de parsing
-        # ----------------------------------------
-        def extract_nibo_cc_from_costcenters_field(cc_field):
-            if not cc_field:
-                return "None"
-
-            if isinstance(cc_field, list) and len(cc_field) > 0:
-                first = cc_field[0]
-                if isinstance(first, dict):
-                    nid = first.get("costCenterId") or first.get("id") or first.get("centerId")
-                    return _normalize_nibo_key(nid)
-                return _normalize_nibo_key(first)
-
-            if isinstance(cc_field, dict):
-                nid = cc_field.get("costCenterId") or cc_field.get("id") or cc_field.get("centerId")
-                return _normalize_nibo_key(nid)
-
-            return _normalize_nibo_key(cc_field)
-
-        # ----------------------------------------
-        # PARSER DE MOVIMENTAÇÕES
-        # ----------------------------------------
-        def parse_movimentos(data_list, tipo="Recebimento"):
-            for item in data_list:
-                if not isinstance(item, dict):
-                    continue
-
-                # ✅ CORREÇÃO DEFINITIVA
-                # somente movimentações com isTransfer == False entram
-                if item.get("isTransfer") is not False:
-                    continue
-
-                cc_field = (
-                    item.get("costCenters")
-                    or item.get("costCenter")
-                    or item.get("cost_centers")
-                )
-                key = extract_nibo_cc_from_costcenters_field(cc_field)
-                ativo_id = map_ativos.get(key, ativo_sem_cc.id)
-
-                data_raw = (
-                    item.get("date")
-                    or item.get("dueDate")
-                    or item.get("accrualDate")
-                )
-
-                valor_raw = item.get("value") or item.get("amount") or 0
-                nibo_id = item.get("entryId") or item.get("id")
-
-                existente = db.query(Movimentacao).filter(
-                    Movimentacao.usuario_id == usuario_id,
-                    Movimentacao.nibo_transaction_id == nibo_id
-                ).first()
-
-                valor = parse_decimal(valor_raw)
-                if tipo == "Pagamento":
-                    valor = -valor
-
-                data_mov = parse_date(data_raw)
-
-                if existente:
-                    if not db.query(MovimentacaoAtivo).filter_by(
-                        movimentacao_id=existente.id,
-                        ativo_id=ativo_id
-                    ).first():
-                        db.add(MovimentacaoAtivo(
-                            movimentacao_id=existente.id,
-                            ativo_id=ativo_id,
-                            valor=valor,
-                            tipo=tipo
-                        ))
-                    continue
-
-                mov = Movimentacao(
-                    usuario_id=usuario_id,
-                    ativo_id=ativo_id,
-                    data_movimentacao=data_mov,
-                    descricao=item.get("identifier") or item.get("description") or tipo,
-                    valor=valor,
-                    investimento=0,
-                    rendimento_cdi=0,
-                    saldo_cdi=0,
-                    diferenca=0,
-                    nibo_transaction_id=nibo_id
-                )
-                db.add(mov)
-                db.flush()
-
-                db.add(MovimentacaoAtivo(
-                    movimentacao_id=mov.id,
-                    ativo_id=ativo_id,
-                    valor=valor,
-                    tipo=tipo
-                ))
-                db.flush()
-
-                ativo = db.query(Ativo).filter_by(id=ativo_id).first()
-                if ativo:
-                    if valor >= 0:
-                        ativo.receita = (ativo.receita or 0) + valor
-                    else:
-                        ativo.gastos = (ativo.gastos or 0) + valor
-                    db.add(ativo)
-
-        # ----------------------------------------
-        # RECEBIMENTOS
+        # RECEBIMENTOS + PAGAMENTOS (pipeline por página)
         # ----------------------------------------
+        # qualquer falha da Nibo aborta tudo: nada de importação parcial
         try:
-            receipts = await fetch_all_pages(nibo_service.get_receipts, token)
+            # os serviços de escrita são síncronos: rodam sobre a mesma
+            # transação via run_sync, com o I/O ainda assíncrono
+            writer = await db.run_sync(MovimentacaoBulkWriter, usuario_id)
+            progresso.fase("movimentacoes")
+            resumo = await self._importar_movimentos(db, writer, token, map_ativos, ativo_sem_cc.id, progresso)
+            await db.run_sync(lambda _sessao: writer.finalizar())
+
+            # importação baixa tudo: vale como sync completo para o refresh incremental
+            sync_estado = await db.run_sync(nibo_sync_service.obter_estado, empresa_id)
+            await db.run_sync(nibo_sync_service.registrar_sync, sync_estado, resumo["ultimos"], True)
+            await db.run_sync(invalidar_empresas, empresa_id)
+
+            await db.commit()
         except Exception:
-            receipts = []
-
-        parse_movimentos(receipts, "Recebimento")
-
-        # ----------------------------------------
-        # PAGAMENTOS
-        # ----------------------------------------
-        try:
-            payments = await fetch_all_pages(nibo_service.get_payments, token)
-        except Exception:
-            payments = []
-
-        parse_movimentos(payments, "Pagamento")
-
-        db.commit()
+            await db.rollback()
+            raise
 
         # ----------------------------------------
         # CÁLCULO DO CDI
         # ----------------------------------------
+        # as movimentações já estão gravadas e marcadas como pendentes de CDI:
+        # se o recálculo falhar, o próximo refresh retoma; o resultado avisa
+        progresso.fase("cdi")
+        erro_cdi = None
         try:
-            investimento_cdi_service.recalcular_investimentos_cdi_empresa(db, empresa.id)
+            progresso.meses_cdi(
+                await db.run_sync(investimento_cdi_service.recalcular_investimentos_cdi_empresa, empresa_id)
+            )
         except Exception as e:
+            await db.rollback()
+            erro_cdi = str(e)
             print("Erro ao recalcular investimentos CDI na importação:", e)
 
         ativos_importados = (
@@ -363,10 +326,12 @@ class NiboImportService:
 
         return {
             "status": "ok",
-            "empresa_id": empresa.id,
-            "empresa_nome": empresa.nome,
+            "empresa_id": empresa_id,
+            "empresa_nome": empresa_nome,
             "ativos_importados": ativos_importados,
-            "movimentacoes_importadas": len(receipts) + len(payments)
+            "movimentacoes_importadas": resumo["lancamentos"],
+            "cdi_pendente": erro_cdi is not None,
+            "erro_cdi": erro_cdi,
         }
 
 
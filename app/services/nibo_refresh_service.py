@@ -1,9 +1,13 @@
-from sqlalchemy.orm import Session
+import asyncio
+import itertools
+
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from decimal import Decimal
-from typing import List, Dict, Any
+from typing import List, Dict, Optional
 
-from app.models import Empresa, Ativo, Movimentacao, MovimentacaoAtivo, UserEmpresa
+from app.models import Empresa, Ativo, UserEmpresa
 from app.schemas.ativos_enums import (
     StatusAtivo,
     TipoAtivo,
@@ -12,65 +16,54 @@ from app.schemas.ativos_enums import (
     PotencialAtivo,
 )
 from app.services.investimento_cdi_service import recalcular_investimentos_cdi_empresa
-from app.services.nibo_service import nibo_service, fetch_all_pages, fetch_all
+from app.services.movimentacao_bulk_service import MovimentacaoBulkWriter
+from app.services.nibo_service import nibo_service, fetch_all_pages
+from app.services import nibo_sync_service
+from app.services.job_service import Progresso
+from app.services.response_cache import invalidar_empresas
+from app.services.nibo_entries import NiboEntry, RECEBIMENTO, PAGAMENTO, normalize_nibo_key, parser_de
 
 
 # -----------------------
 # Helpers
 # -----------------------
-def _normalize_nibo_key(val) -> str:
-    if val is None:
-        return "None"
-    if isinstance(val, dict):
-        v = val.get("costCenterId") or val.get("id")
-        return _normalize_nibo_key(v)
-    try:
-        return str(val).strip()
-    except:
-        return "None"
+def _contando(transformar, progresso: Progresso):
+    """Conta cada página que chega da Nibo no progresso do job."""
+    def wrapper(items):
+        progresso.pagina()
+        return transformar(items)
+    return wrapper
 
 
-def _extract_costcenter_id_from_item(item: Dict[str, Any]):
-    """
-    Retorna o primeiro costCenterId encontrado no item (ou None).
+# -----------------------
+# Serviço principal
+# -----------------------
+async def refresh_ativos(
+    db: AsyncSession,
+    user_id: int,
+    empresa_id: int,
+    completo: bool = False,
+    progresso: Optional[Progresso] = None,
+):
     """
-    if not item:
-        return None
-    cc_field = item.get("costCenters") or item.get("costCenter") or item.get("cost_centers")
-    if not cc_field:
-        return None
-    if isinstance(cc_field, list) and len(cc_field) > 0:
-        first = cc_field[0]
-        if isinstance(first, dict):
-            return first.get("costCenterId") or first.get("id") or first.get("centerId")
-        return first
-    if isinstance(cc_field, dict):
-        return cc_field.get("costCenterId") or cc_field.get("id") or cc_field.get("centerId")
-    return cc_field
+    Sincroniza ativos e movimentações da empresa com a Nibo.
 
+    Por padrão busca apenas lançamentos a partir do cursor salvo em
+    empresa_nibo_sync. `completo=True` (ou reconciliação vencida / sem cursor)
+    baixa todo o histórico.
 
-def _to_decimal(v) -> Decimal:
-    if v is None:
-        return Decimal("0")
-    try:
-        if isinstance(v, str):
-            v = v.replace(",", ".")
-        return Decimal(str(v))
-    except:
-        return Decimal("0")
-
+    Roda sobre AsyncSession: os serviços de escrita síncronos (bulk writer,
+    cursor de sync, CDI) entram via run_sync, com o I/O ainda assíncrono.
+    """
 
-# -----------------------
-# Serviço principal
-# -----------------------
-async def refresh_ativos(db: Session, user_id: int, empresa_id: int):
+    progresso = progresso or Progresso()
 
     # --------------- permissões ---------------
-    if not db.query(UserEmpresa).filter_by(user_id=user_id, empresa_id=empresa_id).first():
+    if not await db.scalar(select(UserEmpresa).filter_by(user_id=user_id, empresa_id=empresa_id).limit(1)):
         raise Exception("Usuário não tem acesso à empresa")
 
     # --------------- buscar empresa e token ---------------
-    empresa: Empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+    empresa: Empresa = await db.get(Empresa, empresa_id)
     if not empresa:
         raise Exception("Empresa não encontrada")
 
@@ -79,22 +72,17 @@ async def refresh_ativos(db: Session, user_id: int, empresa_id: int):
         raise Exception("Empresa não possui token Nibo salvo (nibo_api_token).")
 
     # --------------- carregar ativos locais ---------------
-    ativos_db: List[Ativo] = db.query(Ativo).filter(Ativo.empresa_id == empresa_id).all()
-    ativos_db_map = { _normalize_nibo_key(a.nibo_cost_center_id): a for a in ativos_db if a.nibo_cost_center_id is not None }
-    ativo_sem_cc = db.query(Ativo).filter_by(empresa_id=empresa_id, nibo_cost_center_id=None).first()
+    ativos_db: List[Ativo] = (await db.scalars(select(Ativo).where(Ativo.empresa_id == empresa_id))).all()
+    ativos_db_map = { normalize_nibo_key(a.nibo_cost_center_id): a for a in ativos_db if a.nibo_cost_center_id is not None }
 
     # --------------- buscar costcenters da Nibo ---------------
-    try:
-        costcenters_raw = await nibo_service.get_costcenters(token)
-        if isinstance(costcenters_raw, dict):
-            costcenters = costcenters_raw.get("items") or costcenters_raw.get("value") or []
-        else:
-            costcenters = costcenters_raw or []
-    except Exception:
-        try:
-            costcenters = await fetch_all(token, nibo_service.get_costcenters)
-        except Exception:
-            costcenters = []
+    progresso.fase("centros_de_custo")
+    # NiboError sobe: abortar é melhor que sincronizar com dados parciais
+    costcenters_raw = await nibo_service.get_costcenters(token)
+    if isinstance(costcenters_raw, dict):
+        costcenters = costcenters_raw.get("items") or costcenters_raw.get("value") or []
+    else:
+        costcenters = costcenters_raw or []
 
     nibo_centers = []
     for cc in costcenters:
@@ -107,243 +95,122 @@ async def refresh_ativos(db: Session, user_id: int, empresa_id: int):
         nibo_centers.append({"id": nibo_id, "nome": nome, "raw": cc})
 
     # --------------- buscar movimentações ---------------
-    try:
-        receipts = await fetch_all_pages(nibo_service.get_receipts, token)
-    except Exception:
-        receipts = []
-    try:
-        payments = await fetch_all_pages(nibo_service.get_payments, token)
-    except Exception:
-        payments = []
-
-    all_movs_raw = []
-    for r in receipts:
-        if r.get("isTransfer") is True or r.get("isTransfered") is True or r.get("is_transfer") is True:
-            continue
-        all_movs_raw.append(r)
-    for p in payments:
-        if p.get("isTransfer") is True or p.get("isTransfered") is True or p.get("is_transfer") is True:
-            continue
-        all_movs_raw.append(p)
-
-    movs_by_cc: Dict[str, List[Dict[str, Any]]] = {}
-    for item in all_movs_raw:
-        cc_id = _extract_costcenter_id_from_item(item)
-        key = _normalize_nibo_key(cc_id)
-        movs_by_cc.setdefault(key, []).append(item)
+    progresso.fase("buscando_lancamentos")
+    sync_estado = await db.run_sync(nibo_sync_service.obter_estado, empresa_id)
+    completo = completo or nibo_sync_service.precisa_sync_completo(sync_estado)
+    filtro = None if completo else nibo_sync_service.filtro_incremental(sync_estado)
+
+    # cada página é normalizada assim que chega (NiboEntry), sem guardar o JSON
+    receipts, payments = await asyncio.gather(
+        fetch_all_pages(nibo_service.get_receipts, token, filtro=filtro, transformar=_contando(parser_de(RECEBIMENTO), progresso)),
+        fetch_all_pages(nibo_service.get_payments, token, filtro=filtro, transformar=_contando(parser_de(PAGAMENTO), progresso)),
+        return_exceptions=True,
+    )
+    # falha em qualquer lado aborta o refresh (nada gravado, cursor intacto)
+    for resultado in (receipts, payments):
+        if isinstance(resultado, Exception):
+            await db.rollback()
+            raise resultado
+
+    movs_by_cc: Dict[str, List[NiboEntry]] = {}
+    for entry in itertools.chain(receipts, payments):
+        movs_by_cc.setdefault(entry.cc_key, []).append(entry)
 
     # --------------- processar cada centro ---------------
+    progresso.fase("movimentacoes")
     novos_ativos = 0
-    novas_movimentacoes = 0
+    # um writer por dono do ativo (dedupe por nibo_transaction_id é por usuário)
+    writers: Dict[int, MovimentacaoBulkWriter] = {}
 
     for center in nibo_centers:
         nibo_id = center["id"]
         nome = center["nome"]
-        key = _normalize_nibo_key(nibo_id)
+        key = normalize_nibo_key(nibo_id)
 
-        ativo_existente = ativos_db_map.get(key)
+        ativo = ativos_db_map.get(key)
 
-        if ativo_existente:
-            if not getattr(ativo_existente, "ativo", True):
-                continue
-
-            movs = movs_by_cc.get(key, [])
-
-            for item in movs:
-                nibo_tx_id = item.get("entryId") or item.get("id")
-                if not nibo_tx_id:
-                    continue
-
-                existe = db.query(Movimentacao).filter(
-                    Movimentacao.usuario_id == ativo_existente.usuario_id,
-                    Movimentacao.nibo_transaction_id == nibo_tx_id
-                ).first()
-                if existe:
-                    try:
-                        if not db.query(MovimentacaoAtivo).filter_by(movimentacao_id=existe.id, ativo_id=ativo_existente.id).first():
-                            db.add(MovimentacaoAtivo(
-                                movimentacao_id=existe.id,
-                                ativo_id=ativo_existente.id,
-                                valor=_to_decimal(item.get("value") or item.get("amount") or 0) * ( -1 if item in payments else 1 ),
-                                tipo="Recebimento" if (item.get("value") or item.get("amount") or 0) >= 0 else "Pagamento"
-                            ))
-                            db.flush()
-                    except Exception:
-                        db.rollback()
-                    continue
-
-                valor_raw = item.get("value") or item.get("amount") or 0
-                valor = _to_decimal(valor_raw)
-                tipo_mov = "Recebimento" if valor >= 0 else "Pagamento"
-
-                mov = Movimentacao(
-                    usuario_id=ativo_existente.usuario_id,
-                    ativo_id=ativo_existente.id,
-                    data_movimentacao=(item.get("date") or item.get("dueDate") or item.get("accrualDate") or None),
-                    descricao=item.get("identifier") or item.get("description") or "",
-                    valor=(valor if tipo_mov == "Recebimento" else -valor),
-                    investimento=0,
-                    rendimento_cdi=0,
-                    saldo_cdi=0,
-                    diferenca=0,
-                    nibo_transaction_id=nibo_tx_id
+        if ativo is None:
+            try:
+                async with db.begin_nested():
+                    ativo = Ativo(
+                        usuario_id=user_id,
+                        empresa_id=empresa_id,
+                        nome=nome or "Centro sem nome",
+                        status=StatusAtivo.vazio,
+                        tipo=TipoAtivo.residencial,
+                        finalidade=FinalidadeAtivo.locacao_venda,
+                        grau_desmobilizacao=GrauDesmobilizacaoAtivo.moderado,
+                        potencial=PotencialAtivo.medio,
+                        percentual_participacao=100,
+                        valor_compra=Decimal("0"),
+                        gastos=Decimal("0"),
+                        receita=Decimal("0"),
+                        saldo_devedor=None,
+                        preco_venda=None,
+                        participacao_venda=100,
+                        nibo_cost_center_id=nibo_id,
+                        ativo=True
+                    )
+                    db.add(ativo)
+                novos_ativos += 1
+            except IntegrityError:
+                ativo = await db.scalar(
+                    select(Ativo).where(Ativo.nibo_cost_center_id == nibo_id, Ativo.empresa_id == empresa_id).limit(1)
                 )
-                try:
-                    db.add(mov)
-                    db.flush()
-
-                    db.add(MovimentacaoAtivo(
-                        movimentacao_id=mov.id,
-                        ativo_id=ativo_existente.id,
-                        valor=mov.valor,
-                        tipo="Recebimento" if mov.valor >= 0 else "Pagamento"
-                    ))
-                    db.flush()
-
-                    if mov.valor >= 0:
-                        ativo_existente.receita = (ativo_existente.receita or Decimal("0")) + mov.valor
-                    else:
-                        ativo_existente.gastos = (ativo_existente.gastos or Decimal("0")) + mov.valor
-
-                    ativo_existente.total = (ativo_existente.receita or Decimal("0")) + (ativo_existente.gastos or Decimal("0"))
-
-                    db.add(ativo_existente)
-                    db.flush()
-
-                    novas_movimentacoes += 1
-                except Exception:
-                    db.rollback()
+                if ativo is None:
                     continue
+            ativos_db_map[key] = ativo
 
-            try:
-                db.commit()
-                db.refresh(ativo_existente)
-            except Exception:
-                try:
-                    db.rollback()
-                except:
-                    pass
+        elif not getattr(ativo, "ativo", True):
             continue
 
-        # criar novo ativo
-        try:
-            novo_ativo = Ativo(
-                usuario_id=user_id,
-                empresa_id=empresa_id,
-                nome=nome or "Centro sem nome",
-                status=StatusAtivo.vazio,
-                tipo=TipoAtivo.residencial,
-                finalidade=FinalidadeAtivo.locacao_venda,
-                grau_desmobilizacao=GrauDesmobilizacaoAtivo.moderado,
-                potencial=PotencialAtivo.medio,
-                percentual_participacao=100,
-                valor_compra=Decimal("0"),
-                gastos=Decimal("0"),
-                receita=Decimal("0"),
-                saldo_devedor=None,
-                preco_venda=None,
-                participacao_venda=100,
-                nibo_cost_center_id=nibo_id,
-                ativo=True
-            )
-            db.add(novo_ativo)
-            db.flush()
-            novos_ativos += 1
-
-            ativos_db_map[key] = novo_ativo
-        except IntegrityError:
-            try:
-                db.rollback()
-            except:
-                pass
-            existing = db.query(Ativo).filter(Ativo.nibo_cost_center_id == nibo_id, Ativo.empresa_id == empresa_id).first()
-            if existing:
-                ativos_db_map[key] = existing
-            else:
-                continue
-        except Exception:
-            try:
-                db.rollback()
-            except:
-                pass
+        movs = movs_by_cc.get(key)
+        if not movs:
             continue
 
-        movs_for_new = movs_by_cc.get(key, [])
-        for item in movs_for_new:
-            nibo_tx_id = item.get("entryId") or item.get("id")
-            if not nibo_tx_id:
-                continue
-
-            existe = db.query(Movimentacao).filter(Movimentacao.usuario_id == user_id, Movimentacao.nibo_transaction_id == nibo_tx_id).first()
-            if existe:
-                try:
-                    if not db.query(MovimentacaoAtivo).filter_by(movimentacao_id=existe.id, ativo_id=novo_ativo.id).first():
-                        db.add(MovimentacaoAtivo(
-                            movimentacao_id=existe.id,
-                            ativo_id=novo_ativo.id,
-                            valor=_to_decimal(item.get("value") or item.get("amount") or 0),
-                            tipo="Recebimento" if _to_decimal(item.get("value") or item.get("amount") or 0) >= 0 else "Pagamento"
-                        ))
-                        db.flush()
-                except Exception:
-                    db.rollback()
-                continue
-
-            valor = _to_decimal(item.get("value") or item.get("amount") or 0)
-            mov = Movimentacao(
-                usuario_id=user_id,
-                ativo_id=novo_ativo.id,
-                data_movimentacao=(item.get("date") or item.get("dueDate") or item.get("accrualDate") or None),
-                descricao=item.get("identifier") or item.get("description") or "",
-                valor=(valor if valor >= 0 else -valor),
-                investimento=0,
-                rendimento_cdi=0,
-                saldo_cdi=0,
-                diferenca=0,
-                nibo_transaction_id=nibo_tx_id
-            )
-            try:
-                db.add(mov)
-                db.flush()
-
-                db.add(MovimentacaoAtivo(
-                    movimentacao_id=mov.id,
-                    ativo_id=novo_ativo.id,
-                    valor=mov.valor,
-                    tipo="Recebimento" if mov.valor >= 0 else "Pagamento"
-                ))
-                db.flush()
-
-                if mov.valor >= 0:
-                    novo_ativo.receita = (novo_ativo.receita or Decimal("0")) + mov.valor
-                else:
-                    novo_ativo.gastos = (novo_ativo.gastos or Decimal("0")) + mov.valor
+        writer = writers.get(ativo.usuario_id)
+        if writer is None:
+            writer = writers[ativo.usuario_id] = await db.run_sync(MovimentacaoBulkWriter, ativo.usuario_id)
+
+        inseridas = await db.run_sync(lambda _sessao: writer.adicionar(
+            {
+                "nibo_transaction_id": entry.id,
+                "ativo_id": ativo.id,
+                "data_movimentacao": entry.data,
+                "descricao": entry.descricao,
+                "valor": entry.valor,
+                "tipo": entry.tipo,
+            }
+            for entry in movs
+        ))
+        progresso.linhas(inseridas)
+
+    # receita/gastos, rollup mensal e meses pendentes de CDI
+    for writer in writers.values():
+        await db.run_sync(lambda _sessao: writer.finalizar())
+    novas_movimentacoes = sum(w.inseridas for w in writers.values())
+
+    # --------------- avançar cursor de sync ---------------
+    await db.run_sync(nibo_sync_service.registrar_sync, sync_estado, itertools.chain(receipts, payments), completo)
+    await db.run_sync(invalidar_empresas, empresa_id)
 
-                novo_ativo.total = (novo_ativo.receita or Decimal("0")) + (novo_ativo.gastos or Decimal("0"))
-
-                db.add(novo_ativo)
-                db.flush()
-
-                novas_movimentacoes += 1
-            except Exception:
-                db.rollback()
-                continue
-
-        try:
-            db.commit()
-            db.refresh(novo_ativo)
-        except Exception:
-            try:
-                db.rollback()
-            except:
-                pass
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
 
     # --------------------------------------
-    # CÁLCULO DO CDI — UMA ÚNICA VEZ (OPÇÃO A)
+    # CÁLCULO DO CDI — UMA ÚNICA VEZ, SÓ O QUE MUDOU
     # --------------------------------------
+    # falha aqui não perde nada: os meses continuam marcados como pendentes
+    progresso.fase("cdi")
+    erro_cdi = None
     try:
-        recalcular_investimentos_cdi_empresa(db, empresa_id)
+        progresso.meses_cdi(await db.run_sync(recalcular_investimentos_cdi_empresa, empresa_id))
     except Exception as e:
+        await db.rollback()
+        erro_cdi = str(e)
         print("Erro ao recalcular investimentos CDI no refresh:", e)
 
     return {
@@ -351,4 +218,7 @@ async def refresh_ativos(db: Session, user_id: int, empresa_id: int):
         "empresa_id": empresa_id,
         "novos_ativos": novos_ativos,
         "novas_movimentacoes": novas_movimentacoes,
+        "sync_completo": completo,
+        "cdi_pendente": erro_cdi is not None,
+        "erro_cdi": erro_cdi,
     }
@@ -1,8 +1,186 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
 import httpx
 
+from app.core.config import settings
+
+
+# ============================================================
+# ERROS
+# ============================================================
+class NiboError(Exception):
+    """Falha ao falar com a Nibo. Sync que recebe isto deve abortar (rollback)."""
+
+    def __init__(self, mensagem: str, status_code: int | None = None, endpoint: str | None = None):
+        super().__init__(mensagem)
+        self.status_code = status_code
+        self.endpoint = endpoint
+
+
+class NiboAuthError(NiboError):
+    """401/403: token inválido ou sem permissão."""
+
+
+class NiboRateLimitError(NiboError):
+    """429 persistente, mesmo após as novas tentativas."""
+
+    def __init__(self, mensagem: str, retry_after: float | None = None, **kwargs):
+        super().__init__(mensagem, **kwargs)
+        self.retry_after = retry_after
+
+
+class NiboServerError(NiboError):
+    """5xx persistente."""
+
+
+class NiboConnectionError(NiboError):
+    """Timeout ou erro de rede."""
+
+
+class NiboRequestError(NiboError):
+    """Demais 4xx (requisição inválida) — não adianta repetir."""
+
+
+def _erro_http(resp: httpx.Response, endpoint: str) -> NiboError:
+    msg = f"Erro Nibo {resp.status_code} em {endpoint}: {resp.text[:500]}"
+    if resp.status_code in (401, 403):
+        return NiboAuthError(msg, status_code=resp.status_code, endpoint=endpoint)
+    if resp.status_code == 429:
+        return NiboRateLimitError(
+            msg, retry_after=_retry_after(resp), status_code=resp.status_code, endpoint=endpoint
+        )
+    if resp.status_code >= 500:
+        return NiboServerError(msg, status_code=resp.status_code, endpoint=endpoint)
+    return NiboRequestError(msg, status_code=resp.status_code, endpoint=endpoint)
+
+
+def _retry_after(resp: httpx.Response) -> float | None:
+    """Retry-After em segundos ou como data HTTP."""
+    valor = resp.headers.get("Retry-After")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(tentativa: int) -> float:
+    """Exponencial com full jitter."""
+    teto = min(settings.NIBO_RETRY_BACKOFF_MAX, settings.NIBO_RETRY_BACKOFF_BASE * (2 ** tentativa))
+    return random.uniform(0, teto)
+
+
+# ============================================================
+# LIMITE DE TAXA POR TOKEN (token bucket)
+# ============================================================
+class _TokenBucket:
+    """
+    `taxa` requisições/s com rajada de até `capacidade`. Compartilhado por
+    todas as importações/refreshes do mesmo token no processo.
+    """
+
+    def __init__(self, taxa: float, capacidade: int):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = float(capacidade)
+        self.atualizado = time.monotonic()
+        self.pausado_ate = 0.0
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                if agora < self.pausado_ate:
+                    await asyncio.sleep(self.pausado_ate - agora)
+                    continue
+
+                self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado) * self.taxa)
+                self.atualizado = agora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                await asyncio.sleep((1 - self.fichas) / self.taxa)
+
+    def pausar(self, segundos: float):
+        """429 recebido: segura todas as requisições do token pelo tempo pedido."""
+        self.pausado_ate = max(self.pausado_ate, time.monotonic() + segundos)
+
+
+_token_buckets: dict[str, _TokenBucket] = {}
+
+
+def _bucket_token(token: str) -> _TokenBucket:
+    bucket = _token_buckets.get(token)
+    if bucket is None:
+        bucket = _TokenBucket(settings.NIBO_RATE_LIMIT_PER_SECOND, settings.NIBO_RATE_LIMIT_BURST)
+        _token_buckets[token] = bucket
+    return bucket
+
+
+def _http2_disponivel() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
 class NiboService:
     BASE = "https://api.nibo.com.br/empresas/v1/"
 
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+
+    # ============================================================
+    # CLIENTE HTTP COMPARTILHADO (pool + keep-alive)
+    # ============================================================
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = settings.NIBO_HTTP2
+        if http2 and not _http2_disponivel():
+            print("⚠️ NIBO_HTTP2 ativo mas o pacote 'h2' não está instalado; usando HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.NIBO_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.NIBO_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.NIBO_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.NIBO_HTTP_TIMEOUT,
+                connect=settings.NIBO_HTTP_CONNECT_TIMEOUT,
+            ),
+            headers={"accept": "application/json"},
+        )
+
+    async def start(self):
+        """Abre o cliente do processo (chamado no startup da aplicação)."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+
+    async def close(self):
+        """Fecha o cliente e as conexões do pool (chamado no shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # fallback preguiçoso para scripts que não passam pelo startup do app
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
     # ============================================================
     # PERFIL
     # ============================================================
@@ -10,7 +188,7 @@ class NiboService:
         data = await self._get(token, "organizations")
 
         if not isinstance(data, dict) or "items" not in data or len(data["items"]) == 0:
-            raise Exception("Token Nibo inválido ou empresa inacessível.")
+            raise NiboAuthError("Token Nibo inválido ou empresa inacessível.", endpoint="organizations")
 
         empresa = data["items"][0]
 
@@ -26,69 +204,148 @@ class NiboService:
     async def get_costcenters(self, token: str):
         return await self._get(token, "costcenters")
 
-    async def get_receipts(self, token: str, skip: int = 0, top: int = 500):
-        return await self._get_paginated_order_date(token, "receipts", skip, top)
+    async def get_receipts(self, token: str, skip: int = 0, top: int = 500, filtro: str | None = None):
+        return await self._get_paginated_order_date(token, "receipts", skip, top, filtro)
 
-    async def get_payments(self, token: str, skip: int = 0, top: int = 500):
-        return await self._get_paginated_order_date(token, "payments", skip, top)
+    async def get_payments(self, token: str, skip: int = 0, top: int = 500, filtro: str | None = None):
+        return await self._get_paginated_order_date(token, "payments", skip, top, filtro)
 
     # ============================================================
     # MÉTODOS BASE
     # ============================================================
-    async def _get(self, token, endpoint):
+    async def _request(self, token: str, endpoint: str, params: dict | None = None):
+        """
+        GET com retry: 429, 5xx e erros de rede são repetidos com backoff
+        exponencial + jitter (respeitando Retry-After); os demais 4xx falham
+        na hora. Cada tentativa passa pelo token bucket do token.
+        """
         url = f"{self.BASE}{endpoint}"
-        headers = {"accept": "application/json", "apitoken": token}
+        headers = {"apitoken": token}
+        bucket = _bucket_token(token)
+        tentativas = max(1, settings.NIBO_RETRY_MAX_ATTEMPTS)
+
+        for tentativa in range(tentativas):
+            await bucket.adquirir()
+            try:
+                resp = await self.client.get(url, headers=headers, params=params)
+            except httpx.TransportError as e:
+                erro = NiboConnectionError(f"Erro de rede em {endpoint}: {e!r}", endpoint=endpoint)
+                espera = _backoff(tentativa)
+            else:
+                if resp.status_code < 400:
+                    return resp.json()
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=headers)
+                erro = _erro_http(resp, endpoint)
+                if not isinstance(erro, (NiboRateLimitError, NiboServerError)):
+                    raise erro
 
-        if resp.status_code >= 400:
-            raise Exception(resp.text)
+                espera = _retry_after(resp)
+                if espera is None:
+                    espera = _backoff(tentativa)
+                if isinstance(erro, NiboRateLimitError):
+                    # a pausa vale para todas as requisições do token
+                    bucket.pausar(espera)
 
-        return resp.json()
+            if tentativa + 1 < tentativas:
+                print(f"⚠️ Nibo {endpoint}: {erro} — nova tentativa em {espera:.1f}s")
+                if not isinstance(erro, NiboRateLimitError):
+                    await asyncio.sleep(espera)
 
-    async def _get_paginated_order_date(self, token: str, endpoint: str, skip: int, top: int):
-        url = f"{self.BASE}{endpoint}?$orderby=date&$skip={skip}&$top={top}"
-        headers = {"accept": "application/json", "apitoken": token}
+        raise erro
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=headers)
+    async def _get(self, token, endpoint):
+        return await self._request(token, endpoint)
 
-        if resp.status_code >= 400:
-            raise Exception(f"Erro Nibo GET paginado {endpoint}: {resp.text}")
+    async def _get_paginated_order_date(self, token: str, endpoint: str, skip: int, top: int, filtro: str | None = None):
+        params = {"$orderby": "date", "$skip": skip, "$top": top}
+        if filtro:
+            # OData, ex: "date ge 2024-01-01"
+            params["$filter"] = filtro
 
-        return resp.json()
+        return await self._request(token, endpoint, params)
 
 
 # ============================================================
 # FUNÇÃO DE PAGINAÇÃO RESILIENTE (para receipts/payments)
 # ============================================================
-async def fetch_all_pages(fetch_fn, token):
-    results = []
-    skip = 0
-    top = 500
+# Um semáforo por token limita as requisições simultâneas para a mesma
+# empresa, mesmo com import e refresh rodando ao mesmo tempo no processo.
+_token_semaphores: dict[str, asyncio.Semaphore] = {}
 
-    while True:
-        # fetch_fn aqui deve ser RECEIPTS ou PAYMENTS
-        page = await fetch_fn(token, skip=skip, top=top)
 
+def _semaforo_token(token: str) -> asyncio.Semaphore:
+    sem = _token_semaphores.get(token)
+    if sem is None:
+        sem = asyncio.Semaphore(settings.NIBO_MAX_CONCURRENCY_PER_TOKEN)
+        _token_semaphores[token] = sem
+    return sem
+
+
+async def iter_pages(
+    fetch_fn,
+    token,
+    top: int = 500,
+    concorrencia: int | None = None,
+    filtro: str | None = None,
+    transformar=None,
+):
+    """
+    Gera as páginas de um endpoint paginado por $skip, na ordem, à medida que
+    chegam.
+
+    Faz uma primeira requisição de sondagem; se a página vier cheia, busca as
+    próximas `concorrencia` janelas de $skip em paralelo (limitadas pelo
+    semáforo do token) até encontrar uma página incompleta.
+    `concorrencia=1` mantém o comportamento sequencial.
+    `filtro` é repassado como $filter OData (sync incremental).
+    `transformar(items) -> list` é aplicado a cada página assim que ela chega.
+    """
+    janela = max(1, concorrencia or settings.NIBO_PAGE_FANOUT)
+    sem = _semaforo_token(token)
+
+    async def buscar(skip: int):
+        # fetch_fn aqui deve ser RECEIPTS ou PAYMENTS
+        async with sem:
+            if filtro:
+                page = await fetch_fn(token, skip=skip, top=top, filtro=filtro)
+            else:
+                page = await fetch_fn(token, skip=skip, top=top)
         items = page.get("items") or page.get("value") or []
+        # o tamanho bruto decide se há próxima página
+        return len(items), (transformar(items) if transformar else items)
 
-        results.extend(items)
+    # sondagem
+    n, items = await buscar(0)
+    yield items
+    if n < top:
+        return
+
+    skip = top
+    while True:
+        skips = [skip + i * top for i in range(janela)]
+        pages = await asyncio.gather(*(buscar(s) for s in skips))
+
+        # mantém a ordem original ($orderby=date)
+        for n, items in pages:
+            yield items
+            if n < top:
+                return
 
-        if len(items) < top:
-            break
+        skip += janela * top
 
-        skip += top
 
+async def fetch_all_pages(fetch_fn, token, top: int = 500, concorrencia: int | None = None, filtro: str | None = None, transformar=None):
+    """Mesmo que `iter_pages`, juntando todas as páginas numa lista."""
+    results = []
+    async for items in iter_pages(fetch_fn, token, top, concorrencia, filtro, transformar):
+        results.extend(items)
     return results
 
+
 async def fetch_all(token, fetch_fn):
-    try:
-        data = await fetch_fn(token)
-        return data.get("items") or []
-    except Exception:
-        return []
+    # NiboError sobe: lista vazia aqui viraria uma importação vazia
+    data = await fetch_fn(token)
+    return data.get("items") or []
 
 
 nibo_service = NiboService()
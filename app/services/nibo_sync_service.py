@@ -0,0 +1,56 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import EmpresaNiboSync
+from app.services.nibo_entries import NiboEntry
+
+
+# ----------------------------------------
+# Helpers
+# ----------------------------------------
+def obter_estado(db: Session, empresa_id: int) -> EmpresaNiboSync:
+    estado = db.get(EmpresaNiboSync, empresa_id)
+    if estado is None:
+        estado = EmpresaNiboSync(empresa_id=empresa_id)
+        db.add(estado)
+    return estado
+
+
+def precisa_sync_completo(estado: EmpresaNiboSync) -> bool:
+    """Sem cursor ou com a última reconciliação completa vencida → sync completo."""
+    if estado.cursor_data is None or estado.ultimo_sync_completo_em is None:
+        return True
+    limite = timedelta(hours=settings.NIBO_FULL_SYNC_INTERVAL_HOURS)
+    return datetime.now(timezone.utc) - estado.ultimo_sync_completo_em >= limite
+
+
+def filtro_incremental(estado: EmpresaNiboSync) -> str:
+    """
+    $filter OData para buscar só lançamentos a partir do cursor.
+    Recua NIBO_SYNC_LOOKBACK_DAYS para pegar lançamentos retroativos;
+    os já gravados são descartados pelo dedupe de nibo_transaction_id.
+    """
+    desde = estado.cursor_data - timedelta(days=settings.NIBO_SYNC_LOOKBACK_DAYS)
+    return f"date ge {desde.isoformat()}"
+
+
+def registrar_sync(db: Session, estado: EmpresaNiboSync, entries: Iterable[NiboEntry], completo: bool):
+    """
+    Avança o high-water mark com os lançamentos recebidos. Não faz commit.
+    Lançamentos agendados (data futura) não levam o cursor além de hoje:
+    senão o próximo sync incremental pularia o que for lançado até lá.
+    """
+    hoje = date.today()
+    for entry in entries:
+        data = min(entry.data, hoje)
+        if estado.cursor_data is None or data > estado.cursor_data:
+            estado.cursor_data = data
+            estado.cursor_entry_id = entry.id
+
+    agora = datetime.now(timezone.utc)
+    estado.ultimo_sync_em = agora
+    if completo:
+        estado.ultimo_sync_completo_em = agora
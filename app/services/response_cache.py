@@ -0,0 +1,216 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Ativo
+from app.services.cache_versao_service import ler_versoes, ler_versao_prefixo, incrementar_versao
+
+
+# Chaves de versão (tabela cache_versoes) usadas pelas respostas em cache
+CHAVE_CDI = "cdi"                # tabela de CDI (mesma chave do cdi_cache)
+# listas globais: soma das versões de todas as empresas, lida sem contenção
+# (escritas só incrementam a chave da própria empresa)
+CHAVE_TODAS_EMPRESAS = "empresa:*"
+
+
+def chave_empresa(empresa_id: int) -> str:
+    return f"empresa:{empresa_id}"
+
+
+def _ler_versoes(db: Session, chaves: Iterable[str]) -> Dict[str, int]:
+    """Como `ler_versoes`, com chaves terminadas em "*" somando o prefixo."""
+    chaves = set(chaves)
+    prefixos = {c for c in chaves if c.endswith("*")}
+    versoes = ler_versoes(db, chaves - prefixos)
+    for prefixo in prefixos:
+        versoes[prefixo] = ler_versao_prefixo(db, prefixo[:-1])
+    return versoes
+
+
+# ----------------------------------------
+# Backends
+# ----------------------------------------
+class MemoriaBackend:
+    """LRU com TTL, por processo."""
+
+    def __init__(self, max_itens: int, ttl: float):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave: str, valor: bytes):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+class RedisBackend:
+    """Cache compartilhado entre processos. Erros do Redis viram miss (nunca derrubam a rota)."""
+
+    def __init__(self, cliente, ttl: float, prefixo: str = "resp:"):
+        self.cliente = cliente
+        self.ttl = max(1, int(ttl))
+        self.prefixo = prefixo
+
+    def get(self, chave: str) -> Optional[bytes]:
+        try:
+            return self.cliente.get(self.prefixo + chave)
+        except Exception as e:
+            print(f"⚠️ Redis indisponível (get): {e}")
+            return None
+
+    def set(self, chave: str, valor: bytes):
+        try:
+            self.cliente.setex(self.prefixo + chave, self.ttl, valor)
+        except Exception as e:
+            print(f"⚠️ Redis indisponível (set): {e}")
+
+    def limpar(self):
+        pass
+
+
+def criar_backend():
+    memoria = MemoriaBackend(settings.RESPONSE_CACHE_MAX_ITENS, settings.RESPONSE_CACHE_TTL_SECONDS)
+    if settings.RESPONSE_CACHE_BACKEND != "redis":
+        return memoria
+
+    if not settings.REDIS_URL:
+        print("⚠️ RESPONSE_CACHE_BACKEND=redis sem REDIS_URL; usando cache em memória")
+        return memoria
+    try:
+        import redis  # opcional
+    except ImportError:
+        print("⚠️ Pacote 'redis' não instalado; usando cache em memória")
+        return memoria
+    return RedisBackend(redis.Redis.from_url(settings.REDIS_URL), settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+# ----------------------------------------
+# Cache de respostas
+# ----------------------------------------
+class ResponseCache:
+    """
+    Cache de respostas JSON das rotas de leitura pesadas.
+
+    A chave junta rota, query string, escopo (usuário) e as versões atuais
+    das chaves de invalidação em cache_versoes. Escritas só incrementam a
+    versão (`invalidar_*`, na transação do chamador): as entradas antigas
+    deixam de ser alcançadas e saem por LRU/TTL. Isso vale entre processos,
+    mesmo com o backend em memória.
+
+    Responde com ETag (hash do corpo) e 304 para If-None-Match igual.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _chave(self, request: Request, escopo: str, versoes: dict) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        versao = ",".join(f"{k}={v}" for k, v in sorted(versoes.items()))
+        bruta = f"{request.url.path}?{query}|{escopo}|{versao}"
+        return hashlib.sha1(bruta.encode()).hexdigest()
+
+    def responder(
+        self,
+        request: Request,
+        db: Session,
+        gerar: Callable[[], object],
+        chaves: Iterable[str],
+        escopo: str = "",
+        modelo: Any = None,
+    ) -> Response:
+        """
+        Devolve a resposta em cache (ou 304), ou chama `gerar()` e guarda o JSON.
+        A Response pronta não passa pelo response_model da rota: rotas que têm
+        um passam o mesmo tipo em `modelo`, que valida e serializa o que
+        `gerar()` devolve (objetos ORM inclusive) antes de ir para o cache.
+        """
+        if not settings.RESPONSE_CACHE_ENABLED:
+            corpo = self._serializar(gerar(), modelo)
+            return self._resposta(request, corpo, "BYPASS")
+
+        chave = self._chave(request, escopo, _ler_versoes(db, chaves))
+        corpo = self.backend.get(chave)
+        status = "HIT"
+        if corpo is None:
+            corpo = self._serializar(gerar(), modelo)
+            self.backend.set(chave, corpo)
+            status = "MISS"
+        return self._resposta(request, corpo, status)
+
+    @staticmethod
+    def _serializar(valor, modelo: Any = None) -> bytes:
+        if modelo is not None:
+            adapter = _adapter(modelo)
+            return adapter.dump_json(adapter.validate_python(valor, from_attributes=True), by_alias=True)
+        return json.dumps(jsonable_encoder(valor), separators=(",", ":"), ensure_ascii=False).encode()
+
+    @staticmethod
+    def _resposta(request: Request, corpo: bytes, status: str) -> Response:
+        etag = f'"{hashlib.sha1(corpo).hexdigest()}"'
+        headers = {
+            "ETag": etag,
+            # o navegador sempre revalida; com ETag igual recebe 304 sem corpo
+            "Cache-Control": "private, no-cache",
+            "X-Cache": status,
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=corpo, media_type="application/json", headers=headers)
+
+
+_adapters: Dict[Any, TypeAdapter] = {}
+
+
+def _adapter(modelo: Any) -> TypeAdapter:
+    # montar o TypeAdapter compila o schema: um por modelo, reaproveitado
+    adapter = _adapters.get(modelo)
+    if adapter is None:
+        adapter = _adapters[modelo] = TypeAdapter(modelo)
+    return adapter
+
+
+response_cache = ResponseCache(criar_backend())
+
+
+# ----------------------------------------
+# Invalidação (chamar antes do commit da escrita)
+# ----------------------------------------
+def invalidar_empresas(db: Session, *empresa_ids: Optional[int]):
+    # só as chaves das empresas: sem uma linha global que toda escrita trave
+    ids = {e for e in empresa_ids if e is not None}
+    incrementar_versao(db, *(chave_empresa(e) for e in sorted(ids)))
+
+
+def invalidar_ativo(db: Session, ativo_id: int):
+    invalidar_empresas(db, db.scalar(select(Ativo.empresa_id).where(Ativo.id == ativo_id)))
@@ -0,0 +1,100 @@
+# app/verificar_indices.py
+"""
+Confere, via EXPLAIN, se as consultas dos principais endpoints usam índice.
+
+    python -m app.verificar_indices
+
+Roda com enable_seqscan = off: em tabelas pequenas (dev/CI) o planner
+prefere seq scan mesmo com índice bom; desligando-o, o plano mostra se
+existe um índice que atende o predicado/ordenação. Sai com código 1 se
+alguma consulta não usar nenhum dos índices esperados.
+"""
+import json
+import sys
+from typing import Iterator, NamedTuple, Set
+
+from sqlalchemy import text
+
+from app.migrations import criar_engine
+
+
+class Checagem(NamedTuple):
+    nome: str
+    sql: str
+    indices: Set[str]   # basta um deles aparecer no plano
+
+
+CHECAGENS = [
+    Checagem(
+        "movimentações do ativo (comparativo / real / CDI)",
+        "SELECT data_movimentacao, valor FROM movimentacoes WHERE ativo_id = 1 ORDER BY data_movimentacao",
+        {"ix_movimentacoes_ativo_data"},
+    ),
+    Checagem(
+        "dedupe do import (MovimentacaoBulkWriter)",
+        "SELECT nibo_transaction_id, id FROM movimentacoes "
+        "WHERE usuario_id = 1 AND nibo_transaction_id IS NOT NULL",
+        {"ix_movimentacoes_usuario_nibo"},
+    ),
+    Checagem(
+        "GET /movimentacoes/ (keyset)",
+        "SELECT m.* FROM movimentacoes m JOIN ativos a ON a.id = m.ativo_id "
+        "WHERE a.empresa_id IN (1, 2) AND (m.data_movimentacao, m.id) < ('2100-01-01', 1000000) "
+        "ORDER BY m.data_movimentacao DESC, m.id DESC LIMIT 101",
+        {"ix_movimentacoes_data_id", "ix_movimentacoes_ativo_data"},
+    ),
+    Checagem(
+        "vínculos movimentação–ativo do usuário",
+        "SELECT ma.movimentacao_id, ma.ativo_id FROM movimentacao_ativo ma "
+        "JOIN movimentacoes m ON m.id = ma.movimentacao_id WHERE m.usuario_id = 1",
+        {"ix_movimentacao_ativo_mov_ativo"},
+    ),
+    Checagem(
+        "GET /ativos/ (ativos das empresas)",
+        "SELECT * FROM ativos WHERE empresa_id IN (1, 2)",
+        {"ix_ativos_empresa"},
+    ),
+    Checagem(
+        "empresas do usuário (principal)",
+        "SELECT empresa_id FROM usuarios_empresas WHERE user_id = 1",
+        {"uix_user_empresa"},
+    ),
+    Checagem(
+        "usuários da empresa",
+        "SELECT user_id FROM usuarios_empresas WHERE empresa_id = 1",
+        {"ix_usuarios_empresas_empresa"},
+    ),
+]
+
+
+def _indices_do_plano(no: dict) -> Iterator[str]:
+    if "Index Name" in no:
+        yield no["Index Name"]
+    for filho in no.get("Plans", []):
+        yield from _indices_do_plano(filho)
+
+
+def main() -> int:
+    engine = criar_engine()
+    falhas = 0
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SET enable_seqscan = off"))
+            for checagem in CHECAGENS:
+                plano = conn.scalar(text(f"EXPLAIN (FORMAT JSON) {checagem.sql}"))
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+                usados = set(_indices_do_plano(plano[0]["Plan"]))
+                if usados & checagem.indices:
+                    print(f"✅ {checagem.nome}: {', '.join(sorted(usados))}")
+                else:
+                    falhas += 1
+                    print(f"❌ {checagem.nome}: esperado {', '.join(sorted(checagem.indices))}; "
+                          f"usados: {', '.join(sorted(usados)) or 'nenhum'}")
+    finally:
+        engine.dispose()
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
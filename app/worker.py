@@ -0,0 +1,135 @@
+# app/worker.py
+"""
+Worker da fila de jobs da Nibo (importação / refresh).
+
+    python -m app.worker
+
+Rode quantos processos quiser: cada job é reivindicado com
+SELECT ... FOR UPDATE SKIP LOCKED, então dois workers nunca pegam o mesmo.
+"""
+import asyncio
+import signal
+
+from app.core.config import settings
+from app import database
+from app.migrations import verificar as verificar_schema
+from app.database import SessionLocal, AsyncSessionLocal
+from app.models import Empresa, NiboJob
+from app.services import job_service
+from app.services.nibo_service import nibo_service
+from app.services.nibo_import_service import nibo_import_service
+from app.services.nibo_refresh_service import refresh_ativos
+
+
+async def executar(db, job: NiboJob, progresso: job_service.ProgressoJob) -> dict:
+    parametros = job.parametros or {}
+
+    if job.tipo == job_service.TIPO_IMPORTAR:
+        empresa = await db.get(Empresa, job.empresa_id)
+        if empresa is None or not empresa.nibo_api_token:
+            raise ValueError("Empresa não encontrada ou sem token Nibo")
+        return await nibo_import_service.importar(
+            db=db,
+            token=empresa.nibo_api_token,
+            usuario_id=job.usuario_id,
+            empresa_data={
+                "nome": empresa.nome,
+                "cnpj": empresa.cnpj,
+                "companyId": empresa.nibo_company_id,
+            },
+            progresso=progresso,
+        )
+
+    if job.tipo == job_service.TIPO_REFRESH:
+        return await refresh_ativos(
+            db,
+            job.usuario_id,
+            job.empresa_id,
+            completo=bool(parametros.get("completo")),
+            progresso=progresso,
+        )
+
+    raise ValueError(f"Tipo de job desconhecido: {job.tipo}")
+
+
+def _na_fila(fn, *args):
+    """Operação da fila com sessão própria, fora do loop (asyncio.to_thread)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def rodar_job(job: NiboJob):
+    """Executa um job já marcado como executando e registra o desfecho."""
+    print(f"▶️ Job {job.id} ({job.tipo}) empresa={job.empresa_id} tentativa={job.tentativas}")
+    progresso = job_service.ProgressoJob(job)
+    # sessão async para o sync: o loop segue livre para os outros jobs
+    # (o scheduler roda vários refreshes no mesmo processo) e para o heartbeat
+    async with AsyncSessionLocal() as db:
+        execucao = asyncio.create_task(executar(db, job, progresso))
+        heartbeat = asyncio.create_task(progresso.manter_vivo(execucao))
+        try:
+            resultado = await execucao
+        except asyncio.CancelledError:
+            if not progresso.perdido:
+                raise
+            await db.rollback()
+            print(f"⚠️ Job {job.id} foi retomado por outro worker; execução interrompida")
+            return
+        except Exception as e:
+            await db.rollback()
+            print(f"❌ Job {job.id} falhou: {e}")
+            await asyncio.to_thread(_na_fila, job_service.falhar, job, e)
+            return
+        finally:
+            heartbeat.cancel()
+
+    await progresso.gravar()  # contadores finais
+    if await asyncio.to_thread(_na_fila, job_service.concluir, job, resultado):
+        print(f"✅ Job {job.id} concluído em {job.duracao_ms} ms")
+    else:
+        print(f"⚠️ Job {job.id} foi retomado por outro worker; resultado descartado")
+
+
+async def processar_proximo() -> bool:
+    """Executa um job da fila. Retorna False se a fila estava vazia."""
+    job = await asyncio.to_thread(_na_fila, job_service.reivindicar)
+    if job is None:
+        return False
+    await rodar_job(job)
+    return True
+
+
+async def main():
+    # pool próprio: um import grande não disputa conexões com a API
+    database.usar_pool_worker()
+    verificar_schema(database.engine)
+
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            # termina o job atual antes de sair
+            loop.add_signal_handler(sig, parar.set)
+        except NotImplementedError:
+            pass
+
+    await nibo_service.start()
+    print("👷 Worker Nibo iniciado")
+    try:
+        while not parar.is_set():
+            if not await processar_proximo():
+                try:
+                    await asyncio.wait_for(parar.wait(), timeout=settings.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        await nibo_service.close()
+        await database.async_engine.dispose()
+        print("👷 Worker Nibo encerrado")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
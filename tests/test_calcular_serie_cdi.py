@@ -0,0 +1,48 @@
+# tests/test_calcular_serie_cdi.py
+import pytest
+
+from app.services.investimento_cdi_service import calcular_serie_cdi
+
+
+TAXAS = [0.01, 0.02, 0.005]
+
+
+def test_simples_rendimento_sobre_valor_base():
+    rendimentos, acumulados = calcular_serie_cdi(1000.0, TAXAS, "simples")
+
+    assert rendimentos == pytest.approx([10.0, 20.0, 5.0])
+    assert acumulados == pytest.approx([10.0, 30.0, 35.0])
+
+
+def test_simples_continua_serie_gravada():
+    _, acumulados = calcular_serie_cdi(1000.0, TAXAS, "simples", acumulado_inicial=100.0)
+
+    assert acumulados == pytest.approx([110.0, 130.0, 135.0])
+
+
+def test_composto_juros_sobre_juros():
+    rendimentos, acumulados = calcular_serie_cdi(1000.0, TAXAS, "composto")
+
+    saldos = [1000.0 * 1.01, 1000.0 * 1.01 * 1.02, 1000.0 * 1.01 * 1.02 * 1.005]
+    assert acumulados == pytest.approx([s - 1000.0 for s in saldos])
+    assert rendimentos == pytest.approx([10.0, 1010.0 * 0.02, 1030.2 * 0.005])
+    assert sum(rendimentos) == pytest.approx(acumulados[-1])
+
+
+def test_composto_continuar_equivale_a_serie_inteira():
+    _, inteira = calcular_serie_cdi(1000.0, TAXAS, "composto")
+    _, inicio = calcular_serie_cdi(1000.0, TAXAS[:1], "composto")
+    rendimentos, resto = calcular_serie_cdi(1000.0, TAXAS[1:], "composto", acumulado_inicial=inicio[-1])
+
+    assert inicio + resto == pytest.approx(inteira)
+    assert rendimentos[0] == pytest.approx(inteira[1] - inteira[0])
+
+
+@pytest.mark.parametrize("modo", ["simples", "composto"])
+def test_sem_taxas(modo):
+    assert calcular_serie_cdi(1000.0, [], modo) == ([], [])
+
+
+def test_modo_invalido():
+    with pytest.raises(ValueError):
+        calcular_serie_cdi(1000.0, TAXAS, "diario")
@@ -0,0 +1,38 @@
+# tests/test_cursor_movimentacoes.py
+import base64
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers.movimentacoes_router import _decode_cursor, _encode_cursor
+
+
+def _cursor(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def test_ida_e_volta():
+    mov = SimpleNamespace(data_movimentacao=date(2024, 2, 29), id=12345)
+
+    assert _decode_cursor(_encode_cursor(mov)) == (date(2024, 2, 29), 12345)
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "não é base64!",
+        _cursor(b"2024-01-01"),
+        _cursor(b"2024-13-01|1"),
+        _cursor(b"2024-01-01|abc"),
+        _cursor(b"2024-01-01|1|2"),
+        _cursor(b"\xff\xfe|1"),
+    ],
+)
+def test_cursor_invalido_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor)
+
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Cursor inválido"
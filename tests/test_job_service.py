@@ -0,0 +1,83 @@
+# tests/test_job_service.py
+"""
+Claim da fila sobre um SQLite em memória só com a tabela nibo_jobs (o
+FOR UPDATE SKIP LOCKED é ignorado fora do Postgres; a lógica do claim não).
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import NiboJob
+from app.services import job_service
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    NiboJob.__table__.create(engine)
+    with Session(engine, expire_on_commit=False) as sessao:
+        yield sessao
+    engine.dispose()
+
+
+def _job(db, empresa_id: int, tentativas: int, sem_heartbeat: bool) -> NiboJob:
+    agora = datetime.now(timezone.utc)
+    atraso = settings.JOB_STALE_SECONDS + 60 if sem_heartbeat else 0
+    job = NiboJob(
+        tipo=job_service.TIPO_REFRESH,
+        status=job_service.EXECUTANDO,
+        usuario_id=1,
+        empresa_id=empresa_id,
+        tentativas=tentativas,
+        max_tentativas=3,
+        disponivel_em=agora - timedelta(hours=1),
+        atualizado_em=agora - timedelta(seconds=atraso),
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_retoma_job_sem_heartbeat_com_tentativas(db):
+    job = _job(db, empresa_id=1, tentativas=1, sem_heartbeat=True)
+
+    reivindicado = job_service.reivindicar(db)
+
+    assert reivindicado.id == job.id
+    assert reivindicado.tentativas == 2
+    assert reivindicado.status == job_service.EXECUTANDO
+
+
+def test_job_sem_heartbeat_e_sem_tentativas_vira_erro(db):
+    job = _job(db, empresa_id=1, tentativas=3, sem_heartbeat=True)
+
+    assert job_service.reivindicar(db) is None
+
+    db.expire_all()
+    encerrado = db.get(NiboJob, job.id)
+    assert encerrado.status == job_service.ERRO
+    assert encerrado.tentativas == 3
+    assert encerrado.concluido_em is not None
+    assert "Worker perdido" in encerrado.erro
+
+
+def test_esgotado_nao_impede_claim_de_outro_job(db):
+    esgotado = _job(db, empresa_id=1, tentativas=3, sem_heartbeat=True)
+    retomavel = _job(db, empresa_id=2, tentativas=2, sem_heartbeat=True)
+
+    assert job_service.reivindicar(db).id == retomavel.id
+
+    db.expire_all()
+    assert db.get(NiboJob, esgotado.id).status == job_service.ERRO
+
+
+def test_job_com_heartbeat_recente_nao_e_retomado(db):
+    job = _job(db, empresa_id=1, tentativas=1, sem_heartbeat=False)
+
+    assert job_service.reivindicar(db) is None
+
+    db.expire_all()
+    assert db.get(NiboJob, job.id).status == job_service.EXECUTANDO
@@ -0,0 +1,72 @@
+# tests/test_nibo_entries.py
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app.services.nibo_entries import PAGAMENTO, RECEBIMENTO, parse_entry
+
+
+def _item(**extra):
+    item = {
+        "entryId": "abc-1",
+        "isTransfer": False,
+        "date": "2024-03-15T00:00:00Z",
+        "value": "1234.56",
+        "costCenters": [{"costCenterId": "cc-9"}],
+        "description": "Aluguel",
+    }
+    item.update(extra)
+    return item
+
+
+def test_recebimento_positivo():
+    entry = parse_entry(_item(), RECEBIMENTO)
+
+    assert entry.id == "abc-1"
+    assert entry.data == date(2024, 3, 15)
+    assert entry.centavos == 123456
+    assert entry.valor == Decimal("1234.56")
+    assert entry.cc_key == "cc-9"
+    assert entry.descricao == "Aluguel"
+
+
+def test_pagamento_negativo():
+    entry = parse_entry(_item(value=10.005), PAGAMENTO)
+
+    assert entry.centavos == -1001
+    assert entry.valor == Decimal("-10.01")
+    assert entry.tipo == PAGAMENTO
+
+
+def test_valor_com_virgula():
+    assert parse_entry(_item(value="99,90"), RECEBIMENTO).centavos == 9990
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [
+        {"isTransfer": True},
+        {"isTransfer": None},
+        {"isTransfered": True},
+        {"is_transfer": True},
+    ],
+)
+def test_transferencia_ignorada(extra):
+    assert parse_entry(_item(**extra), RECEBIMENTO) is None
+
+
+@pytest.mark.parametrize("extra", [{"date": None}, {"date": "ontem"}])
+def test_sem_data_ignorado(extra):
+    assert parse_entry(_item(**extra), RECEBIMENTO) is None
+
+
+def test_data_alternativa():
+    entry = parse_entry(_item(date=None, dueDate="2024-04-01"), PAGAMENTO)
+
+    assert entry.data == date(2024, 4, 1)
+
+
+def test_sem_id_ignorado():
+    assert parse_entry(_item(entryId=None), RECEBIMENTO) is None
+    assert parse_entry("não é dict", RECEBIMENTO) is None
@@ -0,0 +1,146 @@
+# tests/test_rate_limit.py
+import pytest
+
+from app.core import rate_limit
+from app.core.rate_limit import JanelaDeslizante, MemoriaBackend, redes_confiaveis, resolver_ip
+
+
+JANELA = 100
+
+
+class Relogio:
+    def __init__(self, agora: float):
+        self.agora = agora
+
+    def __call__(self) -> float:
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio(10 * JANELA)   # início de uma janela fixa
+    monkeypatch.setattr(rate_limit.time, "time", relogio)
+    return relogio
+
+
+def _limite(backend=None, limite=5):
+    return JanelaDeslizante(backend or MemoriaBackend(100), "t:", limite, JANELA)
+
+
+def test_bloqueia_ao_atingir_limite(relogio):
+    limite = _limite()
+    for _ in range(4):
+        limite.registrar("a")
+    assert not limite.excedido("a")
+
+    limite.registrar("a")
+    assert limite.excedido("a")
+    assert not limite.excedido("b")
+
+
+def test_janela_anterior_ponderada(relogio):
+    backend = MemoriaBackend(100)
+    limite = _limite(backend)
+    for _ in range(4):
+        limite.registrar("a")
+
+    # 25% da janela seguinte: 75% da anterior ainda conta
+    relogio.agora += JANELA * 1.25
+    assert backend.contar("t:a", JANELA) == pytest.approx(3.0)
+
+    limite.registrar("a")
+    assert backend.contar("t:a", JANELA) == pytest.approx(4.0)
+
+    # fim da janela: a anterior quase não pesa mais
+    relogio.agora = 11 * JANELA + JANELA * 0.99
+    assert backend.contar("t:a", JANELA) == pytest.approx(1.04)
+
+
+def test_expira_apos_duas_janelas(relogio):
+    backend = MemoriaBackend(100)
+    limite = _limite(backend)
+    for _ in range(5):
+        limite.registrar("a")
+
+    relogio.agora += 2 * JANELA
+    assert not limite.excedido("a")
+    assert "t:a" not in backend._itens
+    assert "t:a" not in backend._bloqueadas
+
+
+def test_limpar(relogio):
+    limite = _limite()
+    for _ in range(5):
+        limite.registrar("a")
+
+    limite.limpar("a")
+    assert not limite.excedido("a")
+
+
+def test_lru_respeita_max_chaves(relogio):
+    backend = MemoriaBackend(3)
+    for chave in "abcd":
+        backend.incrementar(chave, JANELA, 5)
+
+    assert list(backend._itens) == ["b", "c", "d"]
+
+    # uso recente move para o fim: "b" deixa de ser a mais antiga
+    backend.incrementar("b", JANELA, 5)
+    backend.incrementar("e", JANELA, 5)
+    assert list(backend._itens) == ["d", "b", "e"]
+
+
+def test_bloqueada_sobrevive_a_enxurrada_de_chaves(relogio):
+    backend = MemoriaBackend(10)
+    limite = _limite(backend)
+    for _ in range(5):
+        limite.registrar("vitima")
+
+    # falhas com emails inexistentes tentando despejar a vítima do LRU
+    for i in range(1000):
+        limite.registrar(f"lixo{i}")
+
+    assert limite.excedido("vitima")
+    assert len(backend._itens) == 10
+
+
+def test_abaixo_do_limite_continua_no_lru(relogio):
+    backend = MemoriaBackend(10)
+    limite = _limite(backend)
+    for _ in range(4):
+        limite.registrar("a")
+    for i in range(10):
+        limite.registrar(f"lixo{i}")
+
+    assert "t:a" not in backend._itens
+    assert not limite.excedido("a")
+
+
+def test_expiradas_saem_antes_do_lru(relogio):
+    backend = MemoriaBackend(10)
+    backend.incrementar("velha", JANELA, 5)
+    relogio.agora += 2 * JANELA
+    backend.incrementar("nova", JANELA, 5)
+
+    assert list(backend._itens) == ["nova"]
+
+
+# ----------------------------------------
+# IP do cliente
+# ----------------------------------------
+PROXIES = redes_confiaveis("10.0.0.0/8, 127.0.0.1")
+
+
+def test_ip_sem_proxy_ignora_cabecalho():
+    assert resolver_ip("203.0.113.9", "1.2.3.4", PROXIES) == "203.0.113.9"
+    assert resolver_ip("203.0.113.9", "1.2.3.4", []) == "203.0.113.9"
+
+
+def test_ip_via_proxies_confiaveis():
+    # cliente forjou 1.2.3.4; o proxy de borda anexou o IP real
+    assert resolver_ip("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.1", PROXIES) == "198.51.100.7"
+
+
+def test_ip_proxy_sem_cabecalho():
+    assert resolver_ip("127.0.0.1", None, PROXIES) == "127.0.0.1"
+    assert resolver_ip(None, None, PROXIES) == "desconhecido"